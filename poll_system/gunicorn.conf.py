@@ -0,0 +1,28 @@
+"""
+Gunicorn settings for production.
+
+By default this serves poll_system.wsgi with sync workers, the faster choice
+when the database and Redis answer quickly (see "Deployment" in the README).
+GUNICORN_ASGI=true serves poll_system.asgi with uvicorn workers instead: each
+worker process serves many requests at once, so waiting on the database or
+Redis no longer ties a worker up, and live stats streams are held open cheaply.
+"""
+import multiprocessing
+from decouple import config as env  # "config" is a gunicorn setting
+
+
+asgi = env('GUNICORN_ASGI', default=False, cast=bool)
+
+wsgi_app = 'poll_system.asgi:application' if asgi else 'poll_system.wsgi:application'
+bind = env('GUNICORN_BIND', default='0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker' if asgi else 'sync'
+workers = env('GUNICORN_WORKERS', default=multiprocessing.cpu_count() + 1, cast=int)
+# Restarts workers that stop responding; with async workers this does not cap
+# request time, so SSE streams stay open
+timeout = env('GUNICORN_TIMEOUT', default=60, cast=int)
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth
+max_requests = env('GUNICORN_MAX_REQUESTS', default=10000, cast=int)
+max_requests_jitter = 1000
+accesslog = '-'
@@ -4,6 +4,7 @@ from celery import Celery
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'poll_system.settings')
 
 
-app = Celery('poll_system')
+# Tasks read from the primary database, see polls/routers.py
+app = Celery('poll_system', task_cls='polls.routers:PrimaryTask')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
\ No newline at end of file
@@ -1,7 +1,7 @@
 from pathlib import Path
 from datetime import timedelta
 import dj_database_url
-from decouple import config
+from decouple import config, Csv
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,10 +39,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Compresses what every middleware below produces
+    'polls.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Keeps recent writers on the primary database
+    'polls.routers.PrimaryStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,6 +70,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'poll_system.wsgi.application'
+ASGI_APPLICATION = 'poll_system.asgi.application'
+
+# Serve poll detail, stats and vote from the async views (polls/async_views.py).
+# Only worth it under an ASGI server; under WSGI every request would start an
+# event loop of its own.
+ASYNC_HOT_PATHS = config('ASYNC_HOT_PATHS', default=False, cast=bool)
 
 
 # Database
@@ -78,6 +88,23 @@ DATABASES = {
     )
 }
 
+# Read replicas, as comma separated database URLs. Safe reads are spread over
+# them and everything else stays on 'default' (see polls/routers.py). To try it
+# locally with SQLite, point a replica at a copy of the database file: the copy
+# behaves like a replica that stopped replicating.
+DATABASE_REPLICAS = []
+for number, url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{number}'] = {
+        **dj_database_url.parse(url, conn_max_age=600),
+        # Tests run against the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['polls.routers.PrimaryReplicaRouter']
+# How long a user's reads stay on the primary after they vote or edit
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -129,9 +156,51 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'polls.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'polls.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# JSON is encoded and decoded with orjson when it is installed (see polls/renderers.py)
+FAST_JSON_ENABLED = config('FAST_JSON_ENABLED', default=True, cast=bool)
+
+# Response compression (see polls/middleware.py). Bodies smaller than this are
+# sent as they are; the framing overhead outweighs the savings.
+RESPONSE_COMPRESSION_MIN_SIZE = config('RESPONSE_COMPRESSION_MIN_SIZE', default=1024, cast=int)  # bytes
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 5
+
+# Cursor paginated endpoints (see polls/pagination.py). The max caps ?page_size=
+# and the GraphQL 'first' argument.
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=20, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=100, cast=int)
+# Search results are offset paginated; deeper pages are not served
+SEARCH_MAX_OFFSET = config('SEARCH_MAX_OFFSET', default=1000, cast=int)
+
+# GraphQL (see polls/graphql_documents.py). Parsed queries kept per process,
+# how long persisted queries are remembered, and the cost budget of a query:
+# one per field, with fields below a list counted once per item, where a list
+# is 'first' items long or GRAPHQL_LIST_SIZE_ESTIMATE when it takes no 'first'.
+GRAPHQL_DOCUMENT_CACHE_SIZE = config('GRAPHQL_DOCUMENT_CACHE_SIZE', default=500, cast=int)
+GRAPHQL_PERSISTED_QUERY_TIMEOUT = 60 * 60 * 24 * 30  # 30 days
+GRAPHQL_MAX_QUERY_COST = config('GRAPHQL_MAX_QUERY_COST', default=10000, cast=int)
+GRAPHQL_LIST_SIZE_ESTIMATE = config('GRAPHQL_LIST_SIZE_ESTIMATE', default=10, cast=int)
+
+# Poll imports (see polls/imports.py): polls validated and inserted per
+# transaction, and how many invalid records are reported back
+POLL_IMPORT_CHUNK_SIZE = config('POLL_IMPORT_CHUNK_SIZE', default=500, cast=int)
+POLL_IMPORT_MAX_ERRORS = 100
+
+# Vote exports (see polls/exports.py): rows per database fetch and per chunk written
+VOTE_EXPORT_CHUNK_SIZE = config('VOTE_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
 
 #JWT authentication expiration time 
 SIMPLE_JWT = {
@@ -141,14 +210,108 @@ SIMPLE_JWT = {
 }
 
 
+REDIS_URL = config('REDIS_URL')
+
+
 # Celery configration
-CELERY_BROKER_URL = config('REDIS_URL')
-CELERY_RESULT_BACKEND = config('REDIS_URL')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
 
+# Vote ingestion
+# 'direct' queues one process_vote task per vote. 'batched' appends votes to a
+# Redis buffer that flush_vote_buffer drains with one transaction per batch.
+VOTE_INGESTION_MODE = config('VOTE_INGESTION_MODE', default='direct')
+VOTE_BATCH_SIZE = config('VOTE_BATCH_SIZE', default=500, cast=int)
+VOTE_FLUSH_INTERVAL = config('VOTE_FLUSH_INTERVAL', default=1.0, cast=float)  # seconds
+VOTE_FLUSH_LOCK_TIMEOUT = config('VOTE_FLUSH_LOCK_TIMEOUT', default=60, cast=int)  # seconds
+# Failed flushes of a batch before its votes are recorded one at a time
+VOTE_BATCH_MAX_ATTEMPTS = config('VOTE_BATCH_MAX_ATTEMPTS', default=3, cast=int)
+
+# Number of counter rows per choice that vote increments are spread across (1 disables sharding)
+VOTE_COUNTER_SHARDS = config('VOTE_COUNTER_SHARDS', default=8, cast=int)
+VOTE_SHARD_COMPACTION_INTERVAL = config('VOTE_SHARD_COMPACTION_INTERVAL', default=60, cast=int)  # seconds
+VOTE_TALLY_RECONCILE_INTERVAL = config('VOTE_TALLY_RECONCILE_INTERVAL', default=300, cast=int)  # seconds
+# Polls checked per pipelined load and grouped count, and chunks checked per run
+VOTE_TALLY_RECONCILE_CHUNK_SIZE = config('VOTE_TALLY_RECONCILE_CHUNK_SIZE', default=500, cast=int)
+VOTE_TALLY_RECONCILE_CHUNKS = config('VOTE_TALLY_RECONCILE_CHUNKS', default=20, cast=int)
+
+# Live stats streaming (SSE): at most one update per poll per tick. Each open
+# stream holds a sync worker until GUNICORN_TIMEOUT, so it is only served, and
+# only used by the page, under ASGI; otherwise the page polls /stats/.
+LIVE_STATS_STREAM = config('LIVE_STATS_STREAM', default=config('GUNICORN_ASGI', default=False, cast=bool), cast=bool)
+LIVE_STATS_POLL_INTERVAL = config('LIVE_STATS_POLL_INTERVAL', default=5, cast=int)  # seconds
+LIVE_UPDATE_TICK = config('LIVE_UPDATE_TICK', default=1.0, cast=float)  # seconds
+LIVE_STREAM_HEARTBEAT = config('LIVE_STREAM_HEARTBEAT', default=15, cast=int)  # seconds
+
+# Time-bucketed vote rollups behind /polls/{id}/timeline/
+VOTE_ROLLUP_INTERVAL = config('VOTE_ROLLUP_INTERVAL', default=60, cast=int)  # seconds
+# Vote ids the rollups skipped are rechecked this long, for votes still committing
+VOTE_ROLLUP_GAP_TIMEOUT = config('VOTE_ROLLUP_GAP_TIMEOUT', default=600, cast=int)  # seconds
+
+# Trending polls: a vote's weight halves every TRENDING_HALF_LIFE
+TRENDING_HALF_LIFE = config('TRENDING_HALF_LIFE', default=3600, cast=int)  # seconds
+TRENDING_REBASE_AFTER = config('TRENDING_REBASE_AFTER', default=86400, cast=int)  # seconds
+TRENDING_REFRESH_INTERVAL = config('TRENDING_REFRESH_INTERVAL', default=300, cast=int)  # seconds
+TRENDING_DEFAULT_LIMIT = 10
+TRENDING_MAX_LIMIT = 100
+
+# Vote resets and poll deletions (see polls/purges.py): votes deleted per
+# transaction, chunks per task run before it requeues itself, and how long a
+# job may go without progress before resume_poll_purges requeues it
+POLL_PURGE_CHUNK_SIZE = config('POLL_PURGE_CHUNK_SIZE', default=1000, cast=int)
+POLL_PURGE_CHUNKS_PER_TASK = config('POLL_PURGE_CHUNKS_PER_TASK', default=50, cast=int)
+POLL_PURGE_STALL_TIMEOUT = config('POLL_PURGE_STALL_TIMEOUT', default=300, cast=int)  # seconds
+POLL_PURGE_RESUME_INTERVAL = config('POLL_PURGE_RESUME_INTERVAL', default=60, cast=int)  # seconds
+
+# Poll close-out (see polls/results.py): how often to look for polls past their
+# end date, how long after it to wait for queued votes, polls closed per run,
+# and how long closed polls and their cached results are kept by clients and us
+POLL_CLOSE_INTERVAL = config('POLL_CLOSE_INTERVAL', default=60, cast=int)  # seconds
+POLL_CLOSE_GRACE = config('POLL_CLOSE_GRACE', default=60, cast=int)  # seconds
+POLL_CLOSE_BATCH_SIZE = config('POLL_CLOSE_BATCH_SIZE', default=100, cast=int)
+CLOSED_POLL_MAX_AGE = config('CLOSED_POLL_MAX_AGE', default=31536000, cast=int)  # seconds
+POLL_RESULTS_CACHE_TIMEOUT = config('POLL_RESULTS_CACHE_TIMEOUT', default=86400, cast=int)  # seconds
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-vote-buffer': {
+        'task': 'polls.tasks.flush_vote_buffer',
+        'schedule': VOTE_FLUSH_INTERVAL,
+    },
+    'compact-vote-shards': {
+        'task': 'polls.tasks.compact_vote_shards',
+        'schedule': VOTE_SHARD_COMPACTION_INTERVAL,
+    },
+    'reconcile-vote-tallies': {
+        'task': 'polls.tasks.reconcile_vote_tallies',
+        'schedule': VOTE_TALLY_RECONCILE_INTERVAL,
+    },
+    'publish-live-updates': {
+        'task': 'polls.tasks.publish_live_updates',
+        'schedule': LIVE_UPDATE_TICK,
+    },
+    'rollup-votes': {
+        'task': 'polls.tasks.rollup_votes',
+        'schedule': VOTE_ROLLUP_INTERVAL,
+    },
+    'refresh-trending': {
+        'task': 'polls.tasks.refresh_trending',
+        'schedule': TRENDING_REFRESH_INTERVAL,
+    },
+    'resume-poll-purges': {
+        'task': 'polls.tasks.resume_poll_purges',
+        'schedule': POLL_PURGE_RESUME_INTERVAL,
+    },
+    'close-expired-polls': {
+        'task': 'polls.tasks.close_expired_polls',
+        'schedule': POLL_CLOSE_INTERVAL,
+    },
+}
+
+
 # Swagger settings
 SWAGGER_USE_COMPAT_RENDERERS = False  # uncomment during pytest 
 SWAGGER_SETTINGS = {
@@ -167,10 +330,17 @@ SWAGGER_SETTINGS = {
 
 
 #redis caching
+# Entries holding poll data are keyed by the poll's generation (see polls/generations.py)
+# and are never deleted, so this is how long a superseded entry lingers.
+POLL_CACHE_TIMEOUT = config('POLL_CACHE_TIMEOUT', default=300, cast=int)  # seconds
+# How long the Last-Modified stamp of a poll generation is kept (see polls/conditional.py).
+# An expired stamp only moves Last-Modified forward; ETags are unaffected.
+POLL_VALIDATOR_TIMEOUT = config('POLL_VALIDATOR_TIMEOUT', default=86400, cast=int)  # seconds
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': config('REDIS_URL'),
+        'LOCATION': REDIS_URL,
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
         }
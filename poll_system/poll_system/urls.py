@@ -1,14 +1,15 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from django.views.generic import TemplateView
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 import rest_framework_simplejwt.authentication
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from polls.views import PollViewSet, QuestionViewSet, ChoiceViewSet, RegisterView, ChangePasswordView
-from graphene_django.views import GraphQLView
+from polls.views import PollViewSet, QuestionViewSet, ChoiceViewSet, PollPurgeViewSet, RegisterView, ChangePasswordView, home, poll_stats_stream
+from polls.graphql_views import CachedGraphQLView, GraphQLMetricsView
+from polls import async_views
 from polls.schema import schema
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -61,10 +62,20 @@ router = DefaultRouter()
 router.register(r'polls', PollViewSet)
 router.register(r'questions', QuestionViewSet)
 router.register(r'choices', ChoiceViewSet)
+router.register(r'purges', PollPurgeViewSet, basename='purge')
+
+# Shadow the matching PollViewSet routes when ASYNC_HOT_PATHS is on
+async_hot_paths = [
+    path('api/v1/polls/<int:pk>/', async_views.poll_detail),
+    path('api/v1/polls/<int:pk>/stats/', async_views.poll_stats),
+    path('api/v1/polls/<int:pk>/vote/', async_views.poll_vote),
+]
 
 urlpatterns = [
-    path('', TemplateView.as_view(template_name='index.html'), name='home'),
+    path('', home, name='home'),
     path('admin/', admin.site.urls),
+    path('api/v1/polls/<int:pk>/stream/', poll_stats_stream, name='poll-stream'),
+    *(async_hot_paths if settings.ASYNC_HOT_PATHS else []),
     path('api/v1/', include(router.urls)),
     path('api/v1/register/', RegisterView.as_view(), name='register'),
     path('api/v1/change-password/', ChangePasswordView.as_view(), name='change_password'),
@@ -72,5 +83,6 @@ urlpatterns = [
     path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-    path('graphql/', GraphQLView.as_view(graphiql=True, schema=schema)),
+    path('graphql/metrics/', GraphQLMetricsView.as_view(), name='graphql-metrics'),
+    path('graphql/', CachedGraphQLView.as_view(graphiql=True, schema=schema)),
 ]
\ No newline at end of file
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Poll, Question, Choice, Vote
+from django.db import transaction
+from .models import Poll, Question, Choice, Vote, PollPurge
+from . import generations, tallies
 
 # Inline for Questions in Poll admin
 class QuestionInline(admin.TabularInline):
@@ -17,11 +19,21 @@ class ChoiceInline(admin.TabularInline):
 
 @admin.register(Poll)
 class PollAdmin(admin.ModelAdmin):
-    list_display = ('title', 'created_by', 'created_at', 'is_active', 'end_date')
-    list_filter = ('is_active', 'created_at')
+    list_display = ('title', 'created_by', 'created_at', 'is_active', 'state', 'end_date', 'closed_at')
+    list_filter = ('is_active', 'state', 'created_at')
     search_fields = ('title',)
     inlines = [QuestionInline]  # Display questions under each poll
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        poll_id = form.instance.pk
+
+        def forget():
+            # Its stats document may be stale, or no longer visible once inactive
+            tallies.drop_poll_tallies(poll_id)
+            generations.bump(poll_id, generations.ALL_POLLS)
+        transaction.on_commit(forget)
+
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ('text', 'poll')
@@ -30,14 +42,28 @@ class QuestionAdmin(admin.ModelAdmin):
 
 @admin.register(Choice)
 class ChoiceAdmin(admin.ModelAdmin):
-    # Use the efficient, denormalized model field 'votes_count' directly
-    list_display = ('text', 'question', 'votes_count')
+    # Denormalized 'votes_count' plus the not yet compacted counter shards
+    list_display = ('text', 'question', 'total_votes')
     list_filter = ('question',)
     # Ensure the denormalized field cannot be accidentally modified
-    readonly_fields = ('votes_count',) 
+    readonly_fields = ('votes_count', 'total_votes') 
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_total_votes()
+
+    @admin.display(description='Votes', ordering='total_votes')
+    def total_votes(self, obj):
+        return obj.current_votes()
     
 @admin.register(Vote)
 class VoteAdmin(admin.ModelAdmin):
     list_display = ('choice', 'question', 'user', 'created_at')
     list_filter = ('created_at', 'user')
-    search_fields = ('user__username', 'choice__text')
\ No newline at end of file
+    search_fields = ('user__username', 'choice__text')
+
+@admin.register(PollPurge)
+class PollPurgeAdmin(admin.ModelAdmin):
+    # Written by the purge_poll task only
+    list_display = ('poll_id', 'kind', 'status', 'votes_deleted', 'votes_total', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = [field.name for field in PollPurge._meta.fields]
@@ -0,0 +1,45 @@
+"""
+Async Redis access for the async views (see async_views.py).
+
+Each event loop gets its own redis.asyncio client for the server behind the
+default cache. The cache helpers use django-redis's own key and value
+encoding, so entries are shared with the sync code paths.
+"""
+import asyncio
+import weakref
+from django.conf import settings
+from django.core.cache import cache
+from redis import asyncio as aioredis
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_connection():
+    """The async client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = aioredis.from_url(settings.REDIS_URL)
+    return client
+
+
+async def cache_get_many(keys, conn=None):
+    """cache.get_many() with one async MGET."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    conn = conn or get_connection()
+    values = await conn.mget([cache.make_key(key) for key in keys])
+    return {key: cache.client.decode(value) for key, value in zip(keys, values) if value is not None}
+
+
+async def cache_set_many(mapping, timeout, conn=None):
+    """cache.set_many() in one async pipeline."""
+    if not mapping:
+        return
+    conn = conn or get_connection()
+    pipe = conn.pipeline(transaction=False)
+    for key, value in mapping.items():
+        pipe.set(cache.make_key(key), cache.client.encode(value), ex=timeout)
+    await pipe.execute()
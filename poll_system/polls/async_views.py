@@ -0,0 +1,159 @@
+"""
+Async implementations of the hottest endpoints: poll detail, stats and vote.
+
+With ASYNC_HOT_PATHS on, these serve the URLs of the matching PollViewSet
+actions under an ASGI server (see gunicorn.conf.py). Redis is read with an
+async client (see aredis.py) and the database with Django's async ORM, so a
+request waiting on either hands the event loop to the others, and a process
+keeps many requests in flight instead of one per sync worker.
+
+Responses, validators and errors match the sync views. Anything else is
+passed to the sync viewset, which answers exactly as before. That includes
+writes to a poll, formats other than JSON such as the browsable API, and
+requests whose credentials are missing or invalid.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django_ratelimit.core import is_ratelimited
+from rest_framework.exceptions import ValidationError
+from . import aredis, conditional, fragments, generations, readers, renderers, results, routers, tallies
+from .models import Poll, Choice, Vote
+from .tasks import asubmit_vote
+from .views import PollViewSet, parse_fieldset, VOTE_RATE_LIMIT, VOTE_RATE_LIMIT_GROUP, VOTING_PAUSED, POLL_CLOSED
+
+
+sync_poll_detail = sync_to_async(PollViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+}))
+sync_poll_stats = sync_to_async(PollViewSet.as_view({'get': 'stats'}))
+sync_poll_vote = sync_to_async(PollViewSet.as_view({'post': 'vote'}))
+
+POLL_NOT_FOUND = 'No Poll matches the given query.'
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderers.dumps(data), status=status, content_type='application/json')
+
+
+def serves_json(request):
+    """Whether the sync views' content negotiation would pick JSON."""
+    requested_format = request.GET.get('format')
+    if requested_format:
+        return requested_format == 'json'
+    return 'text/html' not in request.headers.get('Accept', '')
+
+
+def has_bad_credentials(request):
+    # The sync views reject an invalid token even on reads
+    return 'Authorization' in request.headers and routers.token_user_id(request) is None
+
+
+async def conditional_get(request, kind, poll_generations, build_response, *parts):
+    """conditional.conditional_get() for async views, which only serve JSON."""
+    etag = conditional.make_etag(kind, poll_generations, 'json', *parts)
+    modified = await conditional.alast_modified(poll_generations)
+    immutable = generations.all_closed(poll_generations)
+    response = conditional.conditional_response(request, etag, modified, immutable)
+    if response is None:
+        response = conditional.add_validators(await build_response(), etag, modified, immutable)
+    return response
+
+
+@csrf_exempt
+async def poll_detail(request, pk):
+    if request.method != 'GET' or not serves_json(request) or has_bad_credentials(request):
+        return await sync_poll_detail(request, pk=pk)
+    try:
+        fieldset = parse_fieldset(request, readers.POLL_FIELDSET)
+    except ValidationError as exc:
+        return json_response(exc.detail, status=400)
+    poll_generations = await generations.aget_generations([pk])
+
+    async def build_response():
+        key = fragments.fragment_key(pk, poll_generations[pk], fieldset)
+        fragment = (await aredis.cache_get_many([key])).get(key)
+        if fragment is None:
+            # Rendering runs its queries in one hop to a thread rather than one per query
+            rendered = await sync_to_async(fragments.get_fragments)(
+                [pk], Poll.objects.visible(), poll_generations, fieldset,
+            )
+            fragment = rendered.get(pk)
+        if fragment is None:
+            return json_response({'detail': 'Poll not found'}, status=404)
+        return HttpResponse(fragment, content_type='application/json')
+
+    return await conditional_get(request, 'poll', poll_generations, build_response, fieldset.key)
+
+
+@csrf_exempt
+async def poll_stats(request, pk):
+    if request.method != 'GET' or not serves_json(request) or has_bad_credentials(request):
+        return await sync_poll_stats(request, pk=pk)
+    poll_generations, stats = await tallies.aload_versioned_stats(pk)
+    generation = poll_generations[pk]
+
+    async def build_response():
+        if generations.is_closed(generation):
+            key = results.stats_key(pk, generation)
+            closed_stats = (await aredis.cache_get_many([key])).get(key)
+            if closed_stats is None:
+                closed_stats = await sync_to_async(results.get_stats)(pk, generation)
+            if closed_stats is None:
+                return json_response({'detail': POLL_NOT_FOUND}, status=404)
+            return json_response(closed_stats)
+        # Hiding a poll drops its document, so a missing one is looked up
+        if stats is not None:
+            return json_response(stats)
+        poll = await Poll.objects.visible().filter(pk=pk).values('closed_at').afirst()
+        if poll is None:
+            return json_response({'detail': POLL_NOT_FOUND}, status=404)
+        if poll['closed_at'] is not None:
+            return json_response(await sync_to_async(results.get_stats)(pk, generation))
+        # Cold start: build the tallies from the database
+        return json_response(await sync_to_async(tallies.get_poll_stats)(pk))
+
+    return await conditional_get(request, 'stats', poll_generations, build_response)
+
+
+@csrf_exempt
+async def poll_vote(request, pk):
+    user_id = routers.token_user_id(request)
+    if request.method != 'POST' or user_id is None or request.content_type != 'application/json':
+        return await sync_poll_vote(request, pk=pk)
+    try:
+        data = renderers.loads(request.body)
+    except ValueError:
+        return await sync_poll_vote(request, pk=pk)
+    user = await User.objects.filter(pk=user_id, is_active=True).afirst()
+    if user is None:
+        return await sync_poll_vote(request, pk=pk)
+
+    request.user = user
+    if await sync_to_async(is_ratelimited)(
+        request, group=VOTE_RATE_LIMIT_GROUP, key='user', rate=VOTE_RATE_LIMIT, method='POST', increment=True,
+    ):
+        return json_response({'detail': 'You do not have permission to perform this action.'}, status=403)
+    poll = await Poll.objects.visible().only('state', 'end_date', 'closed_at').filter(pk=pk).afirst()
+    if poll is None:
+        return json_response({'detail': POLL_NOT_FOUND}, status=404)
+    if poll.state != Poll.State.READY:
+        return json_response({'error': VOTING_PAUSED}, status=409)
+    if poll.is_closed():
+        return json_response({'error': POLL_CLOSED}, status=400)
+
+    choice_id = data.get('choice_id') if isinstance(data, dict) else None
+    if not choice_id:
+        return json_response({'error': 'choice_id is required'}, status=400)
+    try:
+        choice = await Choice.objects.aget(id=choice_id, question__poll_id=pk)
+    except (Choice.DoesNotExist, ValueError):
+        return json_response({'error': 'Invalid choice'}, status=400)
+    if await Vote.objects.filter(question_id=choice.question_id, user=user).aexists():
+        return json_response({'error': 'User already voted on this question'}, status=400)
+
+    task_id = await asubmit_vote(choice.question_id, choice.id, user.id)
+    # The vote is written by a worker; keep the voter on the primary regardless
+    routers.stick_to_primary()
+    return json_response({'message': 'Vote processing started', 'task_id': task_id}, status=202)
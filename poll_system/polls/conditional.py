@@ -0,0 +1,117 @@
+"""
+Conditional GET for poll endpoints.
+
+Validators come from the poll generation counters (see generations.py), which
+change whenever anything a response shows changes, so a request can be
+answered with a 304 after one MGET, before any serializer or queryset runs.
+
+ETags hash the generations a response was built from, and the epoch they
+were read in. Last-Modified is the first time a generation was served,
+remembered in the cache; it can only be later than the change that created
+the generation. Lists send no Last-Modified: a page can lose a poll without
+any of the remaining ones changing.
+
+Responses built only from closed polls never change again, so rather than
+asking caches to revalidate them, they are marked immutable for
+CLOSED_POLL_MAX_AGE.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from . import aredis, generations
+
+
+def make_etag(kind, poll_generations, *parts):
+    """Strong ETag over the epoch and (poll_id, generation) pairs in order, plus any extra parts."""
+    key = getattr(poll_generations, 'epoch', '') + ':'
+    key += ','.join(f'{poll_id}.{generation}' for poll_id, generation in poll_generations.items())
+    key += '|' + '|'.join(str(part) for part in parts)
+    return f'"{kind}-{hashlib.blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+
+def last_modified(poll_generations):
+    """
+    Unix time of the newest of the given poll generations, stamping generations
+    seen for the first time with the current time.
+    """
+    if not poll_generations:
+        return None
+    keys = _modified_keys(poll_generations)
+    stamps = cache.get_many(keys)
+    missing = [key for key in keys if key not in stamps]
+    if missing:
+        now = int(time.time())
+        cache.set_many({key: now for key in missing}, settings.POLL_VALIDATOR_TIMEOUT)
+        stamps.update({key: now for key in missing})
+    return max(stamps.values())
+
+
+async def alast_modified(poll_generations):
+    """last_modified() on an async Redis client, for the async views."""
+    if not poll_generations:
+        return None
+    keys = _modified_keys(poll_generations)
+    stamps = await aredis.cache_get_many(keys)
+    missing = [key for key in keys if key not in stamps]
+    if missing:
+        now = int(time.time())
+        await aredis.cache_set_many({key: now for key in missing}, settings.POLL_VALIDATOR_TIMEOUT)
+        stamps.update({key: now for key in missing})
+    return max(stamps.values())
+
+
+def _modified_keys(poll_generations):
+    return [
+        generations.cache_key('modified', poll_id, generation)
+        for poll_id, generation in poll_generations.items()
+    ]
+
+
+def patch_immutable(response):
+    patch_cache_control(response, public=True, max_age=settings.CLOSED_POLL_MAX_AGE, immutable=True)
+    return response
+
+
+def conditional_response(request, etag, modified, immutable=False):
+    """Returns a 304 (or 412) response when the client's copy is current, else None."""
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is not None:
+        response['ETag'] = etag
+        if immutable and response.status_code == 304:
+            patch_immutable(response)
+    return response
+
+
+def add_validators(response, etag, modified, immutable=False):
+    """
+    Sets the validators on a fresh 200 response and asks caches to revalidate
+    it, or to keep it for good when it is immutable.
+    """
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if modified is not None:
+            response['Last-Modified'] = http_date(modified)
+        if immutable:
+            patch_immutable(response)
+        else:
+            patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_get(request, kind, poll_generations, build_response, *parts, dated=True):
+    """
+    Answers from the validators when the client's copy is current, otherwise
+    returns build_response() with the validators attached. The ETag also covers
+    the negotiated format and any extra parts the response depends on.
+    Without dated, no Last-Modified is sent or honoured.
+    """
+    etag = make_etag(kind, poll_generations, request.accepted_renderer.format, *parts)
+    modified = last_modified(poll_generations) if dated else None
+    immutable = generations.all_closed(poll_generations)
+    response = conditional_response(request, etag, modified, immutable)
+    if response is None:
+        response = add_validators(build_response(), etag, modified, immutable)
+    return response
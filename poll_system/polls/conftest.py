@@ -0,0 +1,76 @@
+import pytest
+from rest_framework.test import APIClient
+from django.contrib.auth.models import User
+from polls.models import Poll, Question, Choice, Vote
+from django.conf import settings
+from django.urls import reverse
+from django.core.cache import cache
+from celery import current_app
+
+# Set Celery to run tasks synchronously during testing
+@pytest.fixture(scope='session', autouse=True)
+def celery_config():
+    current_app.task_always_eager = True
+    current_app.task_eager_propagates = True
+
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    """
+    A 'replica1' alias mirroring the test database, for tests that route reads
+    to a replica for real (see test_routers.py).
+    """
+    settings.DATABASES.setdefault('replica1', {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}})
+
+@pytest.fixture(autouse=True)
+def clear_cache_between_tests():
+    """Ensure cache is clean before each test run."""
+    cache.clear()
+
+@pytest.fixture(autouse=True)
+def read_from_primary(settings):
+    """Replica routing is covered in test_routers.py; everything else reads the primary."""
+    settings.DATABASE_REPLICAS = []
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+@pytest.fixture
+def create_user():
+    def _create_user(username, password='testpassword', email='test@example.com'):
+        return User.objects.create_user(username=username, password=password, email=email)
+    return _create_user
+
+@pytest.fixture
+def auth_client(api_client, create_user):
+    user = create_user('testuser')
+    response = api_client.post(reverse('token_obtain_pair'), {
+        'username': 'testuser',
+        'password': 'testpassword'
+    })
+    token = response.data['access']
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    api_client.user = user  # Attach user object for convenience
+    return api_client
+
+@pytest.fixture
+def setup_voted_poll(create_user):
+    """Creates a poll, a question, two choices, and records one vote."""
+    user1 = create_user('voter1', password='voterpassword')
+    poll = Poll.objects.create(title="Test Vote Poll", created_by=user1)
+    question = Question.objects.create(poll=poll, text="Q1")
+    choice1 = Choice.objects.create(question=question, text="C1", votes_count=0)
+    choice2 = Choice.objects.create(question=question, text="C2", votes_count=0)
+    
+    # Record vote and manually trigger the counter update (as it happens in Celery task)
+    Vote.objects.create(user=user1, question=question, choice=choice1)
+    choice1.votes_count += 1
+    choice1.save()
+    
+    return {
+        'poll': poll, 
+        'question': question, 
+        'choice1': choice1, 
+        'choice2': choice2, 
+        'user1': user1
+    }
@@ -0,0 +1,67 @@
+import logging
+import random
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import Choice, ChoiceVoteShard
+
+
+logger = logging.getLogger(__name__)
+
+
+def pick_shard(shard_key=None):
+    """Picks a shard by key (e.g. the voter's id) or at random when no key is given."""
+    shards = settings.VOTE_COUNTER_SHARDS
+    if shard_key is None:
+        return random.randrange(shards)
+    return hash(shard_key) % shards
+
+
+def increment_choice_votes(choice_id, amount=1, shard_key=None):
+    """
+    Adds 'amount' votes to a choice.
+
+    With VOTE_COUNTER_SHARDS > 1 the increment lands on one of the choice's
+    shard rows instead of Choice.votes_count, so writers to a popular choice
+    don't serialize on the same row lock. Must run inside the vote's transaction.
+    """
+    if settings.VOTE_COUNTER_SHARDS <= 1:
+        Choice.objects.filter(id=choice_id).update(votes_count=F('votes_count') + amount)
+        return
+
+    shard = pick_shard(shard_key)
+    shard_rows = ChoiceVoteShard.objects.filter(choice_id=choice_id, shard=shard)
+    if shard_rows.update(count=F('count') + amount):
+        return
+
+    # Shard rows are created lazily on first use
+    try:
+        with transaction.atomic():
+            ChoiceVoteShard.objects.create(choice_id=choice_id, shard=shard, count=amount)
+    except IntegrityError:
+        # Another writer created this shard first
+        shard_rows.update(count=F('count') + amount)
+
+
+def compact_choice_shards(choice_ids):
+    """
+    Folds the shard counts of the given choices into Choice.votes_count.
+    Shard rows are locked for the duration, so concurrent increments simply
+    wait and then land on the zeroed shard. Returns the number of votes folded.
+    """
+    with transaction.atomic():
+        shards = list(
+            ChoiceVoteShard.objects.select_for_update()
+            .filter(choice_id__in=choice_ids, count__gt=0)
+            .only('id', 'choice_id', 'count')
+        )
+        totals = defaultdict(int)
+        for shard in shards:
+            totals[shard.choice_id] += shard.count
+
+        for choice_id, total in totals.items():
+            Choice.objects.filter(id=choice_id).update(votes_count=F('votes_count') + total)
+        ChoiceVoteShard.objects.filter(id__in=[shard.id for shard in shards]).update(count=0)
+
+    return sum(totals.values())
@@ -0,0 +1,103 @@
+"""
+Streaming vote exports, as CSV or NDJSON (see PollViewSet.export and the
+export_votes management command).
+
+Votes are read with a server-side cursor on PostgreSQL (iterator() with
+VOTE_EXPORT_CHUNK_SIZE rows per fetch) and written out a chunk at a time, so
+memory stays flat however many votes a poll has. HTTP exports are gzipped on
+the fly for clients that accept it.
+
+Without a request pinning it to the primary, the export reads from a replica
+when one is configured, so votes from the last moments may be missing.
+"""
+import csv
+import io
+import zlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from . import renderers
+from .middleware import parse_accept_encoding
+from .models import Vote
+
+
+COLUMNS = ('vote_id', 'created_at', 'user_id', 'question_id', 'question', 'choice_id', 'choice')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+
+def vote_rows(poll_id, chunk_size=None):
+    """The poll's votes as tuples of COLUMNS, grouped by question and choice."""
+    return Vote.objects.filter(question__poll_id=poll_id).order_by('question_id', 'choice_id').values_list(
+        'id', 'created_at', 'user_id', 'question_id', 'question__text', 'choice_id', 'choice__text',
+    ).iterator(chunk_size=chunk_size or settings.VOTE_EXPORT_CHUNK_SIZE)
+
+
+def csv_chunks(rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow((row[0], row[1].isoformat(), *row[2:]))
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(rows, chunk_size):
+    lines = []
+    for row in rows:
+        lines.append(renderers.dumps(dict(zip(COLUMNS, row))) + b'\n')
+        if len(lines) == chunk_size:
+            yield b''.join(lines)
+            lines = []
+    if lines:
+        yield b''.join(lines)
+
+
+WRITERS = {'csv': csv_chunks, 'ndjson': ndjson_chunks}
+
+
+def export_chunks(poll_id, file_format, chunk_size=None):
+    """The poll's votes in the given format, as byte chunks of chunk_size rows."""
+    chunk_size = chunk_size or settings.VOTE_EXPORT_CHUNK_SIZE
+    return WRITERS[file_format](vote_rows(poll_id, chunk_size), chunk_size)
+
+
+def gzip_chunks(chunks):
+    # A sync flush per chunk sends each one as soon as it is written
+    compressor = zlib.compressobj(settings.RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+async def iterate_in_thread(chunks):
+    """
+    Async iteration of a sync iterator, one chunk per hop to the sync thread.
+    Django's ASGI handler would otherwise read a sync streaming body into a
+    list before sending any of it.
+    """
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def streaming_response(request, poll_id, file_format):
+    chunks = export_chunks(poll_id, file_format)
+    accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    compressed = accepted.get('gzip', accepted.get('*', 0)) > 0
+    if compressed:
+        chunks = gzip_chunks(chunks)
+    if isinstance(request, ASGIRequest):
+        chunks = iterate_in_thread(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="poll-{poll_id}-votes.{file_format}"'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if compressed:
+        response['Content-Encoding'] = 'gzip'
+    return response
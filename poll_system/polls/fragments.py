@@ -0,0 +1,68 @@
+"""
+Pre-rendered JSON of serialized polls.
+
+Each poll's PollSerializer output, as built by readers.polls_by_id, is rendered
+to JSON bytes once per poll generation and cached. Detail responses send the bytes as they are, and list
+responses splice the fragments into the page envelope, so only polls changed
+since they were last rendered go through the nested serializers. A generation
+bump (edits, resets and committed votes, see generations.py) retires a
+fragment; writes through the API render the new one straight away.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from . import generations, readers, renderers, routers
+
+
+def fragment_key(poll_id, generation, fieldset=readers.POLL_FIELDSET):
+    if fieldset == readers.POLL_FIELDSET:
+        return generations.cache_key('json', poll_id, generation)
+    # Sparse variants are cached alongside the full representation
+    return generations.cache_key('json', poll_id, generation, fieldset.key)
+
+
+def render(data):
+    """Compact JSON bytes, exactly as the API's JSON renderer writes a response body."""
+    return renderers.dumps(data)
+
+
+def get_fragments(poll_ids, queryset, poll_generations=None, fieldset=readers.POLL_FIELDSET):
+    """
+    Returns {poll_id: json bytes} for the polls of queryset among poll_ids,
+    with one MGET for the cached fragments and one batched read for the rest.
+    """
+    if poll_generations is None:
+        poll_generations = generations.get_generations(poll_ids)
+    keys = {poll_id: fragment_key(poll_id, poll_generations[poll_id], fieldset) for poll_id in poll_ids}
+    cached = cache.get_many(keys.values())
+    fragments = {poll_id: cached[key] for poll_id, key in keys.items() if key in cached}
+
+    missing_ids = [poll_id for poll_id in poll_ids if poll_id not in fragments]
+    if missing_ids:
+        # Fragments outlive replica lag, so they are rendered from the primary
+        with routers.primary():
+            polls = readers.polls_by_id(queryset.filter(id__in=missing_ids), fieldset)
+        # Keyed by pk, as ?fields= may leave id out of the output
+        fresh = {poll_id: render(poll) for poll_id, poll in polls.items()}
+        # Ids may arrive as strings from the URL
+        fresh = {poll_id: fresh[int(poll_id)] for poll_id in missing_ids if int(poll_id) in fresh}
+        cache.set_many({keys[poll_id]: fragment for poll_id, fragment in fresh.items()}, settings.POLL_CACHE_TIMEOUT)
+        fragments.update(fresh)
+    return fragments
+
+
+def store(poll_id, generation, fragment, fieldset=readers.POLL_FIELDSET):
+    """Caches a fragment rendered by the caller for the given generation."""
+    cache.set(fragment_key(poll_id, generation, fieldset), fragment, settings.POLL_CACHE_TIMEOUT)
+
+
+def join(fragments):
+    """Splices fragments into a JSON array."""
+    return b'[' + b','.join(fragments) + b']'
+
+
+def page(fragments, next_link, previous_link):
+    """Splices fragments into the cursor pagination envelope."""
+    return (
+        b'{"next":' + render(next_link) + b',"previous":' + render(previous_link)
+        + b',"results":' + join(fragments) + b'}'
+    )
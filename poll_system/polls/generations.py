@@ -0,0 +1,142 @@
+"""
+Per-poll generation counters embedded in every cache key holding poll data.
+
+Invalidating a poll is a single INCR of its counter: entries built against an
+older generation are never looked up again and simply expire. The ALL_POLLS
+counter versions data that depends on the set of active polls rather than on
+one poll, such as GraphQL allPolls results.
+
+The counters live in Redis alone. Should it lose them (a flush, a failover to
+an empty replica), they start again from 0 and would version different
+content with the numbers clients already hold. So the counters are read
+along with an epoch, a random token set when none exists, which validators
+fold in: a Redis that lost its counters has also lost its epoch. Counters
+and the epoch have no expiry, so a volatile-* maxmemory-policy never evicts
+them.
+
+Closing a poll (see results.py) adds CLOSED to its counter instead. A closed
+poll never changes again, so whoever holds a generation can tell that what it
+versions is final, without another lookup.
+"""
+import logging
+import uuid
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from . import aredis
+
+
+logger = logging.getLogger(__name__)
+
+ALL_POLLS = 'all'
+
+EPOCH_KEY = 'polls:gen:epoch'
+
+# Far above any number of bumps a poll could get before closing
+CLOSED = 1 << 40
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def generation_key(poll_id):
+    # Counters never expire: resetting one to an older value would revive stale entries
+    return f'polls:gen:{poll_id}'
+
+
+class Generations(dict):
+    """{poll_id: generation}, with the epoch the counters were read in."""
+    epoch = ''
+
+
+def _generations(poll_ids, epoch, values):
+    poll_generations = Generations((poll_id, int(value or 0)) for poll_id, value in zip(poll_ids, values))
+    poll_generations.epoch = epoch.decode()
+    return poll_generations
+
+
+def generation_keys(poll_ids):
+    """The keys get_generations() MGETs, for callers reading them in a pipeline."""
+    return [EPOCH_KEY] + [generation_key(poll_id) for poll_id in poll_ids]
+
+
+def from_values(poll_ids, values, conn=None):
+    """{poll_id: generation} from the values of generation_keys(poll_ids)."""
+    epoch, *values = values
+    if epoch is None:
+        conn = conn or get_connection()
+        conn.set(EPOCH_KEY, uuid.uuid4().hex, nx=True)
+        epoch = conn.get(EPOCH_KEY)
+    return _generations(poll_ids, epoch, values)
+
+
+async def afrom_values(poll_ids, values, conn=None):
+    """from_values() on an async Redis client (see aredis.py)."""
+    epoch, *values = values
+    if epoch is None:
+        conn = conn or aredis.get_connection()
+        await conn.set(EPOCH_KEY, uuid.uuid4().hex, nx=True)
+        epoch = await conn.get(EPOCH_KEY)
+    return _generations(poll_ids, epoch, values)
+
+
+def get_generations(poll_ids, conn=None):
+    """Returns {poll_id: generation} for the given polls with a single MGET."""
+    poll_ids = list(poll_ids)
+    conn = conn or get_connection()
+    return from_values(poll_ids, conn.mget(generation_keys(poll_ids)), conn)
+
+
+def get_generation(poll_id, conn=None):
+    return get_generations([poll_id], conn)[poll_id]
+
+
+async def aget_generations(poll_ids, conn=None):
+    """get_generations() on an async Redis client (see aredis.py)."""
+    poll_ids = list(poll_ids)
+    conn = conn or aredis.get_connection()
+    return await afrom_values(poll_ids, await conn.mget(generation_keys(poll_ids)), conn)
+
+
+def bump(*poll_ids, conn=None):
+    """
+    Invalidates every cached entry of the given polls, one INCR per poll.
+    Returns their new {poll_id: generation}, empty when Redis is unreachable.
+    """
+    try:
+        conn = conn or get_connection()
+        if len(poll_ids) == 1:
+            return {poll_ids[0]: conn.incr(generation_key(poll_ids[0]))}
+        pipe = conn.pipeline(transaction=False)
+        for poll_id in poll_ids:
+            pipe.incr(generation_key(poll_id))
+        return dict(zip(poll_ids, pipe.execute()))
+    except RedisError as e:
+        logger.warning(f"Failed to bump cache generation for polls {poll_ids}: {e}")
+        return {}
+
+
+def close(poll_id, conn=None):
+    """Invalidates a poll for the last time, marking its generation closed."""
+    try:
+        conn = conn or get_connection()
+        conn.incrby(generation_key(poll_id), CLOSED)
+    except RedisError as e:
+        logger.warning(f"Failed to close cache generation for poll {poll_id}: {e}")
+
+
+def is_closed(generation):
+    return generation >= CLOSED
+
+
+def all_closed(poll_generations):
+    """Whether the given {poll_id: generation} are all of closed polls."""
+    return bool(poll_generations) and all(is_closed(generation) for generation in poll_generations.values())
+
+
+def cache_key(kind, poll_id, generation, *parts):
+    """Builds a cache key such as 'poll:detail:12:g7' for one generation of a poll."""
+    key = f'poll:{kind}:{poll_id}:g{generation}'
+    if parts:
+        key += ':' + ':'.join(str(part) for part in parts)
+    return key
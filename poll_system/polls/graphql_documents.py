@@ -0,0 +1,139 @@
+"""
+Parsing, validation, persisted queries and cost limits for /graphql/.
+
+- Parsed and validated documents are kept in a per-process LRU keyed by the
+  query text, so a repeated query skips parsing and validation.
+- Persisted queries follow the automatic persisted queries protocol: a client
+  sends extensions.persistedQuery.sha256Hash and only sends the full query
+  when the server answers PersistedQueryNotFound. Registered queries live in
+  the cache, shared by every worker.
+- query_cost() estimates what a query resolves before it runs, and queries
+  over GRAPHQL_MAX_QUERY_COST are rejected.
+
+Metrics (see get_metrics()) are counted per process, like the document LRU.
+"""
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLInt, GraphQLList, OperationType,
+    get_named_type, get_nullable_type, get_operation_ast, parse, validate,
+)
+from graphql.utilities import value_from_ast
+
+
+metrics = Counter()
+
+
+@lru_cache(maxsize=settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+def _parse_and_validate(schema, query, validation_rules, max_errors):
+    document = parse(query)
+    return document, tuple(validate(schema, document, validation_rules, max_errors))
+
+
+def get_document(schema, query, validation_rules=None, max_errors=None):
+    """
+    The parsed document of a query and its validation errors, from the LRU
+    when possible. Raises GraphQLError for a syntax error; those are not cached.
+    """
+    document, errors = _parse_and_validate(schema, query, validation_rules and tuple(validation_rules), max_errors)
+    return document, list(errors)
+
+
+def get_metrics():
+    info = _parse_and_validate.cache_info()
+    return {
+        'document_cache_hits': info.hits,
+        'document_cache_misses': info.misses,
+        'document_cache_size': info.currsize,
+        'document_cache_capacity': info.maxsize,
+        **metrics,
+    }
+
+
+def clear_document_cache():
+    _parse_and_validate.cache_clear()
+
+
+# Persisted queries
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def persisted_query_key(sha256_hash):
+    return f'graphql:persisted:{sha256_hash}'
+
+
+def get_persisted_query(sha256_hash):
+    query = cache.get(persisted_query_key(sha256_hash))
+    metrics['persisted_query_misses' if query is None else 'persisted_query_hits'] += 1
+    return query
+
+
+def persist_query(sha256_hash, query):
+    cache.set(persisted_query_key(sha256_hash), query, settings.GRAPHQL_PERSISTED_QUERY_TIMEOUT)
+    metrics['persisted_queries_registered'] += 1
+
+
+# Cost analysis
+
+def _list_size(field_node, field_def, variables):
+    """The number of items a list field is expected to resolve."""
+    if 'first' not in field_def.args:
+        return settings.GRAPHQL_LIST_SIZE_ESTIMATE
+    first = next((arg.value for arg in field_node.arguments if arg.name.value == 'first'), None)
+    first = value_from_ast(first, GraphQLInt, variables) if first is not None else None
+    # Matches the resolvers, which clamp 'first' to the page size limits
+    return max(1, min(first or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE))
+
+
+def _selection_cost(schema, parent_type, selection_set, fragments, variables):
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            field_def = getattr(parent_type, 'fields', {}).get(name)
+            if field_def is None:  # introspection and __typename
+                continue
+            child_cost = 0
+            if selection.selection_set is not None:
+                child_cost = _selection_cost(
+                    schema, get_named_type(field_def.type), selection.selection_set, fragments, variables,
+                )
+            if isinstance(get_nullable_type(field_def.type), GraphQLList):
+                cost += 1 + _list_size(selection, field_def, variables) * child_cost
+            else:
+                cost += 1 + child_cost
+        else:
+            fragment = fragments[selection.name.value] if isinstance(selection, FragmentSpreadNode) else selection
+            fragment_type = parent_type
+            if fragment.type_condition is not None:
+                fragment_type = schema.get_type(fragment.type_condition.name.value)
+            cost += _selection_cost(schema, fragment_type, fragment.selection_set, fragments, variables)
+    return cost
+
+
+def query_cost(schema, document, operation_name=None, variables=None):
+    """
+    Estimated number of values a valid document resolves: every field costs
+    one, and the fields below a list are counted once per expected item. The
+    item count is the 'first' argument when the field takes one, otherwise
+    GRAPHQL_LIST_SIZE_ESTIMATE.
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0
+    root_type = {
+        OperationType.QUERY: schema.query_type,
+        OperationType.MUTATION: schema.mutation_type,
+        OperationType.SUBSCRIPTION: schema.subscription_type,
+    }[operation.operation]
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    return _selection_cost(schema, root_type, operation.selection_set, fragments, variables or {})
@@ -0,0 +1,243 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, FieldNode, OperationType, execute, get_operation_ast, validate_schema
+from graphql.error import GraphQLError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from . import conditional, generations, graphql_documents, renderers, routers
+from .models import Poll
+
+
+class PollDependencyMiddleware:
+    """
+    Graphene middleware that records the id of every poll a query resolves,
+    so a cached result can be checked against those polls' generations.
+    """
+    def resolve(self, next, root, info, **args):
+        poll_ids = getattr(info.context, '_graphql_poll_ids', None)
+        if poll_ids is not None and isinstance(root, Poll):
+            poll_ids.add(root.pk)
+        return next(root, info, **args)
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQLView that caches query results. A cached entry stores the generation
+    of every poll it read (plus ALL_POLLS) and is only served while all of them
+    are unchanged. Mutations are never cached.
+
+    Also serves persisted queries, reuses parsed and validated documents and
+    rejects queries over GRAPHQL_MAX_QUERY_COST (see graphql_documents.py).
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('middleware', [PollDependencyMiddleware()])
+        super().__init__(**kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        # Queries are POSTed too, so they may read from replicas; mutations
+        # move to the primary as soon as they write (see routers.py)
+        routers.unpin()
+        response = super().dispatch(request, *args, **kwargs)
+        if getattr(request, '_graphql_immutable', False) and request.method == 'GET' and response.status_code == 200:
+            conditional.patch_immutable(response)
+        return response
+
+    def reads_polls_by_id(self, query, operation_name):
+        """Whether the operation's root fields are all poll(id:) lookups."""
+        operation = get_operation_ast(self.get_document(query)[0], operation_name)
+        selections = operation.selection_set.selections
+        return all(isinstance(field, FieldNode) and field.name.value == 'poll' for field in selections)
+
+    def result_cache_key(self, query, variables, operation_name):
+        if not query:
+            return None
+        try:
+            operation = get_operation_ast(self.get_document(query)[0], operation_name)
+        except GraphQLError:
+            return None
+        if operation is None or operation.operation != OperationType.QUERY:
+            return None
+        digest = hashlib.sha256(
+            json.dumps([query, variables, operation_name], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return f'graphql:result:{digest}'
+
+    def parse_body(self, request):
+        if self.batch or self.get_content_type(request) != 'application/json':
+            return super().parse_body(request)
+        try:
+            request_json = renderers.loads(request.body)
+        except ValueError:
+            raise HttpError(HttpResponseBadRequest('POST body sent invalid JSON.'))
+        if not isinstance(request_json, dict):
+            raise HttpError(HttpResponseBadRequest('The received data is not a valid JSON query.'))
+        return request_json
+
+    def json_encode(self, request, d, pretty=False):
+        if self.pretty or pretty or request.GET.get('pretty'):
+            return super().json_encode(request, d, pretty)
+        return renderers.dumps(d)
+
+    def get_document(self, query):
+        return graphql_documents.get_document(
+            self.schema.graphql_schema, query, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+
+    def resolve_persisted_query(self, request, data):
+        """
+        The request data with the query of a persisted query hash filled in,
+        or an error response when the hash is unknown or does not match.
+        Registers the query when a client sends both and it is valid.
+        """
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+        persisted = extensions.get('persistedQuery') if isinstance(extensions, dict) else None
+        sha256_hash = persisted.get('sha256Hash') if isinstance(persisted, dict) else None
+        if not isinstance(sha256_hash, str):
+            return data, None
+
+        query = request.GET.get('query') or data.get('query')
+        if not query:
+            query = graphql_documents.get_persisted_query(sha256_hash)
+            if query is None:
+                # Clients answer this by sending the query along with the hash
+                return data, self.error_response(request, 'PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND', 200)
+            return {**data, 'query': query}, None
+
+        if graphql_documents.query_hash(query) != sha256_hash:
+            return data, self.error_response(request, 'provided sha does not match query', 'BAD_REQUEST', 400)
+        try:
+            errors = self.get_document(query)[1]
+        except GraphQLError:
+            errors = True
+        if not errors:
+            graphql_documents.persist_query(sha256_hash, query)
+        return data, None
+
+    def error_response(self, request, message, code, status_code):
+        return self.json_encode(request, {'errors': [{'message': message, 'extensions': {'code': code}}]}), status_code
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        # GraphQLView.execute_graphql_request() with parsing and validation
+        # through the document cache, and the cost limit before execution
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest('Must provide query string.'))
+
+        schema = self.schema.graphql_schema
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            document, validation_errors = self.get_document(query)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if request.method.lower() == 'get' and operation_ast is not None and operation_ast.operation != OperationType.QUERY:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseNotAllowed(
+                ['POST'], f'Can only perform a {operation_ast.operation.value} operation from a POST request.',
+            ))
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        cost = graphql_documents.query_cost(schema, document, operation_name, variables)
+        if cost > settings.GRAPHQL_MAX_QUERY_COST:
+            graphql_documents.metrics['queries_rejected_by_cost'] += 1
+            return ExecutionResult(data=None, errors=[GraphQLError(
+                f'Query cost {cost} exceeds the limit of {settings.GRAPHQL_MAX_QUERY_COST}.',
+                extensions={'code': 'QUERY_TOO_COSTLY', 'cost': cost, 'limit': settings.GRAPHQL_MAX_QUERY_COST},
+            )])
+
+        try:
+            execute_options = {
+                'root_value': self.get_root_value(request),
+                'context_value': self.get_context(request),
+                'variable_values': variables,
+                'operation_name': operation_name,
+                'middleware': self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options['execution_context_class'] = self.execution_context_class
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get('ATOMIC_MUTATIONS', False) is True
+                )
+            ):
+                with transaction.atomic():
+                    execution_result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+            else:
+                execution_result = execute(schema, document, **execute_options)
+        except Exception as e:
+            execution_result = ExecutionResult(errors=[e])
+        request._graphql_execution_result = execution_result
+        return execution_result
+
+    def get_response(self, request, data, show_graphiql=False):
+        data, error = self.resolve_persisted_query(request, data)
+        if error is not None:
+            return error
+        query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        key = None if self.batch else self.result_cache_key(query, variables, operation_name)
+        if key is None:
+            return super().get_response(request, data, show_graphiql)
+
+        entry = cache.get(key)
+        if entry is not None:
+            current = generations.get_generations(entry['generations'])
+            if current == entry['generations']:
+                request._graphql_immutable = entry.get('immutable', False)
+                return entry['result'], entry['status_code']
+
+        # A write landing while the query executes, or not yet on the replica
+        # it reads, may get cached against the newer generation;
+        # POLL_CACHE_TIMEOUT bounds how long that is served.
+        request._graphql_poll_ids = set()
+        all_generation = generations.get_generation(generations.ALL_POLLS)
+        result, status_code = super().get_response(request, data, show_graphiql)
+
+        execution_result = getattr(request, '_graphql_execution_result', None)
+        if status_code == 200 and execution_result is not None and not execution_result.errors:
+            poll_ids = request._graphql_poll_ids
+            entry_generations = generations.get_generations(poll_ids)
+            immutable = generations.all_closed(entry_generations) and self.reads_polls_by_id(query, operation_name)
+            if not immutable:
+                entry_generations[generations.ALL_POLLS] = all_generation
+            request._graphql_immutable = immutable
+            cache.set(key, {
+                'generations': entry_generations,
+                'result': result,
+                'status_code': status_code,
+                'immutable': immutable,
+            }, settings.POLL_CACHE_TIMEOUT)
+        return result, status_code
+
+
+class GraphQLMetricsView(APIView):
+    """Document cache, persisted query and cost limit counters of this process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(graphql_documents.get_metrics())
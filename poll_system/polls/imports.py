@@ -0,0 +1,118 @@
+"""
+Streaming poll import from NDJSON or CSV (see PollViewSet.import_polls and the
+import_polls management command).
+
+The input is read a line at a time, and polls are validated with
+PollSerializer and inserted with create_polls() POLL_IMPORT_CHUNK_SIZE at a
+time, each chunk in its own transaction. Memory use is bounded by the chunk
+size, however long the input. Invalid records are skipped and reported with
+the line they start on.
+
+NDJSON: one poll per line, shaped like the PollSerializer input:
+    {"title": "...", "questions": [{"text": "...", "choices": [{"text": "..."}]}]}
+
+CSV: a header row naming the title, description, end_date, question and
+choice columns (only title is required), then one row per choice.
+Consecutive rows with the same title make one poll, which takes its
+description and end date from its first row, and consecutive rows of a poll
+with the same question make one question. An empty question or choice cell
+gives a poll without questions or a question without choices.
+"""
+import csv
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from . import generations, renderers
+from .serializers import PollSerializer, create_polls
+
+
+CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+EXTENSIONS = {
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+}
+
+
+def read_ndjson(lines):
+    """Yields (line number, poll data, parse error) for each non-blank line."""
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, renderers.loads(line), None
+        except ValueError:
+            yield line_number, None, {'non_field_errors': ['Invalid JSON.']}
+
+
+def read_csv(lines):
+    """Yields (line number, poll data, parse error) for each poll of CSV rows."""
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or 'title' not in reader.fieldnames:
+        yield 1, None, {'non_field_errors': ['The header row must name a title column.']}
+        return
+
+    poll, poll_line = None, None
+    for row in reader:
+        line_number = reader.line_num
+        title = row.get('title') or ''
+        if poll is None or title != poll['title']:
+            if poll is not None:
+                yield poll_line, poll, None
+            poll, poll_line = {'title': title, 'questions': []}, line_number
+            if row.get('description'):
+                poll['description'] = row['description']
+            if row.get('end_date'):
+                poll['end_date'] = row['end_date']
+
+        question_text = row.get('question') or ''
+        if not question_text:
+            continue
+        questions = poll['questions']
+        if not questions or questions[-1]['text'] != question_text:
+            questions.append({'text': question_text, 'choices': []})
+        if row.get('choice'):
+            questions[-1]['choices'].append({'text': row['choice']})
+    if poll is not None:
+        yield poll_line, poll, None
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def import_polls(lines, format, created_by, chunk_size=None):
+    """
+    Imports the polls read from lines, an iterable of text lines in the given
+    format. Returns the number of polls created and invalid records, with the
+    errors of the first POLL_IMPORT_MAX_ERRORS of them.
+    """
+    chunk_size = chunk_size or settings.POLL_IMPORT_CHUNK_SIZE
+    records = READERS[format](lines)
+    result = {'created': 0, 'invalid': 0, 'errors': []}
+
+    # One serializer validates every record, so its fields are only built once
+    serializer = PollSerializer()
+
+    while chunk := list(islice(records, chunk_size)):
+        valid = []
+        for line_number, data, errors in chunk:
+            if errors is None:
+                try:
+                    valid.append({**serializer.run_validation(data), 'created_by': created_by})
+                    continue
+                except ValidationError as exc:
+                    errors = exc.detail
+            result['invalid'] += 1
+            if len(result['errors']) < settings.POLL_IMPORT_MAX_ERRORS:
+                result['errors'].append({'line': line_number, 'errors': errors})
+        with transaction.atomic():
+            result['created'] += len(create_polls(valid))
+
+    if result['created']:
+        generations.bump(generations.ALL_POLLS)
+    return result
@@ -0,0 +1,133 @@
+"""
+Live stats updates pushed to browsers over Server-Sent Events.
+
+The vote commit path only marks a poll as dirty. The publish_live_updates beat
+task runs every LIVE_UPDATE_TICK seconds and publishes the current stats
+document of each dirty poll once, so a poll gets at most one update per tick no
+matter how many votes arrive. Every ASGI process holds a single subscription to
+the updates channel and fans each message out to its local listeners.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from . import tallies
+
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = 'polls:live:dirty'
+CHANNEL = 'polls:live:updates'
+
+
+def mark_dirty(poll_ids, conn=None):
+    """Flags polls whose stats changed since the last tick."""
+    try:
+        conn = conn or get_redis_connection('default')
+        conn.sadd(DIRTY_KEY, *poll_ids)
+    except RedisError as e:
+        logger.warning(f"Failed to flag live updates for polls {poll_ids}: {e}")
+
+
+def publish_dirty_polls(max_polls=1000, conn=None):
+    """
+    Publishes the stats document of every dirty poll once and returns how many
+    polls were published. Messages are '<poll_id> <stats json>'.
+    """
+    conn = conn or get_redis_connection('default')
+    poll_ids = [int(poll_id) for poll_id in conn.spop(DIRTY_KEY, max_polls)]
+    if not poll_ids:
+        return 0
+
+    pipe = conn.pipeline(transaction=False)
+    for poll_id in poll_ids:
+        poll_stats = tallies.load_poll_stats(poll_id, conn)
+        if poll_stats is not None:
+            pipe.publish(CHANNEL, f'{poll_id} {json.dumps(poll_stats)}')
+    pipe.execute()
+    return len(poll_ids)
+
+
+def format_event(data):
+    return b'event: stats\ndata: ' + data + b'\n\n'
+
+
+class LiveUpdateHub:
+    """
+    Per-process fan-out from one Redis subscription to many listeners.
+
+    Each listener gets a one-slot queue that always holds the newest update,
+    so a slow client skips intermediate updates instead of buffering them.
+    """
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.listeners = defaultdict(set)
+        self.reader = None
+
+    def subscribe(self, poll_id):
+        queue = asyncio.Queue(maxsize=1)
+        self.listeners[poll_id].add(queue)
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self.read())
+        return queue
+
+    def unsubscribe(self, poll_id, queue):
+        listeners = self.listeners.get(poll_id)
+        if listeners is not None:
+            listeners.discard(queue)
+            if not listeners:
+                del self.listeners[poll_id]
+
+    def dispatch(self, poll_id, event):
+        for queue in self.listeners.get(poll_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def read(self):
+        while True:
+            client = aioredis.from_url(settings.REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        poll_id, data = message['data'].split(b' ', 1)
+                        self.dispatch(int(poll_id), format_event(data))
+            except (RedisError, OSError) as e:
+                logger.warning(f"Live updates subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+_hub = None
+
+
+def get_hub():
+    """Returns this process's hub, creating it on the running event loop."""
+    global _hub
+    if _hub is None or _hub.loop is not asyncio.get_running_loop():
+        _hub = LiveUpdateHub()
+    return _hub
+
+
+async def stream_events(poll_id, initial_stats):
+    """Yields SSE frames: the current stats, then every update, with heartbeats."""
+    yield format_event(json.dumps(initial_stats).encode())
+
+    hub = get_hub()
+    queue = hub.subscribe(poll_id)
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=settings.LIVE_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+    finally:
+        hub.unsubscribe(poll_id, queue)
@@ -0,0 +1,111 @@
+"""
+Per-request batch loading for the GraphQL schema.
+
+graphql-core resolves fields one object at a time, so a relation resolver
+that queries on its own runs once per parent: once per poll for its
+questions, once per question for its choices. The loaders here batch those
+lookups instead. Loaded objects announce the keys their relations will ask
+for (a poll its id and creator, a question its id), and the first load()
+fetches every announced key in one query. Any query depth then costs one
+statement per relation level.
+
+Execution is synchronous, so unlike promise-based DataLoaders, loads return
+values directly.
+"""
+from collections import defaultdict
+from django.contrib.auth.models import User
+from .models import Poll, Question, Choice, ChoiceResult
+from . import tallies
+
+
+class DataLoader:
+    """Caches values by key and loads the keys it has been told about in batches."""
+    def __init__(self, batch_load, default=None):
+        self.batch_load = batch_load  # keys -> {key: value}
+        self.default = default
+        self.cache = {}
+        self.pending = set()
+
+    def want(self, keys):
+        """Queues keys to be fetched with the next load()."""
+        self.pending.update(key for key in keys if key not in self.cache)
+
+    def prime(self, key, value):
+        self.cache.setdefault(key, value)
+        self.pending.discard(key)
+
+    def load(self, key):
+        if key not in self.cache:
+            keys, self.pending = self.pending | {key}, set()
+            loaded = self.batch_load(keys)
+            for missing in keys:
+                self.cache[missing] = loaded.get(missing, self.default() if callable(self.default) else self.default)
+        return self.cache[key]
+
+
+class Loaders:
+    """The loaders of one GraphQL request."""
+    def __init__(self):
+        self.polls = DataLoader(self.load_polls)
+        self.users = DataLoader(lambda ids: User.objects.in_bulk(ids))
+        self.questions = DataLoader(self.load_questions)
+        self.questions_by_poll = DataLoader(self.load_questions_by_poll, default=list)
+        self.choices_by_question = DataLoader(self.load_choices_by_question, default=list)
+        self.results_by_poll = DataLoader(self.load_results_by_poll, default=dict)
+        self.tallies_by_poll = DataLoader(lambda ids: tallies.get_many_poll_counts(list(ids)), default=dict)
+
+    def saw_polls(self, polls):
+        """Primes the loaders with polls resolved elsewhere, e.g. by a root field."""
+        for poll in polls:
+            self.polls.prime(poll.id, poll)
+        self.users.want(poll.created_by_id for poll in polls)
+        self.questions_by_poll.want(poll.id for poll in polls)
+        self.results_by_poll.want(poll.id for poll in polls if poll.closed_at is not None)
+        self.tallies_by_poll.want(poll.id for poll in polls if poll.closed_at is None)
+        return polls
+
+    def saw_questions(self, questions):
+        for question in questions:
+            self.questions.prime(question.id, question)
+        self.polls.want(question.poll_id for question in questions)
+        self.choices_by_question.want(question.id for question in questions)
+        return questions
+
+    def load_polls(self, ids):
+        polls = Poll.objects.in_bulk(ids)
+        self.saw_polls(list(polls.values()))
+        return polls
+
+    def load_questions(self, ids):
+        questions = Question.objects.in_bulk(ids)
+        self.saw_questions(list(questions.values()))
+        return questions
+
+    def load_questions_by_poll(self, poll_ids):
+        questions = self.saw_questions(list(Question.objects.filter(poll_id__in=poll_ids).order_by('id')))
+        grouped = defaultdict(list)
+        for question in questions:
+            grouped[question.poll_id].append(question)
+        return grouped
+
+    def load_choices_by_question(self, question_ids):
+        grouped = defaultdict(list)
+        for choice in Choice.objects.filter(question_id__in=question_ids).order_by('id'):
+            grouped[choice.question_id].append(choice)
+        return grouped
+
+    def load_results_by_poll(self, poll_ids):
+        """{poll_id: {choice_id: final votes}} of closed polls."""
+        grouped = defaultdict(dict)
+        rows = ChoiceResult.objects.filter(poll_id__in=poll_ids, choice_id__isnull=False)
+        for poll_id, choice_id, votes_count in rows.values_list('poll_id', 'choice_id', 'votes_count'):
+            grouped[poll_id][choice_id] = votes_count
+        return grouped
+
+
+def get_loaders(info):
+    """The loaders of the request being executed, created on first use."""
+    loaders = getattr(info.context, '_graphql_loaders', None)
+    if loaders is None:
+        loaders = info.context._graphql_loaders = Loaders()
+    return loaders
@@ -0,0 +1,42 @@
+import gzip
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from polls import exports
+from polls.models import Poll
+
+
+class Command(BaseCommand):
+    help = "Streams a poll's votes as CSV or NDJSON to a file or stdout (see polls/exports.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_id', type=int)
+        parser.add_argument('--format', choices=sorted(exports.WRITERS), default='csv')
+        parser.add_argument('--output', default='-', help='File to write, or - for stdout')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--chunk-size', type=int, default=settings.VOTE_EXPORT_CHUNK_SIZE,
+                            help='Rows per database fetch and per write')
+
+    def handle(self, *args, **options):
+        if not Poll.objects.filter(pk=options['poll_id']).exists():
+            raise CommandError(f"No poll with id {options['poll_id']}.")
+        chunks = exports.export_chunks(options['poll_id'], options['format'], options['chunk_size'])
+
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+        else:
+            try:
+                output = open(options['output'], 'wb')
+            except OSError as e:
+                raise CommandError(str(e))
+        try:
+            if options['gzip']:
+                with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=settings.RESPONSE_GZIP_LEVEL) as compressed:
+                    for chunk in chunks:
+                        compressed.write(chunk)
+            else:
+                for chunk in chunks:
+                    output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
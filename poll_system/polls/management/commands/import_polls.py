@@ -0,0 +1,43 @@
+import os
+import sys
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from polls import imports
+
+
+class Command(BaseCommand):
+    help = 'Imports polls from an NDJSON or CSV file, or stdin with "-" (see polls/imports.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin')
+        parser.add_argument('--user', required=True, help='Username the polls are created by')
+        parser.add_argument('--format', choices=sorted(imports.READERS), help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=settings.POLL_IMPORT_CHUNK_SIZE,
+                            help='Polls inserted per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+
+        path = options['path']
+        file_format = options['format'] or imports.EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+
+        if path == '-':
+            result = imports.import_polls(sys.stdin, file_format, user, options['chunk_size'])
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as lines:
+                    result = imports.import_polls(lines, file_format, user, options['chunk_size'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if result['invalid'] > len(result['errors']):
+            self.stderr.write(f"... and {result['invalid'] - len(result['errors'])} more invalid records")
+        self.stdout.write(self.style.SUCCESS(f"Imported {result['created']} polls, skipped {result['invalid']} invalid records."))
@@ -0,0 +1,87 @@
+"""
+Negotiated response compression.
+
+Compresses response bodies with brotli (when the brotli package is installed)
+or gzip, whichever the client accepts with the higher preference, once they
+reach RESPONSE_COMPRESSION_MIN_SIZE. Streaming responses, such as the live
+stats SSE stream, are left alone so events are not held back in a buffer.
+"""
+import gzip
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+_accept_encoding_re = _lazy_re_compile(r'^\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def parse_accept_encoding(header):
+    """Returns {coding: q} for an Accept-Encoding header."""
+    codings = {}
+    for part in header.split(','):
+        match = _accept_encoding_re.match(part)
+        if match:
+            try:
+                codings[match[1].lower()] = float(match[2]) if match[2] else 1.0
+            except ValueError:
+                continue
+    return codings
+
+
+def choose_encoding(header):
+    """Picks 'br', 'gzip' or None for an Accept-Encoding header. Ties go to brotli."""
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get('*', 0)
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0
+    for coding in offered:
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.RESPONSE_BROTLI_QUALITY)
+    # mtime=0 keeps the output stable for identical content
+    return gzip.compress(content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    async def __acall__(self, request):
+        # Compression is CPU only, so under ASGI it runs on the event loop
+        # rather than through MiddlewareMixin's hop to the sync thread
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed bytes differ from what the validator was computed
+        # over, so a strong ETag becomes weak, as Django's GZipMiddleware does.
+        # If-None-Match uses weak comparison, so revalidation still matches.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
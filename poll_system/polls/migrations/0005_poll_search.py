@@ -0,0 +1,213 @@
+from django.db import migrations
+
+
+# PostgreSQL refreshes on UPDATE only for rows whose text or parent changed.
+# A trigger with transition tables cannot take a column list, so the old and
+# new rows are compared instead; vote counter writes to polls_choice then
+# never touch polls_poll, nor lock its row.
+POSTGRES_UPDATE_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION polls_question_search_update_refresh() RETURNS trigger AS $$
+    BEGIN
+        UPDATE polls_poll p SET search_vector = polls_poll_search_vector(p.id, p.title, p.description)
+        WHERE p.id IN (
+            SELECT unnest(ARRAY[n.poll_id, o.poll_id]) FROM new_questions n JOIN old_questions o ON o.id = n.id
+            WHERE n.text IS DISTINCT FROM o.text OR n.poll_id IS DISTINCT FROM o.poll_id
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION polls_choice_search_update_refresh() RETURNS trigger AS $$
+    BEGIN
+        UPDATE polls_poll p SET search_vector = polls_poll_search_vector(p.id, p.title, p.description)
+        WHERE p.id IN (
+            SELECT q.poll_id FROM new_choices n JOIN old_choices o ON o.id = n.id
+            JOIN polls_question q ON q.id IN (n.question_id, o.question_id)
+            WHERE n.text IS DISTINCT FROM o.text OR n.question_id IS DISTINCT FROM o.question_id
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+] + [
+    f"""
+    CREATE TRIGGER polls_{table}_search_update AFTER UPDATE ON polls_{table}
+    REFERENCING OLD TABLE AS old_{table}s NEW TABLE AS new_{table}s
+    FOR EACH STATEMENT EXECUTE FUNCTION polls_{table}_search_update_refresh()
+    """
+    for table in ('question', 'choice')
+]
+
+# PostgreSQL: a weighted tsvector on polls_poll covering the poll, its
+# questions and its choices, with a GIN index. Statement-level triggers with
+# transition tables refresh each affected poll once per statement, so
+# bulk_create batches cost one refresh per poll rather than one per row.
+POSTGRES_FORWARD = [
+    "ALTER TABLE polls_poll ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION polls_poll_search_vector(p_id bigint, p_title text, p_description text)
+    RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('english', coalesce(p_title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(p_description, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(
+                (SELECT string_agg(q.text, ' ') FROM polls_question q WHERE q.poll_id = p_id), ''
+            )), 'C')
+            || setweight(to_tsvector('english', coalesce(
+                (SELECT string_agg(c.text, ' ') FROM polls_choice c
+                 JOIN polls_question q ON q.id = c.question_id WHERE q.poll_id = p_id), ''
+            )), 'D')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE FUNCTION polls_poll_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := polls_poll_search_vector(NEW.id, NEW.title, NEW.description);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER polls_poll_search_update BEFORE INSERT OR UPDATE OF title, description ON polls_poll
+    FOR EACH ROW EXECUTE FUNCTION polls_poll_search_update()
+    """,
+    """
+    CREATE FUNCTION polls_question_search_refresh() RETURNS trigger AS $$
+    BEGIN
+        UPDATE polls_poll p SET search_vector = polls_poll_search_vector(p.id, p.title, p.description)
+        WHERE p.id IN (SELECT poll_id FROM changed_questions);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION polls_choice_search_refresh() RETURNS trigger AS $$
+    BEGIN
+        UPDATE polls_poll p SET search_vector = polls_poll_search_vector(p.id, p.title, p.description)
+        WHERE p.id IN (
+            SELECT q.poll_id FROM polls_question q JOIN changed_choices c ON c.question_id = q.id
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+] + [
+    f"""
+    CREATE TRIGGER polls_{table}_search_{event.lower()} AFTER {event} ON polls_{table}
+    REFERENCING {'OLD' if event == 'DELETE' else 'NEW'} TABLE AS changed_{table}s
+    FOR EACH STATEMENT EXECUTE FUNCTION polls_{table}_search_refresh()
+    """
+    for table in ('question', 'choice')
+    for event in ('INSERT', 'DELETE')
+] + POSTGRES_UPDATE_TRIGGERS + [
+] + [
+    "UPDATE polls_poll SET search_vector = polls_poll_search_vector(id, title, description)",
+    "CREATE INDEX polls_poll_search_idx ON polls_poll USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER polls_poll_search_update ON polls_poll",
+] + [
+    f"DROP TRIGGER polls_{table}_search_{event} ON polls_{table}"
+    for table in ('question', 'choice')
+    for event in ('insert', 'update', 'delete')
+] + [
+    "DROP FUNCTION polls_poll_search_update()",
+    "DROP FUNCTION polls_question_search_refresh()",
+    "DROP FUNCTION polls_choice_search_refresh()",
+    "DROP FUNCTION polls_question_search_update_refresh()",
+    "DROP FUNCTION polls_choice_search_update_refresh()",
+    "DROP FUNCTION polls_poll_search_vector(bigint, text, text)",
+    "ALTER TABLE polls_poll DROP COLUMN search_vector",
+]
+
+
+# SQLite (development and tests): an FTS5 table keyed by poll id, kept current
+# by row-level triggers. Table rebuilds of polls_poll in later migrations drop
+# its triggers, so they must be recreated there.
+SQLITE_QUESTIONS = "coalesce((SELECT group_concat(text, ' ') FROM polls_question WHERE poll_id = {poll_id}), '')"
+SQLITE_CHOICES = (
+    "coalesce((SELECT group_concat(c.text, ' ') FROM polls_choice c "
+    "JOIN polls_question q ON q.id = c.question_id WHERE q.poll_id = {poll_id}), '')"
+)
+SQLITE_CHOICE_POLL = "(SELECT poll_id FROM polls_question WHERE id = {row}.question_id)"
+# Updates only refresh when the text or the parent changes, not on vote counter writes
+SQLITE_QUESTION_EVENTS = (('insert', 'INSERT', 'NEW'), ('update', 'UPDATE OF text, poll_id', 'NEW'), ('delete', 'DELETE', 'OLD'))
+SQLITE_CHOICE_EVENTS = (('insert', 'INSERT', 'NEW'), ('update', 'UPDATE OF text, question_id', 'NEW'), ('delete', 'DELETE', 'OLD'))
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE polls_poll_fts USING fts5(title, description, questions, choices, tokenize='porter unicode61')",
+    f"""
+    INSERT INTO polls_poll_fts (rowid, title, description, questions, choices)
+    SELECT p.id, p.title, coalesce(p.description, ''),
+        {SQLITE_QUESTIONS.format(poll_id='p.id')}, {SQLITE_CHOICES.format(poll_id='p.id')}
+    FROM polls_poll p
+    """,
+    """
+    CREATE TRIGGER polls_poll_fts_insert AFTER INSERT ON polls_poll BEGIN
+        INSERT INTO polls_poll_fts (rowid, title, description, questions, choices)
+        VALUES (NEW.id, NEW.title, coalesce(NEW.description, ''), '', '');
+    END
+    """,
+    """
+    CREATE TRIGGER polls_poll_fts_update AFTER UPDATE OF title, description ON polls_poll BEGIN
+        UPDATE polls_poll_fts SET title = NEW.title, description = coalesce(NEW.description, '')
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_poll_fts_delete AFTER DELETE ON polls_poll BEGIN
+        DELETE FROM polls_poll_fts WHERE rowid = OLD.id;
+    END
+    """,
+] + [
+    f"""
+    CREATE TRIGGER polls_question_fts_{name} AFTER {event} ON polls_question BEGIN
+        UPDATE polls_poll_fts SET questions = {SQLITE_QUESTIONS.format(poll_id=f'{row}.poll_id')}
+        WHERE rowid = {row}.poll_id;
+    END
+    """
+    for name, event, row in SQLITE_QUESTION_EVENTS
+] + [
+    f"""
+    CREATE TRIGGER polls_choice_fts_{name} AFTER {event} ON polls_choice BEGIN
+        UPDATE polls_poll_fts SET choices = {SQLITE_CHOICES.format(poll_id='polls_poll_fts.rowid')}
+        WHERE rowid = {SQLITE_CHOICE_POLL.format(row=row)};
+    END
+    """
+    for name, event, row in SQLITE_CHOICE_EVENTS
+]
+SQLITE_UPDATE_TRIGGERS = [
+    sql for sql in SQLITE_FORWARD
+    if 'TRIGGER polls_question_fts_update' in sql or 'TRIGGER polls_choice_fts_update' in sql
+]
+
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER polls_{table}_fts_{event}"
+    for table in ('poll', 'question', 'choice')
+    for event in ('insert', 'update', 'delete')
+] + [
+    "DROP TABLE polls_poll_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_poll_pagination_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_poll_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='poll',
+            name='poll_active_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='choicevoteshard',
+            index=models.Index(condition=models.Q(('count__gt', 0)), fields=['choice'], name='shard_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='poll_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['question', 'choice'], name='vote_question_choice_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['created_at'], name='vote_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voterollup',
+            index=models.Index(fields=['resolution', 'bucket_start', 'poll', 'count'], name='rollup_resolution_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voterollup',
+            index=models.Index(fields=['resolution', 'poll', 'count'], name='rollup_resolution_poll_idx'),
+        ),
+    ]
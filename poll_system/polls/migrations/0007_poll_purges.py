@@ -0,0 +1,74 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:37
+
+import django.db.models.deletion
+from importlib import import_module
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Adding Poll.state rebuilds polls_poll on SQLite, which drops the full-text
+# search triggers 0005 created on it
+search = import_module('polls.migrations.0005_poll_search')
+SQLITE_POLL_TRIGGERS = [sql for sql in search.SQLITE_FORWARD if 'ON polls_poll BEGIN' in sql]
+
+
+def restore_poll_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_POLL_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollPurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('poll_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('reset', 'Reset'), ('delete', 'Delete')], max_length=6)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=7)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('partial', models.BooleanField(default=False)),
+                ('votes_total', models.BigIntegerField(default=0)),
+                ('votes_deleted', models.BigIntegerField(default=0)),
+                ('choice_cursor', models.BigIntegerField(default=0)),
+                ('vote_cursor', models.BigIntegerField(default=0)),
+                ('error', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        # Unapplying removes the field, another rebuild, after this runs
+        migrations.RunPython(migrations.RunPython.noop, restore_poll_triggers),
+        migrations.AddField(
+            model_name='poll',
+            name='state',
+            field=models.CharField(choices=[('ready', 'Ready'), ('resetting', 'Resetting'), ('deleting', 'Deleting')], default='ready', max_length=9),
+        ),
+        migrations.RunPython(restore_poll_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['choice', 'id'], name='vote_choice_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='choice',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='polls.choice'),
+        ),
+        migrations.AddField(
+            model_name='pollpurge',
+            name='requested_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='poll_purges', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='pollpurge',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'running'])), fields=['updated_at'], name='purge_unfinished_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_poll_purges'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_id', models.BigIntegerField()),
+                ('question_text', models.CharField(max_length=600)),
+                ('choice_id', models.BigIntegerField(null=True)),
+                ('choice_text', models.CharField(blank=True, max_length=300)),
+                ('votes_count', models.IntegerField(default=0)),
+                ('percentage', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(condition=models.Q(('end_date__isnull', False), ('is_active', True)), fields=['end_date'], name='poll_active_end_idx'),
+        ),
+        migrations.AddField(
+            model_name='choiceresult',
+            name='poll',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='polls.poll'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='choiceresult',
+            unique_together={('poll', 'question_id', 'choice_id')},
+        ),
+    ]
@@ -0,0 +1,35 @@
+from importlib import import_module
+from django.db import migrations
+
+
+# The question and choice UPDATE triggers 0005 first created refreshed a
+# poll's search text on any update, vote counter writes included. Replaces
+# them on databases that already have them with the ones 0005 now creates.
+search = import_module('polls.migrations.0005_poll_search')
+
+FORWARD = {
+    'postgresql': [
+        "DROP TRIGGER IF EXISTS polls_question_search_update ON polls_question",
+        "DROP TRIGGER IF EXISTS polls_choice_search_update ON polls_choice",
+    ] + search.POSTGRES_UPDATE_TRIGGERS,
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS polls_question_fts_update",
+        "DROP TRIGGER IF EXISTS polls_choice_fts_update",
+    ] + search.SQLITE_UPDATE_TRIGGERS,
+}
+
+
+def run(apps, schema_editor):
+    for sql in FORWARD.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_poll_results'),
+    ]
+
+    operations = [
+        migrations.RunPython(run, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,25 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import F
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+class PollQuerySet(models.QuerySet):
+    def visible(self):
+        """Polls that can be read: active ones, and closed ones with their final results unless being deleted."""
+        return self.filter(Q(is_active=True) | Q(closed_at__isnull=False)).exclude(state=Poll.State.DELETING)
+
 
 class Poll(models.Model):
     """
     Model for a Poll, including ownership, activity status, and timestamps.
     """
+    class State(models.TextChoices):
+        READY = 'ready'
+        # A PollPurge job is deleting the poll's votes (see purges.py)
+        RESETTING = 'resetting'
+        DELETING = 'deleting'
+
     title = models.CharField(max_length=200)
     description = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -14,10 +27,30 @@ class Poll(models.Model):
     end_date = models.DateTimeField('date ended', null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
+    state = models.CharField(max_length=9, choices=State.choices, default=State.READY)
+    # Set, along with is_active=False, when the poll's results are frozen (see results.py)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PollQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of active polls, newest first. Partial, so
+            # closed polls cost nothing to skip.
+            models.Index(fields=['-created_at', '-id'], condition=Q(is_active=True), name='poll_active_recent_idx'),
+            # The close-out task's search for active polls past their end date
+            models.Index(fields=['end_date'], condition=Q(is_active=True, end_date__isnull=False), name='poll_active_end_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def is_closed(self, now=None):
+        """Closed to votes: closed out, or past its end date and about to be."""
+        if self.closed_at is not None:
+            return True
+        return self.end_date is not None and self.end_date <= (now or timezone.now())
+
 
 class Question(models.Model):
     """
@@ -30,19 +63,60 @@ class Question(models.Model):
         return self.text
 
 
+class ChoiceQuerySet(models.QuerySet):
+    def with_total_votes(self):
+        """
+        Annotates 'total_votes': the compacted votes_count plus whatever is
+        still sitting in the counter shards.
+        """
+        return self.annotate(
+            total_votes=F('votes_count') + Coalesce(Sum('vote_shards__count'), Value(0))
+        )
+
+
 class Choice(models.Model):
     """
     A choice for a question. 
     Includes a denormalized 'votes_count' field for fast result computation.
+    Recent increments live in ChoiceVoteShard rows until they are compacted into it.
     """
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='choices')
     text = models.CharField(max_length=300)
     
     votes_count = models.IntegerField(default=0) 
 
+    objects = ChoiceQuerySet.as_manager()
     
     def __str__(self):
         return self.text
+
+    def current_votes(self):
+        """
+        Returns the live vote total. Uses the 'total_votes' annotation when the
+        choice was loaded through with_total_votes(), otherwise sums the shards.
+        """
+        total = getattr(self, 'total_votes', None)
+        if total is None:
+            shard_total = self.vote_shards.aggregate(total=Sum('count'))['total'] or 0
+            total = self.votes_count + shard_total
+        return total
+
+
+class ChoiceVoteShard(models.Model):
+    """
+    One of VOTE_COUNTER_SHARDS counter rows for a choice. Spreading increments
+    across shards keeps concurrent votes from queueing on a single row lock.
+    """
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='vote_shards')
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('choice', 'shard')
+        indexes = [
+            # Compaction only looks at shards holding uncompacted votes
+            models.Index(fields=['choice'], condition=Q(count__gt=0), name='shard_pending_idx'),
+        ]
     
 
 class Vote(models.Model):
@@ -50,10 +124,125 @@ class Vote(models.Model):
     Tracks a single vote by a user for a choice on a question.
     """
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
-    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='votes')
+    # Indexed by vote_choice_id_idx
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='votes', db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         # Ensures a user can only vote once per question
-        unique_together = ('question', 'user')
\ No newline at end of file
+        unique_together = ('question', 'user')
+        indexes = [
+            # Covers per-poll vote counts and "has this poll any votes" checks
+            models.Index(fields=['question', 'choice'], name='vote_question_choice_idx'),
+            # Stands in for the choice foreign key's index, and lets purges
+            # walk a choice's votes in id order
+            models.Index(fields=['choice', 'id'], name='vote_choice_id_idx'),
+            # Date filtering in the admin
+            models.Index(fields=['created_at'], name='vote_created_idx'),
+        ]
+
+class VoteRollup(models.Model):
+    """
+    Votes per choice per time bucket, at minute, hour and day resolution.
+    Maintained by the rollup_votes task from votes past its watermark, so
+    timelines never have to group the Vote table.
+    """
+    class Resolution(models.TextChoices):
+        MINUTE = 'minute'
+        HOUR = 'hour'
+        DAY = 'day'
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='vote_rollups')
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='vote_rollups')
+    resolution = models.CharField(max_length=6, choices=Resolution.choices)
+    bucket_start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('choice', 'resolution', 'bucket_start')
+        indexes = [
+            # Serves the timeline range query for a poll
+            models.Index(fields=['poll', 'resolution', 'bucket_start'], name='rollup_poll_range_idx'),
+            # Cover the trending rebuild, which reads one resolution across all
+            # polls: recent hourly buckets, and all-time totals per poll
+            models.Index(fields=['resolution', 'bucket_start', 'poll', 'count'], name='rollup_resolution_range_idx'),
+            models.Index(fields=['resolution', 'poll', 'count'], name='rollup_resolution_poll_idx'),
+        ]
+
+
+class ChoiceResult(models.Model):
+    """
+    Final votes of one choice of a closed poll, written once when the poll
+    closes (see results.py). Texts are copied, so the results read the same
+    whatever happens to the questions and choices later. A question without
+    choices is kept as a row without a choice.
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='results')
+    question_id = models.BigIntegerField()
+    question_text = models.CharField(max_length=600)
+    choice_id = models.BigIntegerField(null=True)
+    choice_text = models.CharField(max_length=300, blank=True)
+    votes_count = models.IntegerField(default=0)
+    # Share of the question's votes, rounded to two decimals like the live stats
+    percentage = models.FloatField(default=0)
+
+    class Meta:
+        # Also serves reading a poll's results in order
+        unique_together = ('poll', 'question_id', 'choice_id')
+
+
+class RollupWatermark(models.Model):
+    """
+    Highest Vote id already folded into the rollups, one row per rollup job.
+    gaps holds [vote_id, first_seen] pairs for ids below last_vote_id that had
+    no vote yet, rechecked until VOTE_ROLLUP_GAP_TIMEOUT, so a vote whose
+    transaction commits after a later one is still rolled up.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_vote_id = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class PollPurge(models.Model):
+    """
+    A background deletion of a poll's votes, run in short chunks by the
+    purge_poll task (see purges.py), for a vote reset or a poll deletion.
+    Kept after the poll is gone so its status can still be read.
+    """
+    class Kind(models.TextChoices):
+        RESET = 'reset'
+        DELETE = 'delete'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    # Not a foreign key, the job outlives a deleted poll
+    poll_id = models.BigIntegerField()
+    kind = models.CharField(max_length=6, choices=Kind.choices)
+    status = models.CharField(max_length=7, choices=Status.choices, default=Status.PENDING)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='poll_purges')
+    # A reset's poll update, applied once the votes are gone
+    payload = models.JSONField(null=True, blank=True)
+    partial = models.BooleanField(default=False)
+    votes_total = models.BigIntegerField(default=0)
+    votes_deleted = models.BigIntegerField(default=0)
+    # Resume point: the choice being purged and the last vote id deleted from it
+    choice_cursor = models.BigIntegerField(default=0)
+    vote_cursor = models.BigIntegerField(default=0)
+    error = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The resume task looks for unfinished jobs; finished ones are skipped
+            models.Index(
+                fields=['updated_at'], condition=Q(status__in=['pending', 'running']), name='purge_unfinished_idx',
+            ),
+        ]
@@ -0,0 +1,106 @@
+"""
+Keyset pagination for the API.
+
+Pages are located by the position of the last row seen rather than by an
+offset, so fetching page N costs one index range scan of page_size rows no
+matter how deep N is. Search results, ordered by relevance rather than by a
+column, are the exception: see SearchPagination.
+"""
+import base64
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PollCursorPagination(CursorPagination):
+    """Newest polls first, served from the (is_active, created_at, id) index."""
+    ordering = ('-created_at', '-id')
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class IdCursorPagination(CursorPagination):
+    """Primary key order, for tables without a meaningful timestamp."""
+    ordering = 'id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class SearchPagination(BasePagination):
+    """
+    Offset pages over ranked search results. Fetches one row past the page to
+    know whether there is a next one, so no COUNT runs, and stops at
+    SEARCH_MAX_OFFSET.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+    offset_query_param = 'offset'
+
+    def _param(self, request, name, default):
+        try:
+            value = int(request.query_params[name])
+        except (KeyError, ValueError):
+            return default
+        return value if value >= 0 else default
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = min(self._param(request, self.page_size_query_param, self.page_size) or self.page_size, self.max_page_size)
+        self.offset = min(self._param(request, self.offset_query_param, 0), settings.SEARCH_MAX_OFFSET)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit and self.offset + self.limit <= settings.SEARCH_MAX_OFFSET
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_previous_link(self):
+        if self.offset <= 0:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.offset - self.limit <= 0:
+            return remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.offset_query_param, self.offset - self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+def encode_poll_cursor(poll):
+    """Opaque cursor pointing just past the given poll in newest-first order."""
+    position = f'{poll.created_at.isoformat()}|{poll.pk}'
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_poll_cursor(cursor):
+    """Returns (created_at, id) for a cursor, raising ValueError if it is malformed."""
+    try:
+        created_at, poll_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        created_at, poll_id = parse_datetime(created_at), int(poll_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor.')
+    if created_at is None:
+        raise ValueError('Invalid cursor.')
+    return created_at, poll_id
+
+
+def polls_after(queryset, cursor=None):
+    """Orders polls newest first and, given a cursor, keeps only the polls past it."""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, poll_id = decode_poll_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=poll_id))
+    return queryset
@@ -0,0 +1,219 @@
+"""
+Chunked background purges of a poll's votes, for vote resets and poll
+deletion (see PollViewSet.perform_update and perform_destroy).
+
+begin() runs in the request: it marks the poll resetting or deleting, zeroes
+its counters and records a PollPurge job, so the request only touches a
+handful of rows. The purge_poll task then runs the job:
+
+1. Votes, one choice at a time in id order, POLL_PURGE_CHUNK_SIZE per
+   short transaction. The job's cursor is saved with every chunk, so a job
+   picks up where it stopped after a crash or a redelivery.
+2. Vote rollups of the poll, in chunks as well.
+3. finish(): a reset zeroes the counters once more, for votes that were
+   committing when it began, applies the poll update that asked for the reset
+   and returns the poll to ready. A deletion deletes the poll, which has
+   nothing left to cascade to but its questions and choices. If finishing
+   fails for any reason but a lost database connection, fail() marks the job
+   failed and returns the poll to ready, and active again after a deletion,
+   rather than leaving the job to be retried forever.
+
+While a job runs, the poll takes no votes, and reads treat it as already
+reset: counters are zero, stats count no votes and the timeline is empty.
+A deleted poll is deactivated at once, so it is gone from every read.
+
+Jobs read from the primary: the choices left to purge and the final check
+for votes behind the cursor run outside transactions, and a lagging replica
+would let a job finish with votes or rollups still in place.
+"""
+import logging
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.exceptions import ValidationError
+from .models import Poll, Choice, ChoiceVoteShard, Vote, VoteRollup, PollPurge
+from .serializers import PollSerializer
+from . import generations, routers, tallies, trending
+
+
+logger = logging.getLogger(__name__)
+
+STATES = {
+    PollPurge.Kind.RESET: Poll.State.RESETTING,
+    PollPurge.Kind.DELETE: Poll.State.DELETING,
+}
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def job_lock(job_id, conn=None):
+    """Lock that keeps a single worker running a job at a time."""
+    conn = conn or get_connection()
+    return conn.lock(f'polls:purge:{job_id}:lock', timeout=settings.POLL_PURGE_STALL_TIMEOUT)
+
+
+def forget_poll(poll_id):
+    """Drops what Redis holds about a poll's votes, and its cached renders."""
+    tallies.drop_poll_tallies(poll_id)
+    trending.remove_polls(poll_id)
+    generations.bump(poll_id, generations.ALL_POLLS)
+
+
+def zero_counters(poll_id):
+    Choice.objects.filter(question__poll_id=poll_id).update(votes_count=0)
+    ChoiceVoteShard.objects.filter(choice__question__poll_id=poll_id).delete()
+
+
+def begin(poll, kind, user, payload=None, partial=False):
+    """
+    Marks a poll for a purge and returns its job. Must run in a transaction;
+    the caller queues the job once it commits.
+    """
+    votes_total = (
+        (Choice.objects.filter(question__poll=poll).aggregate(total=Sum('votes_count'))['total'] or 0)
+        + (ChoiceVoteShard.objects.filter(choice__question__poll=poll).aggregate(total=Sum('count'))['total'] or 0)
+    )
+    update = {'state': STATES[kind]}
+    if kind == PollPurge.Kind.DELETE:
+        update['is_active'] = False
+    Poll.objects.filter(pk=poll.pk).update(**update)
+    zero_counters(poll.pk)
+
+    job = PollPurge.objects.create(
+        poll_id=poll.pk, kind=kind, requested_by=user, payload=payload, partial=partial, votes_total=votes_total,
+    )
+    transaction.on_commit(lambda: forget_poll(poll.pk))
+    logger.info(f"Started {kind} purge {job.pk} of poll {poll.pk} ({votes_total} votes)")
+    return job
+
+
+def delete_chunk(queryset, chunk_size):
+    """Deletes the first chunk_size rows of queryset in id order. Returns their ids."""
+    ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+    if ids:
+        queryset.model.objects.filter(id__in=ids).delete()
+    return ids
+
+
+def purge_votes(job, chunk_size, max_chunks):
+    """
+    Deletes up to max_chunks chunks of the job's votes, saving the cursor with
+    each. Returns the number of chunks used, or None if votes remain.
+    """
+    choice_ids = list(
+        Choice.objects.filter(question__poll_id=job.poll_id, id__gte=job.choice_cursor)
+        .order_by('id').values_list('id', flat=True)
+    )
+    chunks = 0
+    for choice_id in choice_ids:
+        if choice_id != job.choice_cursor:
+            job.choice_cursor, job.vote_cursor = choice_id, 0
+        while True:
+            if chunks == max_chunks:
+                job.save(update_fields=['choice_cursor', 'vote_cursor', 'updated_at'])
+                return None
+            with transaction.atomic():
+                # A range scan of vote_choice_id_idx
+                ids = delete_chunk(Vote.objects.filter(choice_id=choice_id, id__gt=job.vote_cursor), chunk_size)
+                if not ids:
+                    break
+                chunks += 1
+                job.vote_cursor = ids[-1]
+                job.votes_deleted += len(ids)
+                job.save(update_fields=['choice_cursor', 'vote_cursor', 'votes_deleted', 'updated_at'])
+
+    # Votes committing as the purge began can have ids behind the cursor
+    if Vote.objects.filter(question__poll_id=job.poll_id).exists():
+        job.choice_cursor, job.vote_cursor = 0, 0
+        job.save(update_fields=['choice_cursor', 'vote_cursor', 'updated_at'])
+        return None
+    return chunks
+
+
+def purge_rollups(job, chunk_size, max_chunks):
+    """Deletes up to max_chunks chunks of the poll's rollups. Returns True once none are left."""
+    for _ in range(max_chunks):
+        if not delete_chunk(VoteRollup.objects.filter(poll_id=job.poll_id), chunk_size):
+            return True
+        job.save(update_fields=['updated_at'])
+    return False
+
+
+def apply_update(job, poll):
+    """Applies the poll update a reset was asked for with. Returns its errors, if any."""
+    serializer = PollSerializer(poll, data=job.payload, partial=job.partial)
+    try:
+        # A savepoint, so a failed update leaves the reset itself in place
+        with transaction.atomic():
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+    except ValidationError as exc:
+        return exc.detail
+    return None
+
+
+@transaction.atomic
+def finish(job):
+    poll = Poll.objects.select_for_update().filter(pk=job.poll_id).first()
+    if poll is not None:
+        if job.kind == PollPurge.Kind.DELETE:
+            poll.delete()
+        else:
+            zero_counters(poll.pk)
+            if job.payload is not None:
+                job.error = apply_update(job, poll)
+            Poll.objects.filter(pk=poll.pk).update(state=Poll.State.READY)
+
+    job.status = PollPurge.Status.FAILED if job.error else PollPurge.Status.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    transaction.on_commit(lambda: forget_poll(job.poll_id))
+
+
+@transaction.atomic
+def fail(job, error):
+    """Gives up on a job whose finish() raised, returning its poll to ready."""
+    update = {'state': Poll.State.READY}
+    if job.kind == PollPurge.Kind.DELETE:
+        update['is_active'] = True
+    Poll.objects.filter(pk=job.poll_id).update(**update)
+
+    job.status = PollPurge.Status.FAILED
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    transaction.on_commit(lambda: forget_poll(job.poll_id))
+
+
+def run(job, chunk_size=None, max_chunks=None):
+    """
+    Advances a job by at most max_chunks chunks. Returns True once the job is
+    finished, False when it has work left.
+    """
+    chunk_size = chunk_size or settings.POLL_PURGE_CHUNK_SIZE
+    max_chunks = max_chunks or settings.POLL_PURGE_CHUNKS_PER_TASK
+    if job.status in (PollPurge.Status.DONE, PollPurge.Status.FAILED):
+        return True
+    if job.status == PollPurge.Status.PENDING:
+        job.status = PollPurge.Status.RUNNING
+        job.save(update_fields=['status', 'updated_at'])
+
+    with routers.primary():
+        chunks = purge_votes(job, chunk_size, max_chunks)
+        if chunks is None or not purge_rollups(job, chunk_size, max_chunks - chunks):
+            return False
+        try:
+            finish(job)
+        except (OperationalError, InterfaceError):
+            # The database is unreachable; the job is resumed later
+            raise
+        except Exception as exc:
+            logger.exception(f"Finishing {job.kind} purge {job.pk} of poll {job.poll_id} failed")
+            fail(job, {'error': str(exc)})
+            return True
+    logger.info(f"Finished {job.kind} purge {job.pk} of poll {job.poll_id}: {job.votes_deleted} votes deleted")
+    return True
@@ -0,0 +1,127 @@
+"""
+Read-optimized serialization for the hot read endpoints.
+
+Builds exactly the output of PollSerializer, QuestionSerializer and
+ChoiceSerializer from values_list() tuples grouped in plain dicts, without
+creating model instances or running the serializer field machinery. Writes
+and validation keep going through the serializers.
+
+Every builder takes the fields to include and which relations to nest, so a
+sparse request only selects the columns it needs and skips the queries for
+relations it does not expand.
+"""
+from collections import defaultdict
+from typing import NamedTuple
+from rest_framework import serializers
+from .models import Question, Choice
+
+
+# Non-relation fields in the serializers' Meta.fields order; relations come last
+POLL_FIELDS = ('id', 'title', 'description', 'created_at', 'updated_at', 'end_date', 'created_by', 'is_active')
+QUESTION_FIELDS = ('id', 'text', 'poll')
+CHOICE_FIELDS = ('id', 'text', 'question', 'votes_count')
+
+# Relations each builder can nest, as ?expand= paths
+POLL_EXPANSIONS = ('questions', 'questions.choices')
+QUESTION_EXPANSIONS = ('choices',)
+
+
+class Fieldset(NamedTuple):
+    """The fields and expanded relations of a response, in canonical order."""
+    fields: tuple
+    expand: tuple
+
+    @property
+    def key(self):
+        return ','.join(self.fields) + '/' + ','.join(self.expand)
+
+
+POLL_FIELDSET = Fieldset(POLL_FIELDS, POLL_EXPANSIONS)
+QUESTION_FIELDSET = Fieldset(QUESTION_FIELDS, QUESTION_EXPANSIONS)
+
+# values_list() lookup of each field, where it differs from the field name
+COLUMNS = {
+    'created_by': 'created_by__username',
+    'poll': 'poll_id',
+    'question': 'question_id',
+    'votes_count': 'total_votes',
+}
+
+# Formats datetimes exactly like the serializers do
+_datetime = serializers.DateTimeField()
+FORMATTERS = {field: _datetime.to_representation for field in ('created_at', 'updated_at', 'end_date')}
+
+
+def _columns(fields):
+    return [COLUMNS.get(field, field) for field in fields]
+
+
+def _grouped(queryset, parent_column, fields):
+    """
+    Selects (parent id, own id, *fields) rows and returns them as
+    ({parent id: [own ids]}, {own id: data dict}).
+    """
+    formatters = [(field, FORMATTERS.get(field)) for field in fields]
+    children, data = defaultdict(list), {}
+    for parent_id, own_id, *values in queryset.values_list(parent_column, 'id', *_columns(fields)):
+        children[parent_id].append(own_id)
+        data[own_id] = {
+            field: formatter(value) if formatter else value
+            for (field, formatter), value in zip(formatters, values)
+        }
+    return children, data
+
+
+def _nest(data, children, key, nested):
+    for own_id, item in data.items():
+        item[key] = [nested[child_id] for child_id in children[own_id]]
+
+
+def choice_data(queryset, fields=CHOICE_FIELDS):
+    """ChoiceSerializer output for a with_total_votes() queryset, by id."""
+    _, choices = _grouped(queryset.order_by('id'), 'id', fields)
+    return list(choices.values())
+
+
+def question_data(queryset, fieldset=QUESTION_FIELDSET):
+    """QuestionSerializer output for a queryset, by id, with choices fetched in one query."""
+    _, questions = _grouped(queryset.prefetch_related(None).order_by('id'), 'id', fieldset.fields)
+    if 'choices' in fieldset.expand:
+        choice_ids, choices = _grouped(
+            Choice.objects.with_total_votes().filter(question_id__in=list(questions)).order_by('id'),
+            'question_id', CHOICE_FIELDS,
+        )
+        _nest(questions, choice_ids, 'choices', choices)
+    return list(questions.values())
+
+
+def polls_by_id(queryset, fieldset=POLL_FIELDSET):
+    """
+    PollSerializer output for the polls of queryset, as {poll id: data} in
+    queryset order. Keyed by id whether or not the fieldset renders it. Takes
+    one query, plus one per expanded level.
+    """
+    rows = queryset.prefetch_related(None).values_list('id', *_columns(fieldset.fields))
+    formatters = [(field, FORMATTERS.get(field)) for field in fieldset.fields]
+    polls = {
+        poll_id: {field: formatter(value) if formatter else value for (field, formatter), value in zip(formatters, values)}
+        for poll_id, *values in rows
+    }
+
+    if 'questions' in fieldset.expand:
+        question_ids, questions = _grouped(
+            Question.objects.filter(poll_id__in=list(polls)).order_by('id'), 'poll_id', QUESTION_FIELDS,
+        )
+        if 'questions.choices' in fieldset.expand:
+            choice_ids, choices = _grouped(
+                Choice.objects.with_total_votes().filter(question_id__in=list(questions)).order_by('id'),
+                'question_id', CHOICE_FIELDS,
+            )
+            _nest(questions, choice_ids, 'choices', choices)
+        _nest(polls, question_ids, 'questions', questions)
+    return polls
+
+
+def poll_data(queryset, fieldset=POLL_FIELDSET):
+    """PollSerializer output for the polls of queryset, in queryset order."""
+    return list(polls_by_id(queryset, fieldset).values())
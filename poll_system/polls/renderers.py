@@ -0,0 +1,104 @@
+"""
+Fast JSON rendering and parsing for the REST API and GraphQL.
+
+Uses orjson when it is installed and falls back to the stdlib json module
+otherwise. Either way the bytes match DRF's compact JSONRenderer output, so
+cached fragments, ETags and clients see no difference between the two.
+
+Also holds the CSV and NDJSON renderers that let exports negotiate ?format=.
+"""
+import csv
+import io
+from django.conf import settings
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders, json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# DRF escapes these so JSON stays valid inside <script> tags
+_LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+_encoder = encoders.JSONEncoder()
+
+
+def _escape_separators(content):
+    for raw, escaped in _LINE_SEPARATORS:
+        if raw in content:
+            content = content.replace(raw, escaped)
+    return content
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes, encoding non-JSON types the way DRF does."""
+    if orjson is not None and settings.FAST_JSON_ENABLED:
+        # OPT_UTC_Z writes UTC datetimes with a 'Z' suffix, like DRF's encoder
+        content = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    else:
+        content = json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    return _escape_separators(content)
+
+
+def loads(content):
+    """Parses JSON bytes or str, raising ValueError when it is malformed."""
+    if orjson is not None and settings.FAST_JSON_ENABLED:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer that writes compact responses with dumps(). Indented output,
+    requested with '; indent=' in the Accept header, still goes through DRF.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(parsers.JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """One JSON document per line. Exports stream their own rows; this renders errors."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join(dumps(item) + b'\n' for item in items)
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """A header row and a row per dict. Exports stream their own rows; this renders errors."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        if items:
+            writer = csv.DictWriter(buffer, fieldnames=list(items[0]))
+            writer.writeheader()
+            writer.writerows(items)
+        return buffer.getvalue().encode()
@@ -0,0 +1,137 @@
+"""
+Closing polls past their end date, and serving their final results.
+
+The close_expired_polls task closes each poll whose end_date passed more than
+POLL_CLOSE_GRACE ago, giving votes queued before the end time to land, in one
+transaction per poll:
+
+- Choice.votes_count is rebuilt from the Vote table, and the counter shards
+  are dropped.
+- The results are frozen into ChoiceResult rows: per-choice counts and
+  percentages, with the question and choice texts.
+- The poll is deactivated and stamped with closed_at.
+
+Once it commits, the poll's live tallies and trending scores are dropped and
+its generation is closed (see generations.py). A closed poll takes no votes
+and nothing invalidates it again. Its stats are read from the ChoiceResult
+rows, its detail is rendered once from the rebuilt counts, and both are sent
+as immutable.
+"""
+import logging
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import Poll, Question, Choice, ChoiceVoteShard, ChoiceResult
+from . import generations, tallies, trending
+
+
+logger = logging.getLogger(__name__)
+
+
+def percentage(votes, total):
+    """A share of total in percent, rounded half up to two decimals like the live stats."""
+    if total > 0:
+        return math.floor(votes / total * 10000 + 0.5) / 100
+    return 0
+
+
+def closed(poll_id):
+    tallies.drop_poll_tallies(poll_id)
+    trending.remove_polls(poll_id)
+    generations.close(poll_id)
+    generations.bump(generations.ALL_POLLS)
+
+
+@transaction.atomic
+def close_poll(poll_id, now=None):
+    """Freezes the results of an active poll and closes it. Returns False if it was not open."""
+    now = now or timezone.now()
+    poll = Poll.objects.select_for_update().filter(
+        pk=poll_id, is_active=True, closed_at__isnull=True, state=Poll.State.READY,
+    ).first()
+    if poll is None:
+        return False
+
+    vote_counts = tallies.count_votes(poll_id)
+    questions = Question.objects.filter(poll_id=poll_id).order_by('id').prefetch_related('choices')
+    choices, results = [], []
+    for question in questions:
+        question_choices = sorted(question.choices.all(), key=lambda choice: choice.id)
+        total = sum(vote_counts.get(choice.id, 0) for choice in question_choices)
+        for choice in question_choices:
+            choice.votes_count = vote_counts.get(choice.id, 0)
+            choices.append(choice)
+            results.append(ChoiceResult(
+                poll=poll, question_id=question.id, question_text=question.text,
+                choice_id=choice.id, choice_text=choice.text,
+                votes_count=choice.votes_count, percentage=percentage(choice.votes_count, total),
+            ))
+        if not question_choices:
+            results.append(ChoiceResult(poll=poll, question_id=question.id, question_text=question.text))
+
+    Choice.objects.bulk_update(choices, ['votes_count'])
+    ChoiceVoteShard.objects.filter(choice__question__poll_id=poll_id).delete()
+    ChoiceResult.objects.bulk_create(results)
+    Poll.objects.filter(pk=poll_id).update(is_active=False, closed_at=now, updated_at=now)
+    transaction.on_commit(lambda: closed(poll_id))
+    return True
+
+
+def close_expired_polls(now=None, limit=None):
+    """Closes up to limit polls past their end date and grace period. Returns how many were closed."""
+    now = now or timezone.now()
+    limit = limit or settings.POLL_CLOSE_BATCH_SIZE
+    poll_ids = list(
+        Poll.objects.filter(
+            is_active=True, end_date__lte=now - timedelta(seconds=settings.POLL_CLOSE_GRACE),
+            closed_at__isnull=True, state=Poll.State.READY,
+        ).order_by('end_date').values_list('id', flat=True)[:limit]
+    )
+    closed_count = 0
+    for poll_id in poll_ids:
+        closed_count += close_poll(poll_id, now)
+    if closed_count:
+        logger.info(f"Closed {closed_count} expired polls")
+    return closed_count
+
+
+def build_stats(poll_id):
+    """
+    The stats document of a closed poll, shaped like the live one, from its
+    ChoiceResult rows. None once the poll is being deleted.
+    """
+    if not Poll.objects.visible().filter(pk=poll_id).exists():
+        return None
+    doc = {'total_votes': 0, 'questions': []}
+    rows = ChoiceResult.objects.filter(poll_id=poll_id).order_by('question_id', 'choice_id').values_list(
+        'question_id', 'question_text', 'choice_id', 'choice_text', 'votes_count', 'percentage',
+    )
+    for question_id, question_text, choice_id, choice_text, votes_count, share in rows:
+        questions = doc['questions']
+        if not questions or questions[-1]['question_id'] != question_id:
+            questions.append({
+                'question_id': question_id, 'question_text': question_text,
+                'total_question_votes': 0, 'choices': [],
+            })
+        if choice_id is None:
+            continue
+        questions[-1]['choices'].append({
+            'choice_id': choice_id, 'text': choice_text, 'votes_count': votes_count, 'percentage': share,
+        })
+        questions[-1]['total_question_votes'] += votes_count
+        doc['total_votes'] += votes_count
+    return doc
+
+
+def stats_key(poll_id, generation):
+    return generations.cache_key('results', poll_id, generation)
+
+
+def get_stats(poll_id, generation):
+    """build_stats(), cached for the given generation of the poll. Deletion bumps it."""
+    return cache.get_or_set(
+        stats_key(poll_id, generation), lambda: build_stats(poll_id), settings.POLL_RESULTS_CACHE_TIMEOUT,
+    )
@@ -0,0 +1,101 @@
+import logging
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import Vote, VoteRollup, RollupWatermark
+
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'vote_rollups'
+MAX_GAPS = 10000
+
+
+def _new_gaps(last_vote_id, ids):
+    """
+    Ids between the watermark and the end of a chunk that have no vote, newest
+    first and at most MAX_GAPS of them. Votes whose transactions commit out
+    of id order fill them later; the rest belong to rolled back or deleted
+    votes.
+    """
+    gaps = []
+    for upper, lower in zip(reversed(ids), [*reversed(ids[:-1]), last_vote_id]):
+        gaps.extend(range(upper - 1, lower, -1))
+        if len(gaps) >= MAX_GAPS:
+            return gaps[:MAX_GAPS]
+    return gaps
+
+
+def _merge_counts(resolution, grouped):
+    """Adds grouped (poll_id, choice_id, bucket) counts onto the rollup rows."""
+    counts = {(row['choice_id'], row['bucket']): row for row in grouped}
+    if not counts:
+        return
+
+    existing = VoteRollup.objects.filter(
+        resolution=resolution,
+        choice_id__in={choice_id for choice_id, _ in counts},
+        bucket_start__in={bucket for _, bucket in counts},
+    )
+    to_update = []
+    for rollup in existing:
+        row = counts.pop((rollup.choice_id, rollup.bucket_start), None)
+        if row is not None:
+            rollup.count += row['total']
+            to_update.append(rollup)
+
+    VoteRollup.objects.bulk_update(to_update, ['count'])
+    VoteRollup.objects.bulk_create([
+        VoteRollup(
+            poll_id=row['question__poll_id'], choice_id=choice_id,
+            resolution=resolution, bucket_start=bucket, count=row['total'],
+        )
+        for (choice_id, bucket), row in counts.items()
+    ])
+
+
+def rollup_new_votes(chunk_size=10000):
+    """
+    Folds the next chunk of votes past the watermark, and any votes that have
+    since filled its gaps, into the minute, hour and day rollups, and advances
+    the watermark in the same transaction. Returns the number of votes
+    processed.
+    """
+    now = timezone.now().timestamp()
+
+    with transaction.atomic():
+        # Locking the watermark row keeps overlapping runs from double counting
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        last_vote_id = watermark.last_vote_id
+        ids = list(Vote.objects.filter(id__gt=last_vote_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        gaps = dict(watermark.gaps)
+        filled = list(Vote.objects.filter(id__in=list(gaps)).values_list('id', flat=True)) if gaps else []
+
+        processed = len(ids) + len(filled)
+        new_votes = Vote.objects.filter(id__in=filled)
+        if ids:
+            new_votes |= Vote.objects.filter(id__gt=last_vote_id, id__lte=ids[-1])
+        if processed:
+            for resolution in VoteRollup.Resolution.values:
+                grouped = (
+                    new_votes.annotate(bucket=Trunc('created_at', resolution, tzinfo=dt_timezone.utc))
+                    .values('question__poll_id', 'choice_id', 'bucket')
+                    .annotate(total=Count('id'))
+                )
+                _merge_counts(resolution, grouped)
+
+        for vote_id in filled:
+            del gaps[vote_id]
+        if ids:
+            gaps.update((vote_id, now) for vote_id in _new_gaps(last_vote_id, ids))
+            watermark.last_vote_id = ids[-1]
+        expired_before = now - settings.VOTE_ROLLUP_GAP_TIMEOUT
+        gaps = sorted((vote_id, seen) for vote_id, seen in gaps.items() if seen >= expired_before)[-MAX_GAPS:]
+        if processed or len(gaps) != len(watermark.gaps):
+            watermark.gaps = [list(gap) for gap in gaps]
+            watermark.save(update_fields=['last_vote_id', 'gaps', 'updated_at'])
+
+    return processed
@@ -0,0 +1,214 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary ('default'). Reads go to a random database
+from DATABASE_REPLICAS, except when they must see the latest writes:
+
+- inside transaction.atomic blocks on the primary;
+- for unsafe requests (POST, PUT, PATCH, DELETE), which read what they are
+  about to change, unless the view calls unpin();
+- for the rest of a request once it has written or called stick_to_primary();
+- for REPLICA_STICKY_SECONDS after a user's last write, so voters and editors
+  see their own changes (see PrimaryStickinessMiddleware);
+- inside primary() blocks, for code that caches what it reads, where a lagging
+  replica would leave stale data in the cache;
+- in Celery tasks, which cache, count and purge what they read (see
+  PrimaryTask);
+- for auth and session tables, so a new user or password is usable at once.
+
+Without replicas configured every query goes to the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery import Task
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from . import aredis
+
+
+PRIMARY_ONLY_APPS = {'auth', 'sessions'}
+
+_jwt = JWTAuthentication()
+
+
+class RoutingState:
+    """Routing flags of the current request or task."""
+    def __init__(self, pinned=False):
+        self.pinned = pinned  # reads go to the primary
+        self.wrote = False
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def is_sticky(user_id):
+    return cache.get(sticky_key(user_id)) is not None
+
+
+def stick(user_id):
+    """Sends the user's reads to the primary for the next REPLICA_STICKY_SECONDS."""
+    cache.set(sticky_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+async def ais_sticky(user_id):
+    return bool(await aredis.cache_get_many([sticky_key(user_id)]))
+
+
+async def astick(user_id):
+    await aredis.cache_set_many({sticky_key(user_id): 1}, settings.REPLICA_STICKY_SECONDS)
+
+
+def stick_to_primary():
+    """
+    Marks the current request as a write, for writes that happen elsewhere,
+    such as votes handed to a Celery worker.
+    """
+    state = _state.get()
+    if state is not None:
+        state.pinned = state.wrote = True
+
+
+def unpin():
+    """
+    Lets an unsafe request that only reads, such as a GraphQL query sent as a
+    POST, use replicas until it writes.
+    """
+    state = _state.get()
+    if state is not None:
+        state.pinned = state.wrote
+
+
+@contextmanager
+def primary():
+    """Sends every read inside the block to the primary."""
+    state = _state.get()
+    if state is None:
+        token = _state.set(RoutingState(pinned=True))
+        try:
+            yield
+        finally:
+            _state.reset(token)
+        return
+    was_pinned, state.pinned = state.pinned, True
+    try:
+        yield
+    finally:
+        state.pinned = was_pinned or state.wrote
+
+
+class PrimaryTask(Task):
+    """Base class of every Celery task (see poll_system/celery.py): runs it in primary()."""
+    def __call__(self, *args, **kwargs):
+        with primary():
+            return super().__call__(*args, **kwargs)
+
+
+def token_user_id(request):
+    """
+    Id of the user named by the request's JWT, without querying the user
+    table. None when there is no valid token.
+    """
+    header = _jwt.get_header(request)
+    if header is None:
+        return None
+    try:
+        raw_token = _jwt.get_raw_token(header)
+        if raw_token is not None:
+            return _jwt.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM]
+    except (AuthenticationFailed, InvalidToken, KeyError):
+        pass
+    return None
+
+
+def request_user_id(request):
+    """Id of the user behind a request, from a valid JWT or the session."""
+    if _jwt.get_header(request) is not None:
+        return token_user_id(request)
+    session = getattr(request, 'session', None)
+    return session.get(SESSION_KEY) if session is not None else None
+
+
+async def arequest_user_id(request):
+    if _jwt.get_header(request) is not None:
+        return token_user_id(request)
+    session = getattr(request, 'session', None)
+    return await session.aget(SESSION_KEY) if session is not None else None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if (state is not None and state.pinned) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Tracks routing state per request. Unsafe requests, and requests from a
+    user who wrote in the last REPLICA_STICKY_SECONDS, read from the primary;
+    a request that writes starts or extends that window. Runs natively in
+    both sync and async mode. Must come after SessionMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        user_id = request_user_id(request) if settings.DATABASE_REPLICAS else None
+        state = RoutingState(pinned=request.method not in SAFE_METHODS or (user_id is not None and is_sticky(user_id)))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and user_id is not None:
+            stick(user_id)
+        return response
+
+    async def __acall__(self, request):
+        user_id = await arequest_user_id(request) if settings.DATABASE_REPLICAS else None
+        state = RoutingState(pinned=request.method not in SAFE_METHODS or (user_id is not None and await ais_sticky(user_id)))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and user_id is not None:
+            await astick(user_id)
+        return response
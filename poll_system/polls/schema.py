@@ -1,21 +1,51 @@
 import graphene
+from django.conf import settings
+from django.contrib.auth.models import User
 from graphene_django import DjangoObjectType
+from graphql import GraphQLError
 from .models import Poll, Question, Choice, Vote
-from .tasks import process_vote
+from .tasks import submit_vote
+from .pagination import encode_poll_cursor, polls_after
+from . import generations, routers, search
+from .loaders import get_loaders
 from django.db import IntegrityError 
 
 #Types
 
+class UserType(DjangoObjectType):
+    # Only what identifies a poll's author publicly
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
 class PollType(DjangoObjectType):
+    cursor = graphene.String(description="Pass as 'after' to allPolls to get the polls following this one.")
+
     class Meta:
         model = Poll
         fields = ('id', 'title', 'description', 'created_at', 'updated_at', 'end_date', 'created_by', 'is_active', 'questions')
 
+    def resolve_cursor(self, info):
+        return encode_poll_cursor(self)
+
+    # Relations go through the request's loaders (see loaders.py)
+    def resolve_created_by(self, info):
+        return get_loaders(info).users.load(self.created_by_id)
+
+    def resolve_questions(self, info):
+        return get_loaders(info).questions_by_poll.load(self.id)
+
 class QuestionType(DjangoObjectType):
     class Meta:
         model = Question
         fields = ('id', 'text', 'poll', 'choices')
 
+    def resolve_poll(self, info):
+        return get_loaders(info).polls.load(self.poll_id)
+
+    def resolve_choices(self, info):
+        return get_loaders(info).choices_by_question.load(self.id)
+
 class ChoiceType(DjangoObjectType):
     votes_count = graphene.Int()
 
@@ -23,18 +53,48 @@ class ChoiceType(DjangoObjectType):
         model = Choice
         fields = ('id', 'text', 'question', 'votes_count')
 
+    def resolve_question(self, info):
+        return get_loaders(info).questions.load(self.question_id)
+
+    def resolve_votes_count(self, info):
+        # Served from the live Redis tallies of every poll in the response at
+        # once, or from the final results of a closed poll
+        loaders = get_loaders(info)
+        poll_id = loaders.questions.load(self.question_id).poll_id
+        if loaders.polls.load(poll_id).closed_at is not None:
+            return loaders.results_by_poll.load(poll_id).get(self.id, 0)
+        return loaders.tallies_by_poll.load(poll_id).get(self.id, 0)
+
 
 # Queries
 
 class Query(graphene.ObjectType):
-    all_polls = graphene.List(PollType)
+    all_polls = graphene.List(PollType, first=graphene.Int(), after=graphene.String())
     poll = graphene.Field(PollType, id=graphene.Int())
+    search_polls = graphene.List(PollType, query=graphene.String(required=True), first=graphene.Int(), offset=graphene.Int())
 
-    def resolve_all_polls(self, info):
-        return Poll.objects.filter(is_active=True).prefetch_related('questions__choices')
+    def resolve_all_polls(self, info, first=None, after=None):
+        # Newest first, keyset paginated like the REST list
+        first = max(1, min(first or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE))
+        try:
+            polls = list(polls_after(Poll.objects.filter(is_active=True), after)[:first])
+        except ValueError as e:
+            raise GraphQLError(str(e))
+        return get_loaders(info).saw_polls(polls)
 
     def resolve_poll(self, info, id):
-        return Poll.objects.get(id=id, is_active=True)
+        poll = Poll.objects.visible().get(id=id)
+        return get_loaders(info).saw_polls([poll])[0]
+
+    def resolve_search_polls(self, info, query, first=None, offset=None):
+        # Best match first, offset paginated like the REST search
+        if not search.has_terms(query):
+            raise GraphQLError('Enter at least one word to search for.')
+        first = max(1, min(first or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE))
+        offset = max(0, min(offset or 0, settings.SEARCH_MAX_OFFSET))
+        poll_ids = search.SearchResults(query)[offset:offset + first]
+        polls = Poll.objects.visible().in_bulk(poll_ids)
+        return get_loaders(info).saw_polls([polls[poll_id] for poll_id in poll_ids if poll_id in polls])
 
 # Mutations
 
@@ -55,6 +115,7 @@ class CreatePollMutation(graphene.Mutation):
             created_by=info.context.user, 
             is_active=True
         )
+        generations.bump(generations.ALL_POLLS)
         return CreatePollMutation(poll=poll)
 
 class VoteMutation(graphene.Mutation):
@@ -72,17 +133,24 @@ class VoteMutation(graphene.Mutation):
         
         try:
             # Validate Choice/Question relationship and existence
-            choice = Choice.objects.select_related('question').get(id=choice_id, question__id=question_id)
+            choice = Choice.objects.select_related('question__poll').get(id=choice_id, question__id=question_id)
             question = choice.question
+            if question.poll.state != Poll.State.READY:
+                raise Exception("Voting is paused while this poll is being reset.")
+            if question.poll.is_closed():
+                raise Exception("This poll is closed.")
 
             # Check for duplicate vote *before* queueing the task
             if Vote.objects.filter(question=question, user=user).exists():
                 raise Exception("You have already voted on this question.")
 
-            # Queue the asynchronous vote processing task
-            task = process_vote.delay(question.id, choice.id, user.id)
-            
-            return VoteMutation(success=True, message=f'Vote queued for processing. Task ID: {task.id}')
+            # Queue the vote on the configured ingestion path
+            task_id = submit_vote(question.id, choice.id, user.id)
+            # The vote is written by a worker; keep the voter on the primary regardless
+            routers.stick_to_primary()
+            if task_id is None:
+                return VoteMutation(success=True, message='Vote queued for processing.')
+            return VoteMutation(success=True, message=f'Vote queued for processing. Task ID: {task_id}')
         
         except Choice.DoesNotExist:
             raise Exception("Invalid choice ID or choice does not belong to the specified question.")
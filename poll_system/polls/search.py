@@ -0,0 +1,94 @@
+"""
+Full-text search over polls, their questions and their choices.
+
+The index lives in the database and is kept current by triggers created in
+migration 0005, so every write path (the API, the admin, bulk imports) is
+covered without application code:
+
+- PostgreSQL: a weighted tsvector column, polls_poll.search_vector, with a GIN
+  index. Titles weigh most, then descriptions, questions and choices.
+- SQLite: an FTS5 table, polls_poll_fts, with one row per poll, ranked by
+  bm25 with the same column weights.
+
+Lookups return active poll ids in rank order, one page at a time. Other
+backends have no index and fall back to case-insensitive substring matches,
+newest first.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Poll
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+SEARCH_SQL = {
+    'postgresql': """
+        SELECT p.id FROM polls_poll p, websearch_to_tsquery('english', %s) query
+        WHERE p.is_active AND p.search_vector @@ query
+        ORDER BY ts_rank(p.search_vector, query) DESC, p.id DESC
+        LIMIT %s OFFSET %s
+    """,
+    'sqlite': """
+        SELECT p.id FROM polls_poll_fts JOIN polls_poll p ON p.id = polls_poll_fts.rowid
+        WHERE polls_poll_fts MATCH %s AND p.is_active
+        ORDER BY bm25(polls_poll_fts, 10.0, 5.0, 2.0, 1.0), p.id DESC
+        LIMIT %s OFFSET %s
+    """,
+}
+
+
+def has_terms(query):
+    return bool(TOKEN_RE.search(query or ''))
+
+
+def match_expression(query, vendor):
+    """
+    The query as the backend's search syntax. PostgreSQL parses raw input with
+    websearch_to_tsquery; FTS5 gets every word quoted, so all must match and
+    operators in the input are taken literally.
+    """
+    if vendor == 'sqlite':
+        return ' '.join(f'"{token}"' for token in TOKEN_RE.findall(query))
+    return query
+
+
+def search_poll_ids(query, limit, offset=0):
+    """Ids of the active polls matching query, best match first."""
+    if not has_terms(query) or limit <= 0:
+        return []
+    vendor = connection.vendor
+    if vendor not in SEARCH_SQL:
+        return unindexed_poll_ids(query, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL[vendor], [match_expression(query, vendor), limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def unindexed_poll_ids(query, limit, offset=0):
+    """search_poll_ids() without an index: polls containing every word anywhere, newest first."""
+    condition = Q()
+    for token in TOKEN_RE.findall(query):
+        condition &= (
+            Q(title__icontains=token) | Q(description__icontains=token)
+            | Q(questions__text__icontains=token) | Q(questions__choices__text__icontains=token)
+        )
+    poll_ids = Poll.objects.filter(condition, is_active=True).order_by('-id').values_list('id', flat=True).distinct()
+    return list(poll_ids[offset:offset + limit])
+
+
+class SearchResults:
+    """
+    Ranked poll ids for a query, sliced lazily so pagination fetches only the
+    rows of the page it serves.
+    """
+    def __init__(self, query):
+        self.query = query
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('SearchResults only supports slicing without a step.')
+        start, stop = item.start or 0, item.stop
+        if start < 0 or stop is None or stop < 0:
+            raise ValueError('SearchResults needs non-negative, bounded slices.')
+        return search_poll_ids(self.query, stop - start, start)
@@ -1,12 +1,15 @@
 from rest_framework import serializers
 from django.db import transaction
 from django.contrib.auth.models import User
-from .models import Poll, Question, Choice, Vote
+from .models import Poll, Question, Choice, Vote, PollPurge
 from rest_framework.exceptions import ValidationError
 
 
 class ChoiceSerializer(serializers.ModelSerializer):
-    votes_count = serializers.IntegerField(read_only=True) 
+    # Writable so nested updates can refer to existing choices
+    id = serializers.IntegerField(required=False)
+    # Summed across the counter shards, see Choice.current_votes
+    votes_count = serializers.IntegerField(source='current_votes', read_only=True) 
 
     class Meta:
         model = Choice
@@ -15,6 +18,8 @@ class ChoiceSerializer(serializers.ModelSerializer):
 
 
 class QuestionSerializer(serializers.ModelSerializer):
+    # Writable so nested updates can refer to existing questions
+    id = serializers.IntegerField(required=False)
     choices = ChoiceSerializer(many=True) 
 
     class Meta:
@@ -23,6 +28,100 @@ class QuestionSerializer(serializers.ModelSerializer):
         read_only_fields = ['poll']
 
 
+def create_polls(polls_data):
+    """
+    Creates polls from validated PollSerializer data, with their questions and
+    choices, in one INSERT per level however many polls there are. Relies on
+    bulk_create() returning primary keys (PostgreSQL, SQLite 3.35+). Question
+    and choice ids in the data are ignored.
+    """
+    polls, poll_questions = [], []
+    for poll_data in polls_data:
+        poll_data = dict(poll_data)
+        poll_questions.append(poll_data.pop('questions', None) or [])
+        polls.append(Poll(**poll_data))
+    Poll.objects.bulk_create(polls)
+
+    questions, question_choices = [], []
+    for poll, questions_data in zip(polls, poll_questions):
+        for question_data in questions_data:
+            question_data = dict(question_data)
+            question_data.pop('id', None)
+            question_choices.append(question_data.pop('choices', None) or [])
+            questions.append(Question(poll=poll, **question_data))
+    Question.objects.bulk_create(questions)
+
+    Choice.objects.bulk_create(
+        Choice(question=question, text=choice_data['text'])
+        for question, choices_data in zip(questions, question_choices)
+        for choice_data in choices_data
+    )
+    return polls
+
+
+def update_questions(poll, questions_data):
+    """
+    Makes a poll's questions and choices match validated QuestionSerializer
+    data, in a number of queries that does not grow with the poll.
+
+    The current tree is loaded in one query and diffed in memory.
+    - A question or choice whose id belongs to it in the current tree is
+      kept, and its text updated if it changed.
+    - Anything without such an id is created. That includes ids from other
+      polls or questions, and an id given a second time.
+    - Current questions and choices the data leaves out are deleted, along
+      with their votes.
+    Each resulting set is written with one bulk_create, bulk_update or delete.
+    """
+    current_questions, current_choices = {}, {}
+    for question_id, text, choice_id, choice_text in Question.objects.filter(poll=poll).values_list(
+        'id', 'text', 'choices__id', 'choices__text',
+    ):
+        current_questions[question_id] = text
+        if choice_id is not None:
+            current_choices[choice_id] = (question_id, choice_text)
+
+    kept_questions, changed_questions, new_questions = set(), [], []
+    kept_choices, changed_choices, new_choices = set(), [], []
+    for question_data in questions_data:
+        question_id = question_data.get('id')
+        if question_id not in current_questions or question_id in kept_questions:
+            question = Question(poll=poll, text=question_data['text'])
+            new_questions.append(question)
+            new_choices.extend(Choice(question=question, text=choice_data['text'])
+                               for choice_data in question_data.get('choices', []))
+            continue
+
+        kept_questions.add(question_id)
+        if current_questions[question_id] != question_data['text']:
+            changed_questions.append(Question(id=question_id, text=question_data['text']))
+        for choice_data in question_data.get('choices', []):
+            choice_id = choice_data.get('id')
+            current = current_choices.get(choice_id)
+            if current is None or current[0] != question_id or choice_id in kept_choices:
+                new_choices.append(Choice(question_id=question_id, text=choice_data['text']))
+                continue
+            kept_choices.add(choice_id)
+            if current[1] != choice_data['text']:
+                changed_choices.append(Choice(id=choice_id, text=choice_data['text']))
+
+    # Choices of removed questions go with them
+    removed_questions = current_questions.keys() - kept_questions
+    removed_choices = [
+        choice_id for choice_id, (question_id, _) in current_choices.items()
+        if question_id in kept_questions and choice_id not in kept_choices
+    ]
+    if removed_questions:
+        Question.objects.filter(id__in=removed_questions).delete()
+    if removed_choices:
+        Choice.objects.filter(id__in=removed_choices).delete()
+    Question.objects.bulk_update(changed_questions, ['text'])
+    Choice.objects.bulk_update(changed_choices, ['text'])
+    # Assigns the new questions' ids, which their new choices pick up on save
+    Question.objects.bulk_create(new_questions)
+    Choice.objects.bulk_create(new_choices)
+
+
 class PollSerializer(serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, required=False)
     created_by = serializers.ReadOnlyField(source='created_by.username')
@@ -38,16 +137,7 @@ class PollSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def create(self, validated_data):
-        questions_data = validated_data.pop('questions')
-        poll = Poll.objects.create(**validated_data) 
-
-        for question_data in questions_data:
-            choices_data = question_data.pop('choices')
-            question = Question.objects.create(poll=poll, **question_data)
-            for choice_data in choices_data:
-                Choice.objects.create(question=question, **choice_data)
-        
-        return poll
+        return create_polls([validated_data])[0]
 
 
     @transaction.atomic
@@ -59,49 +149,22 @@ class PollSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
 
-        #Handle Questions (Only if questions data was explicitly provided)
         if questions_data is not None:
-            existing_question_ids = set(instance.questions.values_list('id', flat=True))
-            incoming_question_ids = set()
-
-            for question_data in questions_data:
-                choices_data = question_data.pop('choices', [])
-                question_id = question_data.get('id', None)
-
-            if question_id and question_id in existing_question_ids:
-                # Update existing question
-                Question.objects.filter(id=question_id).update(text=question_data['text'])
-                question = Question.objects.get(id=question_id)
-            else:
-            # Create new question
-                question = Question.objects.create(poll=instance, **question_data)
-            incoming_question_ids.add(question.id)
-            existing_choice_ids = set(question.choices.values_list('id', flat=True))
-            incoming_choice_ids = set()
-
-            for choice_data in choices_data:
-                choice_id = choice_data.get('id', None)
-
-                if choice_id and choice_id in existing_choice_ids:
-                    # Update existing choice (text only)
-                    Choice.objects.filter(id=choice_id).update(text=choice_data['text'])
-                    # Track the ID of the updated choice
-                    incoming_choice_ids.add(choice_id)
-                else:
-                    # Create new choice
-                    # Track the ID of the newly created choice immediately
-                    new_choice = Choice.objects.create(question=question, **choice_data)
-                    incoming_choice_ids.add(new_choice.id)
-
-        # Delete choices that were in the DB but are not in the incoming data
-        Choice.objects.filter(question=question).exclude(id__in=incoming_choice_ids).delete()
-
-        # Delete questions that were in the DB but are not in the incoming data
-        instance.questions.exclude(id__in=incoming_question_ids).delete()
-
+            update_questions(instance, questions_data)
         return instance
 
 
+class PollPurgeSerializer(serializers.ModelSerializer):
+    """Progress of a vote reset or poll deletion (see purges.py)."""
+    class Meta:
+        model = PollPurge
+        fields = [
+            'id', 'poll_id', 'kind', 'status', 'votes_total', 'votes_deleted',
+            'error', 'created_at', 'updated_at', 'finished_at',
+        ]
+        read_only_fields = fields
+
+
 class VoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vote
@@ -0,0 +1,398 @@
+"""
+Live vote tallies kept in Redis, used as the primary read path for poll stats.
+
+Each poll has:
+  polls:tally:{<poll_id>}:meta         JSON with the question and choice texts
+  polls:tally:{<poll_id>}:questions    list of question ids
+  polls:tally:{<poll_id>}:q:<id>       hash of choice_id -> vote count, one per question
+  polls:tally:{<poll_id>}:stats        the stats response document
+
+Counts are incremented after a vote transaction commits, and the same script
+updates the stats document in place (counts, totals and percentages), so
+readers never recompute it. The Vote table stays the source of truth, and
+rebuild_poll_tallies() restores a poll from it after a Redis flush, a
+structural change or detected drift.
+"""
+import json
+import logging
+from collections import defaultdict
+from django.db.models import Count
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from .models import Poll, Question, Vote
+from . import aredis, generations, routers
+
+
+logger = logging.getLogger(__name__)
+
+# Shared by the stats scripts. The document is encoded by hand rather than with
+# cjson.encode, which would turn empty arrays into objects.
+STATS_LUA_HELPERS = """
+local function percentage(votes, total)
+    if total > 0 then
+        return math.floor(votes / total * 10000 + 0.5) / 100
+    end
+    return 0
+end
+
+local function encode_stats(doc)
+    local questions = {}
+    for i, q in ipairs(doc.questions) do
+        local choices = {}
+        for j, c in ipairs(q.choices) do
+            choices[j] = '{"choice_id":' .. tostring(c.choice_id)
+                .. ',"text":' .. cjson.encode(c.text)
+                .. ',"votes_count":' .. tostring(c.votes_count)
+                .. ',"percentage":' .. tostring(c.percentage) .. '}'
+        end
+        questions[i] = '{"question_id":' .. tostring(q.question_id)
+            .. ',"question_text":' .. cjson.encode(q.question_text)
+            .. ',"total_question_votes":' .. tostring(q.total_question_votes)
+            .. ',"choices":[' .. table.concat(choices, ',') .. ']}'
+    end
+    return '{"total_votes":' .. tostring(doc.total_votes)
+        .. ',"questions":[' .. table.concat(questions, ',') .. ']}'
+end
+"""
+
+# Returns the stats document, building it from the meta document and question
+# hashes when it is missing. Returns nil when the poll has not been built yet.
+# KEYS: stats, meta; ARGV[1]: question hash key prefix
+STATS_SCRIPT = STATS_LUA_HELPERS + """
+local cached = redis.call('GET', KEYS[1])
+if cached then
+    return cached
+end
+local raw_meta = redis.call('GET', KEYS[2])
+if not raw_meta then
+    return nil
+end
+
+local meta = cjson.decode(raw_meta)
+local doc = {total_votes = 0, questions = {}}
+for i, question in ipairs(meta.questions) do
+    local counts = redis.call('HGETALL', ARGV[1] .. question.id)
+    local by_choice = {}
+    for j = 1, #counts, 2 do
+        by_choice[counts[j]] = tonumber(counts[j + 1])
+    end
+
+    local q = {question_id = question.id, question_text = question.text, total_question_votes = 0, choices = {}}
+    for j, choice in ipairs(question.choices) do
+        local votes = by_choice[tostring(choice.id)] or 0
+        q.choices[j] = {choice_id = choice.id, text = choice.text, votes_count = votes}
+        q.total_question_votes = q.total_question_votes + votes
+    end
+    for _, c in ipairs(q.choices) do
+        c.percentage = percentage(c.votes_count, q.total_question_votes)
+    end
+    doc.questions[i] = q
+    doc.total_votes = doc.total_votes + q.total_question_votes
+end
+
+local encoded = encode_stats(doc)
+redis.call('SET', KEYS[1], encoded)
+return encoded
+"""
+
+# Applies committed votes for one poll: increments the question hashes and, if
+# the stats document exists, updates its counts, totals and percentages in place.
+# KEYS: stats, then one question hash per delta; ARGV: choice_id, amount per delta
+APPLY_VOTES_SCRIPT = STATS_LUA_HELPERS + """
+local deltas = {}
+for i = 2, #KEYS do
+    local choice_id = ARGV[(i - 2) * 2 + 1]
+    local amount = tonumber(ARGV[(i - 2) * 2 + 2])
+    redis.call('HINCRBY', KEYS[i], choice_id, amount)
+    deltas[choice_id] = (deltas[choice_id] or 0) + amount
+end
+
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return 0
+end
+local doc = cjson.decode(raw)
+for _, q in ipairs(doc.questions) do
+    local changed = false
+    for _, c in ipairs(q.choices) do
+        local amount = deltas[tostring(c.choice_id)]
+        if amount then
+            c.votes_count = c.votes_count + amount
+            q.total_question_votes = q.total_question_votes + amount
+            doc.total_votes = doc.total_votes + amount
+            changed = true
+        end
+    end
+    if changed then
+        for _, c in ipairs(q.choices) do
+            c.percentage = percentage(c.votes_count, q.total_question_votes)
+        end
+    end
+end
+redis.call('SET', KEYS[1], encode_stats(doc))
+return 1
+"""
+
+# Reads the meta document and every question hash of a poll in one round trip.
+# Returns nil when the poll has not been built yet.
+LOAD_SCRIPT = """
+local meta = redis.call('GET', KEYS[1])
+if not meta then
+    return nil
+end
+local result = {meta}
+for _, question_id in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    table.insert(result, question_id)
+    table.insert(result, redis.call('HGETALL', ARGV[1] .. question_id))
+end
+return result
+"""
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def _prefix(poll_id):
+    # The hash tag keeps all keys of a poll in the same cluster slot
+    return f'polls:tally:{{{poll_id}}}'
+
+
+def meta_key(poll_id):
+    return f'{_prefix(poll_id)}:meta'
+
+
+def questions_key(poll_id):
+    return f'{_prefix(poll_id)}:questions'
+
+
+def question_key(poll_id, question_id):
+    return f'{_prefix(poll_id)}:q:{question_id}'
+
+
+def stats_key(poll_id):
+    return f'{_prefix(poll_id)}:stats'
+
+
+def record_votes(deltas, conn=None):
+    """
+    Applies committed vote deltas, given as (poll_id, question_id, choice_id, amount)
+    tuples, with one script call per poll sent in a single pipeline. Call it from
+    transaction.on_commit so rolled back votes are never counted. A Redis failure
+    is logged and left to reconciliation.
+    """
+    by_poll = defaultdict(list)
+    for poll_id, question_id, choice_id, amount in deltas:
+        by_poll[poll_id].append((question_id, choice_id, amount))
+
+    try:
+        conn = conn or get_connection()
+        apply_votes = conn.register_script(APPLY_VOTES_SCRIPT)
+        pipe = conn.pipeline(transaction=False)
+        for poll_id, poll_deltas in by_poll.items():
+            keys = [stats_key(poll_id)] + [question_key(poll_id, q_id) for q_id, _, _ in poll_deltas]
+            args = [value for _, c_id, amount in poll_deltas for value in (c_id, amount)]
+            apply_votes(keys=keys, args=args, client=pipe)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to update live tallies, reconciliation will repair them: {e}")
+
+
+def load_poll_tallies(poll_id, conn=None):
+    """
+    Returns (meta, counts) for a poll, where counts maps choice_id -> votes,
+    or None when the poll's tallies have not been built.
+    """
+    conn = conn or get_connection()
+    raw = conn.eval(LOAD_SCRIPT, 2, meta_key(poll_id), questions_key(poll_id), f'{_prefix(poll_id)}:q:')
+    if raw is None:
+        return None
+    return json.loads(raw[0]), _parse_counts(raw)
+
+
+def _parse_counts(raw):
+    counts = {}
+    for i in range(2, len(raw), 2):
+        pairs = raw[i]
+        for j in range(0, len(pairs), 2):
+            counts[int(pairs[j])] = int(pairs[j + 1])
+    return counts
+
+
+def load_many_poll_counts(poll_ids, conn=None):
+    """
+    {poll_id: {choice_id: votes}} from the tallies of several polls, in one
+    round trip. Polls whose tallies have not been built are left out.
+    """
+    conn = conn or get_connection()
+    load = conn.register_script(LOAD_SCRIPT)
+    poll_ids = list(poll_ids)
+    pipe = conn.pipeline(transaction=False)
+    for poll_id in poll_ids:
+        load(keys=[meta_key(poll_id), questions_key(poll_id)], args=[f'{_prefix(poll_id)}:q:'], client=pipe)
+    return {poll_id: _parse_counts(raw) for poll_id, raw in zip(poll_ids, pipe.execute()) if raw is not None}
+
+
+def count_votes(poll_id):
+    """
+    Per-choice vote counts for a poll, straight from the Vote table on the
+    primary; a lagging replica would be missing recent votes. A poll being
+    reset counts as having none, whatever its purge has not deleted yet.
+    """
+    with routers.primary():
+        return dict(
+            Vote.objects.filter(question__poll_id=poll_id, question__poll__state=Poll.State.READY)
+            .values('choice_id').annotate(total=Count('id'))
+            .values_list('choice_id', 'total')
+        )
+
+
+def count_many_votes(poll_ids):
+    """count_votes() of several polls in one query, as {poll_id: {choice_id: votes}}."""
+    grouped = defaultdict(dict)
+    with routers.primary():
+        rows = (
+            Vote.objects.filter(question__poll_id__in=poll_ids, question__poll__state=Poll.State.READY)
+            .values('question__poll_id', 'choice_id').annotate(total=Count('id'))
+            .values_list('question__poll_id', 'choice_id', 'total')
+        )
+        for poll_id, choice_id, total in rows:
+            grouped[poll_id][choice_id] = total
+    return grouped
+
+
+def rebuild_poll_tallies(poll_id, conn=None):
+    """
+    Rebuilds a poll's meta document and question hashes from the database.
+    Returns the same (meta, counts) pair as load_poll_tallies().
+    """
+    conn = conn or get_connection()
+    with routers.primary():
+        questions = list(Question.objects.filter(poll_id=poll_id).order_by('id').prefetch_related('choices'))
+    vote_counts = count_votes(poll_id)
+
+    meta = {
+        'poll_id': poll_id,
+        'questions': [
+            {
+                'id': question.id,
+                'text': question.text,
+                'choices': [
+                    {'id': choice.id, 'text': choice.text}
+                    for choice in sorted(question.choices.all(), key=lambda c: c.id)
+                ],
+            }
+            for question in questions
+        ],
+    }
+    counts = {
+        choice['id']: vote_counts.get(choice['id'], 0)
+        for question in meta['questions'] for choice in question['choices']
+    }
+
+    stale_ids = conn.lrange(questions_key(poll_id), 0, -1)
+    pipe = conn.pipeline(transaction=True)
+    pipe.delete(meta_key(poll_id), questions_key(poll_id), stats_key(poll_id))
+    for question_id in stale_ids:
+        pipe.delete(question_key(poll_id, question_id.decode()))
+    for question in meta['questions']:
+        pipe.rpush(questions_key(poll_id), question['id'])
+        mapping = {choice['id']: counts[choice['id']] for choice in question['choices']}
+        if mapping:
+            pipe.hset(question_key(poll_id, question['id']), mapping=mapping)
+    pipe.set(meta_key(poll_id), json.dumps(meta))
+    pipe.execute()
+
+    return meta, counts
+
+
+def drop_poll_tallies(poll_id, conn=None):
+    """Forgets a poll's tallies so the next read rebuilds them from the database."""
+    conn = conn or get_connection()
+    question_ids = conn.lrange(questions_key(poll_id), 0, -1)
+    conn.delete(
+        meta_key(poll_id), questions_key(poll_id), stats_key(poll_id),
+        *[question_key(poll_id, question_id.decode()) for question_id in question_ids]
+    )
+
+
+def get_poll_tallies(poll_id, conn=None):
+    """Loads a poll's tallies, building them from the database on a cold start."""
+    conn = conn or get_connection()
+    tallies = load_poll_tallies(poll_id, conn)
+    if tallies is None:
+        tallies = rebuild_poll_tallies(poll_id, conn)
+    return tallies
+
+
+def get_many_poll_counts(poll_ids, conn=None):
+    """
+    Per-choice vote counts of several polls, as {poll_id: {choice_id: votes}}:
+    the live tallies where they are built, and one query for the rest. The
+    missing tallies are left for reconciliation or the next stats read to build.
+    """
+    counts = load_many_poll_counts(poll_ids, conn)
+    missing = [poll_id for poll_id in poll_ids if poll_id not in counts]
+    if missing:
+        counts.update(count_many_votes(missing))
+    return counts
+
+
+def load_poll_stats(poll_id, conn=None):
+    """
+    Returns the stats document of a poll, assembling it from the tallies if it
+    is not cached yet, or None when the poll's tallies have not been built.
+    """
+    conn = conn or get_connection()
+    stats_script = conn.register_script(STATS_SCRIPT)
+    raw = stats_script(keys=[stats_key(poll_id), meta_key(poll_id)], args=[f'{_prefix(poll_id)}:q:'])
+    if raw is None:
+        return None
+    return json.loads(raw)
+
+
+async def aload_poll_stats(poll_id, conn=None):
+    """load_poll_stats() on an async Redis client (see aredis.py)."""
+    conn = conn or aredis.get_connection()
+    stats_script = conn.register_script(STATS_SCRIPT)
+    raw = await stats_script(keys=[stats_key(poll_id), meta_key(poll_id)], args=[f'{_prefix(poll_id)}:q:'])
+    if raw is None:
+        return None
+    return json.loads(raw)
+
+
+def load_versioned_stats(poll_id, conn=None):
+    """
+    The poll's {poll_id: generation} (see generations.py) and its stats document
+    as load_poll_stats() returns it, read together in one round trip.
+    """
+    conn = conn or get_connection()
+    pipe = conn.pipeline(transaction=True)
+    pipe.mget(generations.generation_keys([poll_id]))
+    conn.register_script(STATS_SCRIPT)(
+        keys=[stats_key(poll_id), meta_key(poll_id)], args=[f'{_prefix(poll_id)}:q:'], client=pipe,
+    )
+    values, raw = pipe.execute()
+    return generations.from_values([poll_id], values, conn), None if raw is None else json.loads(raw)
+
+
+async def aload_versioned_stats(poll_id, conn=None):
+    """load_versioned_stats() on an async Redis client (see aredis.py)."""
+    conn = conn or aredis.get_connection()
+    pipe = conn.pipeline(transaction=True)
+    pipe.mget(generations.generation_keys([poll_id]))
+    await conn.register_script(STATS_SCRIPT)(
+        keys=[stats_key(poll_id), meta_key(poll_id)], args=[f'{_prefix(poll_id)}:q:'], client=pipe,
+    )
+    values, raw = await pipe.execute()
+    return await generations.afrom_values([poll_id], values, conn), None if raw is None else json.loads(raw)
+
+
+def get_poll_stats(poll_id, conn=None):
+    """Loads a poll's stats document, rebuilding the tallies on a cold start."""
+    conn = conn or get_connection()
+    poll_stats = load_poll_stats(poll_id, conn)
+    if poll_stats is None:
+        rebuild_poll_tallies(poll_id, conn)
+        poll_stats = load_poll_stats(poll_id, conn)
+    return poll_stats
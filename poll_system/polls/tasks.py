@@ -1,13 +1,34 @@
+from collections import Counter
+from asgiref.sync import sync_to_async
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import IntegrityError, transaction
-# Import F for performing atomic database operations
-from django.db.models import F 
-from .models import Vote, Question, Choice
+from django.db import IntegrityError, InterfaceError, OperationalError, transaction
+from django.utils import timezone
+from datetime import timedelta
+from redis.exceptions import LockError
+from .models import Poll, Vote, Question, Choice, ChoiceVoteShard, PollPurge
+from .counters import increment_choice_votes, compact_choice_shards
+from . import generations, live, purges, results, rollups, tallies, trending, vote_buffer
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def votes_committed(deltas):
+    """
+    Runs after a vote transaction commits. deltas are
+    (poll_id, question_id, choice_id, amount) tuples.
+    """
+    poll_counts = Counter()
+    for poll_id, _, _, amount in deltas:
+        poll_counts[poll_id] += amount
+
+    tallies.record_votes(deltas)
+    generations.bump(*poll_counts)
+    live.mark_dirty(poll_counts)
+    trending.record_votes(poll_counts)
+
 @shared_task
 def process_vote(question_id, choice_id, user_id):
     """
@@ -21,15 +42,26 @@ def process_vote(question_id, choice_id, user_id):
         
         with transaction.atomic():
             #Fetch necessary objects using the sanitized IDs
-            question = Question.objects.get(id=q_id)
+            question = Question.objects.select_related('poll').get(id=q_id)
+            if question.poll.state != Poll.State.READY:
+                # Queued before a vote reset or deletion began; the purge would delete it
+                logger.warning(f"Dropping vote for poll {question.poll_id} in state {question.poll.state}")
+                return {'error': 'Poll is being reset or deleted'}
+            if question.poll.closed_at is not None:
+                logger.warning(f"Dropping vote for closed poll {question.poll_id}")
+                return {'error': 'Poll is closed'}
             choice = Choice.objects.get(id=c_id, question=question)
             user = User.objects.get(id=u_id)
             
             # Create the Vote object (IntegrityError handles duplicates)
             Vote.objects.create(question=question, choice=choice, user=user)
             
-            # tomically increment the denormalized vote counter.
-            Choice.objects.filter(id=c_id).update(votes_count=F('votes_count') + 1)
+            # Atomically increment one of the choice's counter shards.
+            increment_choice_votes(c_id, shard_key=u_id)
+
+            # Live tallies only count the vote once it is committed
+            delta = (question.poll_id, q_id, c_id, 1)
+            transaction.on_commit(lambda: votes_committed([delta]))
             
             logger.info(f"Vote recorded and count updated: user {u_id}, choice {c_id}, question {q_id}")
             return {'message': 'Vote recorded successfully'}
@@ -42,3 +74,326 @@ def process_vote(question_id, choice_id, user_id):
         # Handles the unique_together constraint failure
         logger.error(f"Vote creation failed (Duplicate Vote): {str(e)}")
         return {'error': 'User already voted on this question'}
+
+
+def submit_vote(question_id, choice_id, user_id):
+    """
+    Hands an already validated vote to the configured ingestion path.
+    Returns the Celery task id in 'direct' mode, or None when the vote was buffered.
+    """
+    if settings.VOTE_INGESTION_MODE == 'batched':
+        pending = vote_buffer.enqueue_vote(question_id, choice_id, user_id)
+        # Don't wait for the next beat tick when a full batch is already waiting
+        if pending % settings.VOTE_BATCH_SIZE == 0:
+            flush_vote_buffer.delay()
+        return None
+
+    task = process_vote.delay(question_id, choice_id, user_id)
+    return task.id
+
+
+async def asubmit_vote(question_id, choice_id, user_id):
+    """
+    submit_vote() for async views. Buffered votes go to Redis on the async
+    client; only publishing a Celery task runs in a thread.
+    """
+    if settings.VOTE_INGESTION_MODE == 'batched':
+        pending = await vote_buffer.aenqueue_vote(question_id, choice_id, user_id)
+        if pending % settings.VOTE_BATCH_SIZE == 0:
+            await sync_to_async(flush_vote_buffer.delay)()
+        return None
+
+    task = await sync_to_async(process_vote.delay)(question_id, choice_id, user_id)
+    return task.id
+
+
+def record_vote_batch(entries):
+    """
+    Records a batch of buffered votes in a single transaction.
+
+    Duplicates (within the batch or already in the database) and entries pointing
+    at missing users or mismatched choices are dropped. Returns the number of
+    votes inserted.
+    """
+    # First vote per (question, user) wins, matching the unique_together constraint
+    unique_entries = {}
+    for entry in entries:
+        unique_entries.setdefault((entry['question_id'], entry['user_id']), entry)
+
+    choice_ids = {entry['choice_id'] for entry in unique_entries.values()}
+    user_ids = {entry['user_id'] for entry in unique_entries.values()}
+    question_ids = {entry['question_id'] for entry in unique_entries.values()}
+
+    with transaction.atomic():
+        # Choices of closed polls, or of polls being reset or deleted, count as missing
+        choices = {
+            c_id: (q_id, poll_id)
+            for c_id, q_id, poll_id in Choice.objects.filter(
+                id__in=choice_ids, question__poll__state=Poll.State.READY, question__poll__closed_at__isnull=True,
+            ).values_list('id', 'question_id', 'question__poll_id')
+        }
+        valid_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        existing = set(
+            Vote.objects.filter(question_id__in=question_ids, user_id__in=user_ids)
+            .values_list('question_id', 'user_id')
+        )
+
+        new_votes = []
+        for (q_id, u_id), entry in unique_entries.items():
+            c_id = entry['choice_id']
+            if (q_id, u_id) in existing:
+                continue
+            if u_id not in valid_users or choices.get(c_id, (None,))[0] != q_id:
+                logger.error(f"Dropping buffered vote with invalid references: {entry}")
+                continue
+            new_votes.append(Vote(question_id=q_id, choice_id=c_id, user_id=u_id))
+
+        Vote.objects.bulk_create(new_votes)
+
+        # One aggregated increment per choice instead of one UPDATE per vote
+        for c_id, count in Counter(vote.choice_id for vote in new_votes).items():
+            increment_choice_votes(c_id, count)
+
+        deltas = [
+            (choices[vote.choice_id][1], vote.question_id, vote.choice_id, 1)
+            for vote in new_votes
+        ]
+        if deltas:
+            transaction.on_commit(lambda: votes_committed(deltas))
+
+    return len(new_votes)
+
+
+def record_votes_one_by_one(entries, conn=None):
+    """
+    Records votes in a transaction each, for a batch that kept failing as a
+    whole. Votes that still fail are moved to the dead-letter list. Lost
+    database connections are raised, leaving the batch for the next run.
+    """
+    recorded, failed = 0, []
+    for entry in entries:
+        try:
+            recorded += record_vote_batch([entry])
+        except (OperationalError, InterfaceError):
+            raise
+        except Exception:
+            logger.exception(f"Moving buffered vote to the dead-letter list: {entry}")
+            failed.append(entry)
+    if failed:
+        vote_buffer.dead_letter(failed, conn)
+    return recorded
+
+
+@shared_task
+def flush_vote_buffer(max_batches=100):
+    """
+    Drains the Redis vote buffer in batches of VOTE_BATCH_SIZE.
+    A batch is only acknowledged after its transaction commits, so a failure
+    or a crash leaves it on the in-flight list for the next run. After
+    VOTE_BATCH_MAX_ATTEMPTS, it is recorded one vote at a time instead.
+    """
+    conn = vote_buffer.get_connection()
+    lock = vote_buffer.flush_lock(conn)
+    if not lock.acquire(blocking=False):
+        return {'recorded': 0, 'message': 'Flush already in progress'}
+
+    recorded = 0
+    try:
+        for _ in range(max_batches):
+            batch = vote_buffer.claim_batch(conn)
+            if not batch:
+                break
+            if batch.attempts > settings.VOTE_BATCH_MAX_ATTEMPTS:
+                recorded += record_votes_one_by_one(batch, conn)
+            else:
+                recorded += record_vote_batch(batch)
+            vote_buffer.ack_batch(conn)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("Vote buffer flush outlived its lock timeout")
+
+    if recorded:
+        logger.info(f"Flushed {recorded} buffered votes")
+    return {'recorded': recorded}
+
+
+@shared_task
+def compact_vote_shards(chunk_size=500):
+    """
+    Periodically folds counter shards back into Choice.votes_count,
+    one short transaction per chunk of choices.
+    """
+    choice_ids = list(
+        ChoiceVoteShard.objects.filter(count__gt=0)
+        .values_list('choice_id', flat=True).distinct().order_by('choice_id')
+    )
+    folded = 0
+    for start in range(0, len(choice_ids), chunk_size):
+        folded += compact_choice_shards(choice_ids[start:start + chunk_size])
+
+    if folded:
+        logger.info(f"Compacted {folded} sharded votes across {len(choice_ids)} choices")
+    return {'compacted': folded}
+
+
+RECONCILE_CURSOR_KEY = 'polls:tally:reconcile:cursor'
+
+
+@shared_task
+def reconcile_vote_tallies(chunk_size=None, max_chunks=None):
+    """
+    Compares the live Redis tallies of active polls with the Vote table and
+    rebuilds the polls that are missing (e.g. after a Redis flush) or drifted.
+
+    Polls are checked in id order, chunk_size at a time, with one pipelined
+    load and one grouped count per chunk. A run checks at most max_chunks
+    chunks and the next one carries on from there, so a full pass over many
+    polls is spread over several runs.
+    """
+    chunk_size = chunk_size or settings.VOTE_TALLY_RECONCILE_CHUNK_SIZE
+    max_chunks = max_chunks or settings.VOTE_TALLY_RECONCILE_CHUNKS
+    conn = tallies.get_connection()
+    cursor = int(conn.get(RECONCILE_CURSOR_KEY) or 0)
+    rebuilt = 0
+    for _ in range(max_chunks):
+        poll_ids = list(
+            Poll.objects.filter(is_active=True, id__gt=cursor).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        cursor = poll_ids[-1] if len(poll_ids) == chunk_size else 0
+        cached = tallies.load_many_poll_counts(poll_ids, conn)
+        counted = tallies.count_many_votes([poll_id for poll_id in poll_ids if poll_id in cached])
+        for poll_id in poll_ids:
+            if poll_id in cached:
+                if {c_id: n for c_id, n in cached[poll_id].items() if n} == counted.get(poll_id, {}):
+                    continue
+                logger.warning(f"Live tallies drifted for poll {poll_id}, rebuilding")
+            tallies.rebuild_poll_tallies(poll_id, conn)
+            generations.bump(poll_id, conn=conn)
+            rebuilt += 1
+        if not cursor:
+            break
+    conn.set(RECONCILE_CURSOR_KEY, cursor)
+
+    return {'rebuilt': rebuilt}
+
+
+@shared_task(ignore_result=True)
+def publish_live_updates():
+    """
+    Runs every LIVE_UPDATE_TICK and pushes one stats update per poll that
+    received votes since the previous tick.
+    """
+    published = live.publish_dirty_polls()
+    if published:
+        logger.debug(f"Published live stats for {published} polls")
+    return {'published': published}
+
+
+@shared_task
+def close_expired_polls(max_batches=10):
+    """
+    Closes the polls whose end date has passed, freezing their results (see
+    results.py), POLL_CLOSE_BATCH_SIZE polls per batch.
+    """
+    closed = 0
+    for _ in range(max_batches):
+        batch = results.close_expired_polls()
+        closed += batch
+        if batch < settings.POLL_CLOSE_BATCH_SIZE:
+            break
+    return {'closed': closed}
+
+
+@shared_task
+def rollup_votes(max_chunks=50):
+    """
+    Folds votes recorded since the last run into the per-minute, hour and day
+    rollups behind the timeline endpoint.
+    """
+    processed = 0
+    for _ in range(max_chunks):
+        chunk = rollups.rollup_new_votes()
+        if not chunk:
+            break
+        processed += chunk
+
+    if processed:
+        logger.info(f"Rolled up {processed} votes")
+    return {'processed': processed}
+
+
+@shared_task
+def refresh_trending():
+    """
+    Rebuilds the trending and most-voted rankings from the database when they
+    were lost, and otherwise moves their decay epoch forward when it is due.
+    """
+    conn = trending.get_connection()
+    if trending.is_lost(conn=conn):
+        polls = trending.rebuild(conn=conn)
+        logger.info(f"Rebuilt trending rankings for {polls} polls")
+        return {'rebuilt': True, 'rebased': False}
+    if trending.needs_rebase(conn=conn):
+        trending.rebase(conn=conn)
+        return {'rebuilt': False, 'rebased': True}
+    return {'rebuilt': False, 'rebased': False}
+
+
+def start_purge(poll, kind, user, payload=None, partial=False):
+    """
+    Marks a poll for a vote reset or deletion (see purges.begin()) and queues
+    the job once the surrounding transaction commits. Returns the job.
+    """
+    job = purges.begin(poll, kind, user, payload, partial)
+    transaction.on_commit(lambda: purge_poll.delay(job.pk))
+    return job
+
+
+@shared_task(acks_late=True)
+def purge_poll(job_id):
+    """
+    Runs a vote reset or poll deletion job for up to POLL_PURGE_CHUNKS_PER_TASK
+    chunks, then queues itself again, so a long purge never holds a worker or
+    a transaction for long. See purges.py.
+    """
+    conn = purges.get_connection()
+    lock = purges.job_lock(job_id, conn)
+    if not lock.acquire(blocking=False):
+        return {'finished': False, 'message': 'Purge already running'}
+
+    try:
+        job = PollPurge.objects.filter(pk=job_id).first()
+        if job is None:
+            return {'finished': False, 'message': 'No such purge'}
+        finished = purges.run(job)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning(f"Purge {job_id} outlived its lock timeout")
+
+    if not finished:
+        purge_poll.delay(job_id)
+    return {'finished': finished, 'votes_deleted': job.votes_deleted}
+
+
+@shared_task
+def resume_poll_purges():
+    """
+    Requeues purge jobs that have made no progress for POLL_PURGE_STALL_TIMEOUT,
+    e.g. because their worker died between chunks.
+    """
+    stalled_before = timezone.now() - timedelta(seconds=settings.POLL_PURGE_STALL_TIMEOUT)
+    job_ids = list(
+        PollPurge.objects.filter(
+            status__in=[PollPurge.Status.PENDING, PollPurge.Status.RUNNING], updated_at__lt=stalled_before,
+        ).values_list('id', flat=True)
+    )
+    for job_id in job_ids:
+        purge_poll.delay(job_id)
+
+    if job_ids:
+        logger.warning(f"Resumed {len(job_ids)} stalled purges")
+    return {'resumed': len(job_ids)}
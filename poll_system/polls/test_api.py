@@ -2,42 +2,8 @@ import pytest
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
 from polls.models import Poll, Question, Choice, Vote
+from polls.tasks import purge_poll
 from django.urls import reverse
-from django.core.cache import cache
-from celery import current_app
-
-# Set Celery to run tasks synchronously during testing
-@pytest.fixture(scope='session', autouse=True)
-def celery_config():
-    current_app.task_always_eager = True
-    current_app.task_eager_propagates = True
-
-@pytest.fixture(autouse=True)
-def clear_cache_between_tests():
-    """Ensure cache is clean before each test run."""
-    cache.clear()
-
-@pytest.fixture
-def api_client():
-    return APIClient()
-
-@pytest.fixture
-def create_user():
-    def _create_user(username, password='testpassword', email='test@example.com'):
-        return User.objects.create_user(username=username, password=password, email=email)
-    return _create_user
-
-@pytest.fixture
-def auth_client(api_client, create_user):
-    user = create_user('testuser')
-    response = api_client.post(reverse('token_obtain_pair'), {
-        'username': 'testuser',
-        'password': 'testpassword'
-    })
-    token = response.data['access']
-    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
-    api_client.user = user  # Attach user object for convenience
-    return api_client
 
 @pytest.fixture
 def poll_data():
@@ -57,29 +23,6 @@ def poll_data():
         ]
     }
 
-@pytest.fixture
-def setup_voted_poll(create_user):
-    """Creates a poll, a question, two choices, and records one vote."""
-    user1 = create_user('voter1', password='voterpassword')
-    poll = Poll.objects.create(title="Test Vote Poll", created_by=user1)
-    question = Question.objects.create(poll=poll, text="Q1")
-    choice1 = Choice.objects.create(question=question, text="C1", votes_count=0)
-    choice2 = Choice.objects.create(question=question, text="C2", votes_count=0)
-    
-    # Record vote and manually trigger the counter update (as it happens in Celery task)
-    Vote.objects.create(user=user1, question=question, choice=choice1)
-    choice1.votes_count += 1
-    choice1.save()
-    
-    return {
-        'poll': poll, 
-        'question': question, 
-        'choice1': choice1, 
-        'choice2': choice2, 
-        'user1': user1
-    }
-
-
 @pytest.mark.django_db
 def test_user_registration(api_client):
     url = reverse('register')
@@ -178,6 +121,8 @@ def test_poll_update_fails_without_reset_confirmation(auth_client, setup_voted_p
         ]
     }
     
+    # Only the poll's owner may edit it
+    auth_client.force_authenticate(setup_voted_poll['user1'])
     response = auth_client.put(url, update_data, format='json')
     
     # Must fail with a 400 validation error
@@ -214,9 +159,13 @@ def test_poll_update_succeeds_with_vote_reset(auth_client, setup_voted_poll):
         ]
     }
     
+    # Only the poll's owner may edit it
+    auth_client.force_authenticate(setup_voted_poll['user1'])
     response = auth_client.put(url, update_data, format='json')
     
-    assert response.status_code == 200
+    # The reset and the update run in a background purge job
+    assert response.status_code == 202
+    assert purge_poll(response.data['purge']['id'])['finished']
     
     # Verify votes are reset
     assert Vote.objects.count() == 0
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import pytest
+from django.test import AsyncRequestFactory
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from polls import async_views, tallies
+from polls.tasks import process_vote
+
+
+def bearer(user):
+    return {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_detail_matches_the_sync_view(api_client, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    url = reverse('poll-detail', kwargs={'pk': poll.pk})
+    expected = api_client.get(url)
+
+    response = asyncio.run(async_views.poll_detail(AsyncRequestFactory().get(url), pk=poll.pk))
+    assert response.status_code == 200
+    assert response.content == expected.content
+    assert response['ETag'] == expected['ETag']
+
+    request = AsyncRequestFactory().get(url, headers={'If-None-Match': response['ETag']})
+    assert asyncio.run(async_views.poll_detail(request, pk=poll.pk)).status_code == 304
+
+
+@pytest.mark.django_db(transaction=True)
+def test_detail_hands_other_formats_to_the_sync_view(setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    request = AsyncRequestFactory().get(reverse('poll-detail', kwargs={'pk': poll.pk}), {'format': 'api'})
+    response = asyncio.run(async_views.poll_detail(request, pk=poll.pk))
+    assert response['Content-Type'].startswith('text/html')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_stats_match_the_sync_view(api_client, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    url = reverse('poll-stats', kwargs={'pk': poll.pk})
+
+    # The first request builds the tallies, the second reads them from Redis
+    cold = asyncio.run(async_views.poll_stats(AsyncRequestFactory().get(url), pk=poll.pk))
+    assert tallies.load_poll_stats(poll.pk) is not None
+    warm = asyncio.run(async_views.poll_stats(AsyncRequestFactory().get(url), pk=poll.pk))
+
+    expected = api_client.get(url)
+    assert json.loads(cold.content) == json.loads(warm.content) == expected.json()
+    assert warm['ETag'] == expected['ETag']
+
+    missing = asyncio.run(async_views.poll_stats(AsyncRequestFactory().get(url), pk=poll.pk + 100))
+    assert missing.status_code == 404
+
+    # Deleting the poll drops its Redis document
+    api_client.force_authenticate(poll.created_by)
+    assert api_client.delete(reverse('poll-detail', kwargs={'pk': poll.pk})).status_code == 202
+    deleted = asyncio.run(async_views.poll_stats(AsyncRequestFactory().get(url), pk=poll.pk))
+    assert deleted.status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_vote(create_user, setup_voted_poll):
+    poll, question = setup_voted_poll['poll'], setup_voted_poll['question']
+    voter = create_user('async_voter')
+    url = reverse('poll-vote', kwargs={'pk': poll.pk})
+
+    def vote(data, headers=None):
+        request = AsyncRequestFactory().post(url, data, content_type='application/json', headers=headers)
+        return asyncio.run(async_views.poll_vote(request, pk=poll.pk))
+
+    assert vote({'choice_id': setup_voted_poll['choice2'].id}).status_code == 401
+    assert vote({'choice_id': 0}, bearer(voter)).status_code == 400
+
+    response = vote({'choice_id': setup_voted_poll['choice2'].id}, bearer(voter))
+    assert response.status_code == 202
+    assert json.loads(response.content)['task_id']
+
+    process_vote(question.id, setup_voted_poll['choice2'].id, voter.id)  # as the worker would
+
+    response = vote({'choice_id': setup_voted_poll['choice1'].id}, bearer(voter))
+    assert response.status_code == 400
+    assert json.loads(response.content) == {'error': 'User already voted on this question'}
@@ -0,0 +1,69 @@
+import pytest
+from django.urls import reverse
+from polls import generations
+from polls.models import Poll
+from polls.tasks import votes_committed
+
+
+@pytest.mark.django_db
+def test_detail_revalidates_without_queries(api_client, setup_voted_poll, django_assert_num_queries):
+    poll = setup_voted_poll['poll']
+    url = reverse('poll-detail', kwargs={'pk': poll.pk})
+    response = api_client.get(url)
+    etag, modified = response['ETag'], response['Last-Modified']
+    assert response['Cache-Control'] == 'no-cache'
+
+    with django_assert_num_queries(0):
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+        assert api_client.get(url, HTTP_IF_MODIFIED_SINCE=modified).status_code == 304
+
+    Poll.objects.filter(pk=poll.pk).update(title='Renamed')
+    generations.bump(poll.pk)
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert response.json()['title'] == 'Renamed'
+
+
+@pytest.mark.django_db
+def test_validators_do_not_survive_a_redis_flush(api_client, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    url = reverse('poll-detail', kwargs={'pk': poll.pk})
+    etag = api_client.get(url)['ETag']
+
+    # The counters restart from 0 and now version a renamed poll
+    generations.get_connection().flushdb()
+    Poll.objects.filter(pk=poll.pk).update(title='Renamed')
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()['title'] == 'Renamed'
+
+
+@pytest.mark.django_db
+def test_stats_etag_changes_with_committed_votes(api_client, setup_voted_poll):
+    poll, question = setup_voted_poll['poll'], setup_voted_poll['question']
+    url = reverse('poll-stats', kwargs={'pk': poll.pk})
+    etag = api_client.get(url)['ETag']
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    votes_committed([(poll.pk, question.id, setup_voted_poll['choice2'].id, 1)])
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data['total_votes'] == 2
+
+
+@pytest.mark.django_db
+def test_list_revalidates_with_only_the_page_query(api_client, create_user, setup_voted_poll, django_assert_num_queries):
+    other = Poll.objects.create(title='Other', created_by=create_user('owner2'))
+    url = reverse('poll-list')
+    etag = api_client.get(url)['ETag']
+
+    with django_assert_num_queries(1):
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    # A page can lose a poll without the others changing, so lists are not dated
+    assert 'Last-Modified' not in api_client.get(url)
+
+    generations.bump(other.pk)
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    # A different page of the same polls is a different representation
+    assert api_client.get(url, {'page_size': 1})['ETag'] != etag
@@ -0,0 +1,52 @@
+import pytest
+from django.urls import reverse
+from polls.models import Choice, ChoiceVoteShard
+from polls.counters import increment_choice_votes
+from polls.serializers import ChoiceSerializer
+from polls.tasks import compact_vote_shards
+
+
+@pytest.fixture
+def sharded(settings):
+    settings.VOTE_COUNTER_SHARDS = 4
+
+
+@pytest.mark.django_db
+def test_increments_spread_across_shards(sharded, setup_voted_poll):
+    choice = setup_voted_poll['choice2']
+    for user_id in range(8):
+        increment_choice_votes(choice.id, shard_key=user_id)
+
+    shards = ChoiceVoteShard.objects.filter(choice=choice)
+    assert shards.count() == 4
+    assert sorted(shards.values_list('count', flat=True)) == [2, 2, 2, 2]
+    choice.refresh_from_db()
+    assert choice.votes_count == 0
+    assert choice.current_votes() == 8
+
+
+@pytest.mark.django_db
+def test_reads_use_summed_shard_value(sharded, api_client, setup_voted_poll):
+    choice1 = setup_voted_poll['choice1']
+    increment_choice_votes(choice1.id, amount=3, shard_key=1)
+
+    annotated = Choice.objects.with_total_votes().get(id=choice1.id)
+    assert ChoiceSerializer(annotated).data['votes_count'] == 4
+
+    choice_url = reverse('choice-detail', kwargs={'pk': choice1.pk})
+    assert api_client.get(choice_url).data['votes_count'] == 4
+
+
+@pytest.mark.django_db
+def test_compaction_folds_shards_into_votes_count(sharded, setup_voted_poll):
+    choice1, choice2 = setup_voted_poll['choice1'], setup_voted_poll['choice2']
+    increment_choice_votes(choice1.id, amount=2)
+    increment_choice_votes(choice2.id, amount=5)
+
+    assert compact_vote_shards()['compacted'] == 7
+
+    choice1.refresh_from_db()
+    choice2.refresh_from_db()
+    assert (choice1.votes_count, choice2.votes_count) == (3, 5)
+    assert choice1.current_votes() == 3
+    assert not ChoiceVoteShard.objects.filter(count__gt=0).exists()
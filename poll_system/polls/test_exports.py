@@ -0,0 +1,115 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import AsyncRequestFactory
+from django.urls import reverse
+from rest_framework.test import APIClient
+from polls import exports
+from polls.models import Poll, Question, Choice, Vote
+
+
+def read(response):
+    return b''.join(response.streaming_content)
+
+
+def owner_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.mark.django_db
+def test_export_csv(setup_voted_poll):
+    poll, vote = setup_voted_poll['poll'], Vote.objects.get()
+    response = owner_client(setup_voted_poll['user1']).get(reverse('poll-export', kwargs={'pk': poll.pk}))
+
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    assert response['Content-Disposition'] == f'attachment; filename="poll-{poll.pk}-votes.csv"'
+    rows = list(csv.reader(io.StringIO(read(response).decode())))
+    assert rows == [
+        list(exports.COLUMNS),
+        [str(vote.id), vote.created_at.isoformat(), str(vote.user_id), str(vote.question_id), 'Q1', str(vote.choice_id), 'C1'],
+    ]
+
+
+@pytest.mark.django_db
+def test_export_ndjson_gzipped(setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    url = reverse('poll-export', kwargs={'pk': poll.pk})
+    response = owner_client(setup_voted_poll['user1']).get(url, {'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert response['Content-Encoding'] == 'gzip'
+    [line] = gzip.decompress(read(response)).splitlines()
+    assert json.loads(line) | {'created_at': None} == {
+        'vote_id': Vote.objects.get().id, 'created_at': None, 'user_id': setup_voted_poll['user1'].id,
+        'question_id': setup_voted_poll['question'].id, 'question': 'Q1',
+        'choice_id': setup_voted_poll['choice1'].id, 'choice': 'C1',
+    }
+
+
+@pytest.mark.django_db
+def test_export_is_for_the_owner_and_staff(setup_voted_poll, create_user):
+    url = reverse('poll-export', kwargs={'pk': setup_voted_poll['poll'].pk})
+    assert APIClient().get(url).status_code == 401
+
+    other = create_user('other')
+    assert owner_client(other).get(url).status_code == 403
+    other.is_staff = True
+    other.save()
+    assert owner_client(other).get(url).status_code == 200
+    assert owner_client(other).get(reverse('poll-export', kwargs={'pk': 999})).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_export_streams_under_asgi(setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    request = AsyncRequestFactory().get(f'/api/v1/polls/{poll.pk}/export/')
+
+    async def body():
+        response = exports.streaming_response(request, poll.pk, 'csv')
+        assert response.is_async
+        return b''.join([chunk async for chunk in response])
+
+    assert asyncio.run(body()).count(b'\n') == 2
+
+
+@pytest.mark.django_db
+def test_export_command(setup_voted_poll, tmp_path):
+    path = tmp_path / 'votes.ndjson.gz'
+    call_command('export_votes', setup_voted_poll['poll'].pk, format='ndjson', output=str(path), gzip=True)
+    [line] = gzip.decompress(path.read_bytes()).splitlines()
+    assert json.loads(line)['choice'] == 'C1'
+
+
+@pytest.mark.django_db
+def test_export_memory_stays_flat(create_user):
+    owner = create_user('owner')
+    poll = Poll.objects.create(title='Big', created_by=owner)
+    questions = Question.objects.bulk_create(Question(poll=poll, text=f'Question {i}') for i in range(3))
+    choices = Choice.objects.bulk_create(Choice(question=question, text='Choice') for question in questions)
+    voters = User.objects.bulk_create(User(username=f'voter{i}') for i in range(10_000))
+
+    def peak_memory(votes):
+        Vote.objects.all().delete()
+        Vote.objects.bulk_create(
+            Vote(question=choice.question, choice=choice, user=voter) for voter in voters[:votes // 3] for choice in choices
+        )
+        tracemalloc.start()
+        size = sum(len(chunk) for chunk in exports.export_chunks(poll.pk, 'csv', chunk_size=500))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size, peak
+
+    small_size, small_peak = peak_memory(3_000)
+    large_size, large_peak = peak_memory(30_000)
+    assert large_size > 9 * small_size
+    assert large_peak < 2 * small_peak
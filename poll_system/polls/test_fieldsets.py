@@ -0,0 +1,59 @@
+import pytest
+from django.urls import reverse
+
+
+@pytest.mark.django_db
+def test_sparse_list_skips_nested_queries(api_client, setup_voted_poll, django_assert_num_queries):
+    url = reverse('poll-list')
+    # Page of ids, then the selected poll columns
+    with django_assert_num_queries(2):
+        response = api_client.get(url, {'fields': 'id,title,end_date'})
+    assert response.json()['results'] == [{'id': setup_voted_poll['poll'].pk, 'title': 'Test Vote Poll', 'end_date': None}]
+
+    # The full representation is cached apart from the sparse one
+    poll = api_client.get(url).json()['results'][0]
+    assert poll['questions'][0]['choices'][0]['votes_count'] == 1
+
+
+@pytest.mark.django_db
+def test_fields_without_id(api_client, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    response = api_client.get(reverse('poll-list'), {'fields': 'title'})
+    assert response.status_code == 200
+    assert response.json()['results'] == [{'title': 'Test Vote Poll'}]
+
+    response = api_client.get(reverse('poll-detail', kwargs={'pk': poll.pk}), {'fields': 'title'})
+    assert response.status_code == 200
+    assert response.json() == {'title': 'Test Vote Poll'}
+
+
+@pytest.mark.django_db
+def test_expand_controls_nesting_depth(api_client, setup_voted_poll):
+    url = reverse('poll-detail', kwargs={'pk': setup_voted_poll['poll'].pk})
+
+    questions = api_client.get(url, {'expand': 'questions'}).json()['questions']
+    assert questions == [{'id': setup_voted_poll['question'].id, 'text': 'Q1', 'poll': setup_voted_poll['poll'].pk}]
+
+    # Listing a relation in fields nests it fully
+    poll = api_client.get(url, {'fields': 'id,questions'}).json()
+    assert list(poll) == ['id', 'questions']
+    assert len(poll['questions'][0]['choices']) == 2
+
+
+@pytest.mark.django_db
+def test_unknown_fields_fail_before_querying(api_client, setup_voted_poll, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        response = api_client.get(reverse('poll-list'), {'fields': 'id,secret'})
+    assert response.status_code == 400
+    assert 'secret' in response.data['fields']
+
+    url = reverse('question-detail', kwargs={'pk': setup_voted_poll['question'].id})
+    assert api_client.get(url, {'expand': 'choices.votes'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_question_fields(api_client, setup_voted_poll):
+    question = setup_voted_poll['question']
+    url = reverse('question-detail', kwargs={'pk': question.id})
+    assert api_client.get(url, {'fields': 'id,text'}).data == {'id': question.id, 'text': 'Q1'}
+    assert len(api_client.get(url, {'fields': 'id', 'expand': 'choices'}).data['choices']) == 2
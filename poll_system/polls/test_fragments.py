@@ -0,0 +1,74 @@
+import json
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from polls import fragments, generations, readers
+from polls.models import Poll
+from polls.serializers import PollSerializer
+from polls.views import PollViewSet
+
+
+@pytest.fixture
+def rendered_polls(monkeypatch):
+    """Records the ids of polls built on a fragment cache miss."""
+    calls = []
+    original = readers.polls_by_id
+
+    def polls_by_id(queryset, *args):
+        data = original(queryset, *args)
+        calls.extend(data)
+        return data
+
+    monkeypatch.setattr(readers, 'polls_by_id', polls_by_id)
+    return calls
+
+
+@pytest.mark.django_db
+def test_detail_sends_the_serializer_output_bytes(api_client, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    response = api_client.get(reverse('poll-detail', kwargs={'pk': poll.pk}))
+
+    expected = PollSerializer(PollViewSet.queryset.get(pk=poll.pk)).data
+    assert response.content == JSONRenderer().render(expected)
+    assert response['Content-Type'] == 'application/json'
+
+
+@pytest.mark.django_db
+def test_list_only_renders_missing_fragments(api_client, create_user, setup_voted_poll, rendered_polls):
+    other = Poll.objects.create(title='Other', created_by=create_user('owner2'))
+    url = reverse('poll-list')
+    api_client.get(url)
+    assert sorted(rendered_polls) == sorted([setup_voted_poll['poll'].pk, other.pk])
+
+    rendered_polls.clear()
+    generations.bump(other.pk)
+    body = api_client.get(url).json()
+    assert rendered_polls == [other.pk]
+    assert [poll['id'] for poll in body['results']] == [other.pk, setup_voted_poll['poll'].pk]
+    assert body['next'] is None and body['previous'] is None
+
+
+@pytest.mark.django_db
+def test_api_writes_render_the_new_fragment(auth_client, django_capture_on_commit_callbacks):
+    response = auth_client.post(reverse('poll-list'), {'title': 'Fresh', 'questions': []}, format='json')
+    poll_id = response.json()['id']
+
+    fragment = cache.get(fragments.fragment_key(poll_id, generations.get_generation(poll_id)))
+    assert fragment == response.content
+    assert json.loads(fragment)['title'] == 'Fresh'
+
+    # The update's response is cached as the new generation's fragment
+    with django_capture_on_commit_callbacks(execute=True):
+        response = auth_client.put(reverse('poll-detail', kwargs={'pk': poll_id}), {'title': 'Edited'}, format='json')
+    assert response.json()['title'] == 'Edited'
+    fragment = cache.get(fragments.fragment_key(poll_id, generations.get_generation(poll_id)))
+    assert fragment == response.content
+
+
+@pytest.mark.django_db
+def test_browsable_api_still_renders(api_client, setup_voted_poll):
+    url = reverse('poll-detail', kwargs={'pk': setup_voted_poll['poll'].pk})
+    response = api_client.get(url, HTTP_ACCEPT='text/html')
+    assert response.status_code == 200
+    assert response.data['title'] == 'Test Vote Poll'
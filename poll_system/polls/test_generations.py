@@ -0,0 +1,102 @@
+import json
+import pytest
+import redis
+from django.urls import reverse
+from polls import conditional, generations
+from polls.models import Poll
+
+
+@pytest.fixture
+def command_log(monkeypatch):
+    """Records every command sent to Redis."""
+    log = []
+    original = redis.Redis.execute_command
+
+    def execute_command(self, *args, **options):
+        log.append(args[0])
+        return original(self, *args, **options)
+
+    monkeypatch.setattr(redis.Redis, 'execute_command', execute_command)
+    return log
+
+
+@pytest.mark.django_db
+def test_detail_cache_follows_poll_generation(api_client, setup_voted_poll, django_assert_num_queries):
+    poll = setup_voted_poll['poll']
+    url = reverse('poll-detail', kwargs={'pk': poll.pk})
+    api_client.get(url)
+
+    Poll.objects.filter(pk=poll.pk).update(title='Renamed')
+    with django_assert_num_queries(0):
+        assert api_client.get(url).json()['title'] == 'Test Vote Poll'
+
+    generations.bump(poll.pk)
+    assert api_client.get(url).json()['title'] == 'Renamed'
+
+
+@pytest.mark.django_db
+def test_list_only_reserializes_bumped_polls(api_client, create_user, setup_voted_poll, django_assert_num_queries):
+    other = Poll.objects.create(title='Other', created_by=create_user('owner2'))
+    url = reverse('poll-list')
+    assert len(api_client.get(url).json()['results']) == 2
+
+    # Only the id lookup hits the database when every fragment is cached
+    with django_assert_num_queries(1):
+        api_client.get(url)
+
+    Poll.objects.filter(pk=other.pk).update(title='Other renamed')
+    generations.bump(other.pk)
+    # id lookup, then the missing poll with its owner, and its questions
+    with django_assert_num_queries(3):
+        titles = [poll['title'] for poll in api_client.get(url).json()['results']]
+    assert titles == ['Other renamed', 'Test Vote Poll']
+
+
+@pytest.mark.django_db
+def test_graphql_result_cached_until_generation_changes(api_client, setup_voted_poll, django_assert_num_queries):
+    poll = setup_voted_poll['poll']
+    query = {'query': '{ poll(id: %d) { title } }' % poll.pk}
+    api_client.post('/graphql/', query, format='json')
+
+    Poll.objects.filter(pk=poll.pk).update(title='Renamed')
+    with django_assert_num_queries(0):
+        response = api_client.post('/graphql/', query, format='json')
+    assert json.loads(response.content)['data']['poll']['title'] == 'Test Vote Poll'
+
+    generations.bump(poll.pk)
+    response = api_client.post('/graphql/', query, format='json')
+    assert json.loads(response.content)['data']['poll']['title'] == 'Renamed'
+
+
+def test_invalidation_cost_is_flat_at_one_million_keys(command_log):
+    conn = generations.get_connection()
+    # Fragments of a million polls at generation 0, poll 1's current one among them
+    keys = [generations.cache_key('detail', poll_id, 0) for poll_id in range(1_000_000)]
+    counters = [generations.generation_key(1), generations.generation_key(2)]
+    conn.delete(*counters)
+    try:
+        command_log.clear()
+        generations.bump(2)
+        small_keyspace_commands = list(command_log)
+
+        size = conn.dbsize()
+        for start in range(0, len(keys), 10000):
+            conn.mset(dict.fromkeys(keys[start:start + 10000], 'cached'))
+        assert conn.dbsize() >= size + 1_000_000
+        before = generations.get_generations([1])
+        assert conn.get(generations.cache_key('detail', 1, before[1])) == b'cached'
+        etag = conditional.make_etag('detail', before, 'json')
+
+        command_log.clear()
+        generations.bump(1)
+        assert command_log == small_keyspace_commands == ['INCRBY']
+
+        # Nothing was deleted, yet the stale fragment and ETag are no longer served
+        assert conn.dbsize() >= size + 1_000_000
+        after = generations.get_generations([1])
+        assert conn.get(generations.cache_key('detail', 1, after[1])) is None
+        assert conditional.make_etag('detail', after, 'json') != etag
+    finally:
+        for start in range(0, len(keys), 10000):
+            conn.delete(*keys[start:start + 10000])
+        conn.delete(*counters)
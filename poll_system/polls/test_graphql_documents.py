@@ -0,0 +1,110 @@
+import json
+import pytest
+from django.urls import reverse
+from polls import graphql_documents
+from polls.schema import schema
+
+POLLS_QUERY = '{ allPolls { id title } }'
+
+
+@pytest.fixture(autouse=True)
+def fresh_documents():
+    graphql_documents.clear_document_cache()
+    graphql_documents.metrics.clear()
+
+
+def post(client, body):
+    response = client.post('/graphql/', body, format='json')
+    return response.status_code, json.loads(response.content)
+
+
+def persisted(query_hash):
+    return {'persistedQuery': {'version': 1, 'sha256Hash': query_hash}}
+
+
+@pytest.mark.django_db
+def test_persisted_queries(api_client, setup_voted_poll):
+    query_hash = graphql_documents.query_hash(POLLS_QUERY)
+
+    status, body = post(api_client, {'extensions': persisted(query_hash)})
+    assert status == 200
+    assert body['errors'][0]['message'] == 'PersistedQueryNotFound'
+
+    status, body = post(api_client, {'query': POLLS_QUERY, 'extensions': persisted(query_hash)})
+    assert body['data']['allPolls'][0]['title'] == 'Test Vote Poll'
+
+    status, body = post(api_client, {'extensions': persisted(query_hash)})
+    assert status == 200
+    assert body['data']['allPolls'][0]['title'] == 'Test Vote Poll'
+
+    # Also over GET, as CDN friendly clients send them
+    response = api_client.get('/graphql/', {'extensions': json.dumps(persisted(query_hash))}, HTTP_ACCEPT='application/json')
+    assert json.loads(response.content)['data']['allPolls'][0]['title'] == 'Test Vote Poll'
+
+    status, body = post(api_client, {'query': '{ allPolls { id } }', 'extensions': persisted(query_hash)})
+    assert status == 400
+    assert body['errors'][0]['message'] == 'provided sha does not match query'
+
+    metrics = graphql_documents.get_metrics()
+    assert metrics['persisted_queries_registered'] == 1
+    assert metrics['persisted_query_hits'] == 2
+    assert metrics['persisted_query_misses'] == 1
+
+
+@pytest.mark.django_db
+def test_invalid_queries_are_not_persisted(api_client):
+    query = '{ allPolls { nope } }'
+    post(api_client, {'query': query, 'extensions': persisted(graphql_documents.query_hash(query))})
+    assert 'persisted_queries_registered' not in graphql_documents.get_metrics()
+
+
+@pytest.mark.django_db
+def test_documents_are_parsed_once(api_client, setup_voted_poll):
+    for _ in range(3):
+        post(api_client, {'query': POLLS_QUERY})
+    metrics = graphql_documents.get_metrics()
+    assert metrics['document_cache_misses'] == 1
+    assert metrics['document_cache_size'] == 1
+    assert metrics['document_cache_hits'] >= 2
+
+
+def test_query_cost(settings):
+    settings.API_PAGE_SIZE, settings.GRAPHQL_LIST_SIZE_ESTIMATE = 20, 10
+    query = '''query($n: Int) {
+      allPolls(first: $n) { id ...Questions }
+      poll(id: 1) { title }
+    }
+    fragment Questions on PollType { questions { id choices { text votesCount } } }'''
+    document, errors = graphql_documents.get_document(schema.graphql_schema, query)
+    assert errors == []
+    # questions: 1 + 10 * (1 + (1 + 10 * 2)); polls: 1 + n * (1 + questions); poll: 2
+    assert graphql_documents.query_cost(schema.graphql_schema, document, variables={'n': 5}) == 1 + 5 * 222 + 2
+    # Without 'first' the resolver's default page size applies
+    assert graphql_documents.query_cost(schema.graphql_schema, document) == 1 + 20 * 222 + 2
+
+
+@pytest.mark.django_db
+def test_costly_queries_are_rejected(api_client, settings, setup_voted_poll):
+    settings.GRAPHQL_MAX_QUERY_COST = 1000
+    status, body = post(api_client, {'query': '{ allPolls(first: 100) { questions { choices { text } } } }'})
+    assert status == 400
+    assert body['errors'][0]['extensions'] == {'code': 'QUERY_TOO_COSTLY', 'cost': 11101, 'limit': 1000}
+    assert 'data' not in body
+
+    status, body = post(api_client, {'query': '{ allPolls(first: 5) { questions { choices { text } } } }'})
+    assert status == 200
+    assert graphql_documents.get_metrics()['queries_rejected_by_cost'] == 1
+
+
+@pytest.mark.django_db
+def test_metrics_are_for_staff_only(api_client, create_user):
+    url = reverse('graphql-metrics')
+    assert api_client.get(url).status_code == 401
+
+    admin = create_user('admin')
+    admin.is_staff = True
+    admin.save()
+    api_client.force_authenticate(admin)
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert response.data['document_cache_capacity'] == graphql_documents.get_metrics()['document_cache_capacity']
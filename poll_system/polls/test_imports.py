@@ -0,0 +1,150 @@
+import json
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from polls import imports
+from polls.models import Poll, Question, Choice
+from polls.serializers import PollSerializer
+
+
+def survey(title, questions):
+    return {
+        'title': title,
+        'questions': [{'text': f'Q{i}', 'choices': [{'text': 'Yes'}, {'text': 'No'}]} for i in range(questions)],
+    }
+
+
+def ndjson(*polls):
+    return '\n'.join(json.dumps(poll) if isinstance(poll, dict) else poll for poll in polls) + '\n'
+
+
+@pytest.mark.django_db
+def test_nested_create_inserts_once_per_level(create_user):
+    user = create_user('owner')
+    counts = []
+    for questions in (1, 50):
+        serializer = PollSerializer(data=survey(f'{questions} questions', questions))
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as queries:
+            poll = serializer.save(created_by=user)
+        counts.append(sum(query['sql'].startswith('INSERT') for query in queries))
+        assert list(poll.questions.order_by('id').values_list('text', flat=True)) == [f'Q{i}' for i in range(questions)]
+        assert Choice.objects.filter(question__poll=poll).count() == 2 * questions
+    assert counts == [3, 3]
+
+
+@pytest.mark.django_db
+def test_create_and_update_requests_do_not_grow_with_the_poll(create_user):
+    client = APIClient()
+    client.force_authenticate(create_user('owner'))
+    create_counts, update_counts = [], []
+    for questions, choices in ((1, 1), (50, 5)):
+        data = {
+            'title': f'{questions} questions',
+            'questions': [{'text': f'Q{i}', 'choices': [{'text': f'C{j}'} for j in range(choices)]} for i in range(questions)],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(reverse('poll-list'), data, format='json')
+        assert response.status_code == 201
+        create_counts.append(len(queries))
+        created = response.json()
+        assert len(created['questions']) == questions
+        assert created['questions'][-1]['choices'][-1] == {
+            'id': Choice.objects.latest('id').id, 'text': f'C{choices - 1}',
+            'question': created['questions'][-1]['id'], 'votes_count': 0,
+        }
+
+        # Keeps every question and choice, edits their texts
+        data = {'title': 'Renamed', 'questions': [
+            {'id': question['id'], 'text': question['text'] + '!', 'choices': [
+                {'id': choice['id'], 'text': choice['text'] + '!'} for choice in question['choices']
+            ]} for question in created['questions']
+        ]}
+        with CaptureQueriesContext(connection) as queries:
+            response = client.put(reverse('poll-detail', kwargs={'pk': created['id']}), data, format='json')
+        assert response.status_code == 200
+        update_counts.append(len(queries))
+        updated = response.json()
+        assert updated['title'] == 'Renamed'
+        assert updated['questions'][-1]['choices'][-1]['text'] == f'C{choices - 1}!'
+    # Create: user, 3 INSERTs, savepoints and one batched read per level for the response
+    assert create_counts == [8, 8]
+    assert update_counts == [13, 13]
+
+
+@pytest.mark.django_db
+def test_polls_without_questions_can_be_created(auth_client):
+    response = auth_client.post(reverse('poll-list'), {'title': 'Bare'}, format='json')
+    assert response.status_code == 201
+    assert not Question.objects.filter(poll_id=response.json()['id']).exists()
+
+
+@pytest.mark.django_db
+def test_import_ndjson(auth_client):
+    body = ndjson(survey('First', 2), '{"title": ', survey('', 1), survey('Second', 1))
+    response = auth_client.generic('POST', reverse('poll-import'), body, content_type='application/x-ndjson')
+
+    assert response.status_code == 201
+    assert response.data['created'] == 2
+    assert response.data['invalid'] == 2
+    assert [error['line'] for error in response.data['errors']] == [2, 3]
+    assert 'title' in response.data['errors'][1]['errors']
+
+    polls = Poll.objects.order_by('id')
+    assert [poll.title for poll in polls] == ['First', 'Second']
+    assert all(poll.created_by == auth_client.user for poll in polls)
+    assert Choice.objects.filter(question__poll=polls[0]).count() == 4
+
+
+@pytest.mark.django_db
+def test_import_csv(auth_client):
+    body = (
+        'title,description,question,choice\n'
+        'Lunch,Where to eat,Cuisine,Thai\n'
+        'Lunch,,Cuisine,Pizza\n'
+        'Lunch,,Time,Noon\n'
+        'Empty,,,\n'
+    )
+    response = auth_client.generic('POST', reverse('poll-import'), body, content_type='text/csv')
+    assert response.status_code == 201
+    assert response.data == {'created': 2, 'invalid': 0, 'errors': []}
+
+    lunch = Poll.objects.get(title='Lunch')
+    assert lunch.description == 'Where to eat'
+    questions = lunch.questions.order_by('id')
+    assert [question.text for question in questions] == ['Cuisine', 'Time']
+    assert list(questions[0].choices.order_by('id').values_list('text', flat=True)) == ['Thai', 'Pizza']
+    assert not Poll.objects.get(title='Empty').questions.exists()
+
+
+@pytest.mark.django_db
+def test_import_rejects_bad_requests(auth_client):
+    url = reverse('poll-import')
+    assert APIClient().generic('POST', url, ndjson(survey('Anon', 1)), content_type='application/x-ndjson').status_code == 401
+    assert auth_client.post(url, survey('JSON', 1), format='json').status_code == 415
+
+    response = auth_client.generic('POST', url, ndjson('not json'), content_type='application/x-ndjson')
+    assert response.status_code == 400
+    assert response.data['created'] == 0
+
+
+@pytest.mark.django_db
+def test_import_command_works_in_chunks(create_user, tmp_path, capsys):
+    create_user('importer')
+    path = tmp_path / 'polls.ndjson'
+    path.write_text(ndjson(*(survey(f'Poll {i}', 2) for i in range(5))))
+
+    with CaptureQueriesContext(connection) as queries:
+        call_command('import_polls', str(path), user='importer', chunk_size=2)
+    assert 'Imported 5 polls' in capsys.readouterr().out
+    assert Poll.objects.filter(created_by__username='importer').count() == 5
+    # Three chunks of three INSERTs each
+    assert sum(query['sql'].startswith('INSERT') for query in queries) == 9
+
+
+def test_csv_requires_a_title_column():
+    records = list(imports.read_csv(['question,choice\n', 'Q,C\n']))
+    assert records == [(1, None, {'non_field_errors': ['The header row must name a title column.']})]
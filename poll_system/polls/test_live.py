@@ -0,0 +1,117 @@
+import asyncio
+import json
+import tracemalloc
+import pytest
+from django.test import AsyncClient
+from django.urls import reverse
+from polls import live, tallies
+from polls.tasks import publish_live_updates, votes_committed
+
+
+@pytest.mark.django_db
+def test_votes_within_a_tick_publish_one_update(setup_voted_poll):
+    poll, question = setup_voted_poll['poll'], setup_voted_poll['question']
+    choice2 = setup_voted_poll['choice2']
+    tallies.rebuild_poll_tallies(poll.pk)
+
+    pubsub = tallies.get_connection().pubsub()
+    pubsub.subscribe(live.CHANNEL)
+    pubsub.get_message(timeout=1)  # subscribe confirmation
+
+    for _ in range(3):
+        votes_committed([(poll.pk, question.id, choice2.id, 1)])
+    assert publish_live_updates()['published'] == 1
+    assert publish_live_updates()['published'] == 0
+
+    message = pubsub.get_message(timeout=1)
+    poll_id, data = message['data'].split(b' ', 1)
+    assert int(poll_id) == poll.pk
+    assert json.loads(data)['total_votes'] == 4
+    assert pubsub.get_message(timeout=0.2) is None
+    pubsub.close()
+
+
+def test_hub_fans_out_one_subscription_to_poll_listeners():
+    async def scenario():
+        hub = live.get_hub()
+        first, second, other = hub.subscribe(1), hub.subscribe(1), hub.subscribe(2)
+        await asyncio.sleep(0.2)  # let the reader subscribe
+
+        conn = tallies.get_connection()
+        conn.publish(live.CHANNEL, '1 {"total_votes": 1}')
+        conn.publish(live.CHANNEL, '1 {"total_votes": 2}')
+        await asyncio.sleep(0.2)
+
+        hub.reader.cancel()
+        # Listeners only keep the newest update
+        return first.get_nowait(), second.get_nowait(), first.empty(), other.empty()
+
+    first, second, first_drained, other_empty = asyncio.run(scenario())
+    assert first == second == b'event: stats\ndata: {"total_votes": 2}\n\n'
+    assert first_drained and other_empty
+
+
+@pytest.fixture
+def streaming(settings):
+    settings.LIVE_STATS_STREAM = True
+
+
+@pytest.mark.django_db(transaction=True)
+def test_stream_starts_with_current_stats(streaming, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+
+    async def first_event():
+        response = await AsyncClient().get(f'/api/v1/polls/{poll.pk}/stream/')
+        event = await anext(aiter(response.streaming_content))
+        return response, event
+
+    response, event = asyncio.run(first_event())
+    assert response['Content-Type'] == 'text/event-stream'
+    assert event.startswith(b'event: stats\ndata: ')
+    assert json.loads(event.split(b'data: ', 1)[1])['total_votes'] == 1
+
+
+@pytest.mark.django_db
+def test_wsgi_deployments_poll_instead_of_streaming(settings, client, setup_voted_poll):
+    # The default: sync workers, where each open stream would hold a worker
+    settings.LIVE_STATS_STREAM = False
+    poll = setup_voted_poll['poll']
+    assert client.get(f'/api/v1/polls/{poll.pk}/stream/').status_code == 404
+    page = client.get(reverse('home')).content
+    assert b'const LIVE_STATS_STREAM = false;' in page
+
+    settings.LIVE_STATS_STREAM = True
+    assert b'const LIVE_STATS_STREAM = true;' in client.get(reverse('home')).content
+
+
+def test_one_process_holds_ten_thousand_subscribers():
+    """10k idle streams of one poll, each woken by a single published update."""
+    async def scenario(count=10000):
+        received = []
+
+        async def subscriber():
+            stream = live.stream_events(1, {'total_votes': 0})
+            await anext(stream)
+            received.append(await anext(stream))
+            await stream.aclose()
+
+        conn = tallies.get_connection()
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            subscribers = [asyncio.create_task(subscriber()) for _ in range(count)]
+            while len(live.get_hub().listeners[1]) < count or not conn.pubsub_numsub(live.CHANNEL)[0][1]:
+                await asyncio.sleep(0.1)
+            held = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+
+        conn.publish(live.CHANNEL, '1 {"total_votes": 1}')
+        await asyncio.wait_for(asyncio.gather(*subscribers), timeout=60)
+        live.get_hub().reader.cancel()
+        return received, held / count
+
+    received, bytes_per_subscriber = asyncio.run(scenario())
+    assert received == [b'event: stats\ndata: {"total_votes": 1}\n\n'] * 10000
+    # About 7 KB each, measured; the connections themselves are the server's
+    assert bytes_per_subscriber < 16 * 1024
@@ -0,0 +1,84 @@
+import json
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from polls import generations, tallies
+from polls.models import Poll, Question, Choice, Vote
+
+DEEP_QUERY = '''{
+  allPolls(first: 10) {
+    id createdBy { username }
+    questions {
+      text poll { title createdBy { username } }
+      choices { text votesCount question { text poll { id } } }
+    }
+  }
+}'''
+
+
+def make_polls(create_user, count, start=0):
+    for i in range(start, start + count):
+        poll = Poll.objects.create(title=f'Poll {i}', created_by=create_user(f'owner{i}'))
+        for j in range(3):
+            question = Question.objects.create(poll=poll, text=f'Q{i}.{j}')
+            Choice.objects.bulk_create(Choice(question=question, text=f'C{i}.{j}.{k}') for k in range(3))
+        tallies.rebuild_poll_tallies(poll.pk)
+    generations.bump(generations.ALL_POLLS)
+
+
+def run(api_client, query):
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.post('/graphql/', {'query': query}, format='json')
+    body = json.loads(response.content)
+    assert 'errors' not in body
+    return body['data'], len(queries)
+
+
+@pytest.mark.django_db
+def test_nested_queries_cost_one_statement_per_relation(api_client, create_user):
+    make_polls(create_user, 2)
+    data, few = run(api_client, DEEP_QUERY)
+    assert len(data['allPolls']) == 2
+    # polls, users, questions, choices
+    assert few == 4
+
+    make_polls(create_user, 8, start=2)
+    data, many = run(api_client, DEEP_QUERY)
+    assert many == few
+
+    poll = data['allPolls'][-1]
+    assert poll['createdBy'] == {'username': 'owner0'}
+    assert [question['text'] for question in poll['questions']] == ['Q0.0', 'Q0.1', 'Q0.2']
+    question = poll['questions'][0]
+    assert question['poll'] == {'title': 'Poll 0', 'createdBy': {'username': 'owner0'}}
+    assert question['choices'][0] == {
+        'text': 'C0.0.0', 'votesCount': 0, 'question': {'text': 'Q0.0', 'poll': {'id': poll['id']}},
+    }
+
+
+@pytest.mark.django_db
+def test_single_poll_relations_are_batched(api_client, create_user):
+    make_polls(create_user, 1)
+    poll = Poll.objects.get()
+    query = f'{{ poll(id: {poll.pk}) {{ createdBy {{ username }} questions {{ choices {{ question {{ poll {{ id }} }} }} }} }} }}'
+    data, count = run(api_client, query)
+    assert len(data['poll']['questions']) == 3
+    assert count == 4
+
+
+@pytest.mark.django_db
+def test_cold_tallies_are_counted_in_one_query(api_client, create_user):
+    make_polls(create_user, 5)
+    choice = Choice.objects.order_by('id').first()
+    Vote.objects.create(question=choice.question, choice=choice, user=create_user('voter'))
+    # As after a Redis flush
+    for poll in Poll.objects.all():
+        tallies.drop_poll_tallies(poll.pk)
+
+    query = '{ allPolls(first: 10) { questions { choices { id votesCount } } } }'
+    data, count = run(api_client, query)
+    # polls, questions, choices, then the votes of every poll
+    assert count == 4
+    counts = {c['id']: c['votesCount'] for p in data['allPolls'] for q in p['questions'] for c in q['choices']}
+    assert counts[str(choice.pk)] == 1
+    assert sum(counts.values()) == 1
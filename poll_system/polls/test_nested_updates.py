@@ -0,0 +1,135 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from hypothesis import HealthCheck, given, settings, strategies as st
+from polls.models import Choice, Vote
+from polls.serializers import PollSerializer, create_polls
+
+texts = st.sampled_from(['A', 'B', 'C', 'D'])
+trees = st.lists(st.lists(texts, max_size=4), max_size=5)  # choice texts per question
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_poll(owner, tree, title='Poll'):
+    return create_polls([{
+        'title': title, 'created_by': owner,
+        'questions': [{'text': f'Q{i}', 'choices': [{'text': text} for text in choices]} for i, choices in enumerate(tree)],
+    }])[0]
+
+
+def current_tree(poll):
+    return {
+        question.id: (question.text, {choice.id: choice.text for choice in question.choices.all()})
+        for question in poll.questions.prefetch_related('choices')
+    }
+
+
+@st.composite
+def edits(draw, current, foreign_ids):
+    """A random payload: current questions and choices kept, edited or dropped, new ones added, ids misused."""
+    stray_id = st.sampled_from(foreign_ids + [10 ** 6])
+    payload = []
+    for question_id, (text, choices) in current.items():
+        if draw(st.booleans()):
+            continue  # dropped
+        question = {'id': question_id, 'text': draw(st.sampled_from([text, text + '!'])), 'choices': []}
+        for choice_id, choice_text in choices.items():
+            if draw(st.booleans()):
+                question['choices'].append({'id': choice_id, 'text': draw(st.sampled_from([choice_text, 'E']))})
+        for text in draw(st.lists(texts, max_size=2)):
+            choice = {'text': text}
+            if draw(st.booleans()):
+                choice['id'] = draw(stray_id)
+            question['choices'].append(choice)
+        payload.append(question)
+    for choices in draw(st.lists(st.lists(texts, max_size=3), max_size=2)):
+        question = {'text': 'New', 'choices': [{'text': text} for text in choices]}
+        if draw(st.booleans()):
+            question['id'] = draw(stray_id)
+        payload.append(question)
+    if payload and draw(st.booleans()):
+        payload.append(dict(draw(st.sampled_from(payload))))  # the same id twice
+    return draw(st.permutations(payload))
+
+
+def expected_ids(current, payload):
+    """The ids that must survive: first uses of ids belonging to the right parent."""
+    questions, choices = set(), set()
+    for question in payload:
+        question_id = question.get('id')
+        if question_id not in current or question_id in questions:
+            continue
+        questions.add(question_id)
+        for choice in question['choices']:
+            if choice.get('id') in current[question_id][1] and choice['id'] not in choices:
+                choices.add(choice['id'])
+    return questions, choices
+
+
+def shape(questions):
+    return sorted((text, sorted(choices)) for text, choices in questions)
+
+
+@pytest.mark.django_db
+@settings(max_examples=75, deadline=None, suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(tree=trees, other_tree=trees, data=st.data())
+def test_update_makes_the_tree_match_the_payload(tree, other_tree, data):
+    try:
+        with transaction.atomic():
+            owner = User.objects.create_user('owner')
+            poll = make_poll(owner, tree)
+            other = make_poll(owner, other_tree, title='Other')
+            current = current_tree(poll)
+            foreign = current_tree(other)
+            foreign_ids = list(foreign) + [choice_id for _, choices in foreign.values() for choice_id in choices]
+            payload = data.draw(edits(current, foreign_ids))
+
+            serializer = PollSerializer(poll, data={'title': 'Poll', 'questions': payload})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+            after = current_tree(poll)
+            assert shape((text, choices.values()) for text, choices in after.values()) == shape(
+                (question['text'], [choice['text'] for choice in question['choices']]) for question in payload
+            )
+            kept_questions, kept_choices = expected_ids(current, payload)
+            assert set(after) & set(current) == kept_questions
+            after_choices = {choice_id for _, choices in after.values() for choice_id in choices}
+            all_current_choices = {choice_id for _, choices in current.values() for choice_id in choices}
+            assert after_choices & all_current_choices == kept_choices
+            # Other polls are untouched
+            assert current_tree(other) == foreign
+            raise Rollback
+    except Rollback:
+        pass
+
+
+@pytest.mark.django_db
+def test_update_queries_do_not_grow_with_the_poll(create_user):
+    owner = create_user('owner')
+    counts = []
+    for size in (2, 40):
+        poll = make_poll(owner, [['A', 'B', 'C']] * size)
+        Vote.objects.create(user=owner, question=poll.questions.first(), choice=Choice.objects.filter(question__poll=poll).first())
+        questions = list(poll.questions.prefetch_related('choices').order_by('id'))
+        payload = [
+            {'id': question.id, 'text': 'Edited', 'choices': [
+                {'id': choice.id, 'text': choice.text} for choice in list(question.choices.all())[1:]
+            ] + [{'text': 'New'}]}
+            for question in questions[1:]
+        ] + [{'text': 'Added', 'choices': [{'text': 'X'}]}]
+
+        serializer = PollSerializer(poll, data={'title': 'Poll', 'questions': payload})
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        counts.append(len(queries))
+
+        assert poll.questions.count() == size
+        assert Choice.objects.filter(question__poll=poll).count() == 3 * (size - 1) + 1
+        assert not Vote.objects.filter(question__poll=poll).exists()
+    assert counts[0] == counts[1]
@@ -0,0 +1,73 @@
+import json
+from datetime import timedelta
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from polls.models import Poll, Question, Choice
+
+
+@pytest.fixture
+def many_polls(create_user):
+    owner = create_user('owner')
+    now = timezone.now()
+    polls = [Poll.objects.create(title=f'Poll {i}', created_by=owner) for i in range(7)]
+    for i, poll in enumerate(polls):
+        Poll.objects.filter(pk=poll.pk).update(created_at=now - timedelta(minutes=i))
+    # Newest first
+    return [poll.pk for poll in polls]
+
+
+@pytest.mark.django_db
+def test_poll_pages_cost_the_same_at_any_depth(api_client, many_polls, django_assert_num_queries):
+    url, seen, page_queries = reverse('poll-list'), [], []
+    params = {'page_size': 2}
+    while url:
+        with django_assert_num_queries(3, exact=False) as captured:
+            data = api_client.get(url, params).json()
+        page_queries.append(len(captured))
+        seen += [poll['id'] for poll in data['results']]
+        url, params = data['next'], None
+
+    assert seen == many_polls
+    # Every page is one keyset range query plus the fragments it has to build
+    assert len(set(page_queries)) == 1
+
+
+@pytest.mark.django_db
+def test_page_size_is_capped(api_client, many_polls):
+    response = api_client.get(reverse('poll-list'), {'page_size': 10_000})  # capped at API_MAX_PAGE_SIZE
+    assert len(response.json()['results']) == 7
+    assert response.json()['next'] is None
+
+
+@pytest.mark.django_db
+def test_choices_are_paginated_by_id(api_client, setup_voted_poll):
+    question = Question.objects.create(poll=setup_voted_poll['poll'], text='More?')
+    Choice.objects.bulk_create([Choice(question=question, text=f'Choice {i}') for i in range(3)])
+
+    response = api_client.get(reverse('choice-list'), {'page_size': 3})
+    ids = [choice['id'] for choice in response.data['results']]
+    ids += [choice['id'] for choice in api_client.get(response.data['next']).data['results']]
+    assert ids == sorted(Choice.objects.values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+def test_graphql_all_polls_pages_with_cursors(api_client, many_polls):
+    query = 'query($after: String) { allPolls(first: 3, after: $after) { id cursor } }'
+    seen, after = [], None
+    while True:
+        response = api_client.post('/graphql/', {'query': query, 'variables': {'after': after}}, format='json')
+        polls = json.loads(response.content)['data']['allPolls']
+        if not polls:
+            break
+        seen += [int(poll['id']) for poll in polls]
+        after = polls[-1]['cursor']
+
+    assert seen == many_polls
+
+
+@pytest.mark.django_db
+def test_graphql_rejects_malformed_cursor(api_client, many_polls):
+    query = '{ allPolls(after: "not-a-cursor") { id } }'
+    response = api_client.post('/graphql/', {'query': query}, format='json')
+    assert json.loads(response.content)['errors'][0]['message'] == 'Invalid cursor.'
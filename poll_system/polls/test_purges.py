@@ -0,0 +1,177 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from polls import purges, tasks
+from polls.serializers import PollSerializer
+from polls.models import Poll, Question, Choice, Vote, VoteRollup, PollPurge
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def voted_poll(create_user):
+    """A poll with two questions of two choices, and 7 votes on each question."""
+    owner = create_user('owner')
+    poll = Poll.objects.create(title='Big Poll', created_by=owner)
+    for i in range(2):
+        question = Question.objects.create(poll=poll, text=f'Q{i}')
+        choices = Choice.objects.bulk_create(Choice(question=question, text=f'C{i}.{j}') for j in range(2))
+        for j in range(7):
+            tasks.process_vote(question.id, choices[j % 2].id, User.objects.create(username=f'voter{i}.{j}').id)
+    return poll
+
+
+def deleted_votes(queries):
+    return [query for query in queries if query['sql'].startswith('DELETE FROM "polls_vote" WHERE "polls_vote"."id" IN')]
+
+
+@pytest.mark.django_db
+def test_reset_runs_in_chunks_and_applies_the_update_after(voted_poll, settings):
+    settings.POLL_PURGE_CHUNK_SIZE = 3
+    owner = voted_poll.created_by
+    question = voted_poll.questions.order_by('id').first()
+    choice = question.choices.order_by('id').first()
+    client = client_for(owner)
+
+    response = client.put(reverse('poll-detail', kwargs={'pk': voted_poll.pk}), {
+        'title': 'Reset Poll', 'reset_votes': True,
+        'questions': [{'id': question.id, 'text': 'Q0!', 'choices': [{'id': choice.id, 'text': 'C0.0'}, {'text': 'New'}]}],
+    }, format='json')
+    assert response.status_code == 202
+    job = PollPurge.objects.get()
+    assert response.data['purge']['status'] == 'pending'
+    assert response.data['purge']['votes_total'] == 14
+    assert response['Location'].endswith(reverse('purge-detail', kwargs={'pk': job.pk}))
+
+    # Nothing is deleted yet, but the poll reads as reset and takes no votes
+    voted_poll.refresh_from_db()
+    assert voted_poll.state == Poll.State.RESETTING
+    assert voted_poll.title == 'Big Poll'
+    assert Vote.objects.count() == 14
+    stats = client.get(reverse('poll-stats', kwargs={'pk': voted_poll.pk})).data
+    assert stats['total_votes'] == 0
+    response = client.post(reverse('poll-vote', kwargs={'pk': voted_poll.pk}), {'choice_id': choice.id}, format='json')
+    assert response.status_code == 409
+    response = client.delete(reverse('poll-detail', kwargs={'pk': voted_poll.pk}))
+    assert response.status_code == 409
+
+    with CaptureQueriesContext(connection) as queries:
+        assert tasks.purge_poll(job.pk)['finished']
+    # 4 and 3 votes per choice in chunks of 3
+    assert len(deleted_votes(queries)) == 6
+
+    job.refresh_from_db()
+    assert (job.status, job.votes_deleted, job.error) == (PollPurge.Status.DONE, 14, None)
+    voted_poll.refresh_from_db()
+    assert (voted_poll.state, voted_poll.title) == (Poll.State.READY, 'Reset Poll')
+    assert [q.text for q in voted_poll.questions.all()] == ['Q0!']
+    assert sorted(Choice.objects.filter(question__poll=voted_poll).values_list('text', 'votes_count')) == [
+        ('C0.0', 0), ('New', 0),
+    ]
+    assert not Vote.objects.exists()
+
+    response = client.get(reverse('purge-detail', kwargs={'pk': job.pk}))
+    assert response.status_code == 200
+    assert response.data['status'] == 'done'
+
+
+@pytest.mark.django_db
+def test_delete_hides_the_poll_at_once_and_purges_it_in_the_background(voted_poll, create_user):
+    client = client_for(voted_poll.created_by)
+    detail = reverse('poll-detail', kwargs={'pk': voted_poll.pk})
+    assert client_for(create_user('stranger')).delete(detail).status_code == 403
+
+    response = client.delete(detail)
+    assert response.status_code == 202
+    job = PollPurge.objects.get()
+    assert client.get(detail).status_code == 404
+    assert Vote.objects.count() == 14
+
+    tasks.purge_poll(job.pk)
+    assert not Poll.objects.filter(pk=voted_poll.pk).exists()
+    assert not Vote.objects.exists()
+
+    status_url = reverse('purge-detail', kwargs={'pk': job.pk})
+    response = client.get(status_url)
+    assert (response.data['kind'], response.data['status'], response.data['poll_id']) == ('delete', 'done', voted_poll.pk)
+    # Only the requester and staff can follow a purge
+    assert client_for(create_user('other')).get(status_url).status_code == 404
+    assert client_for(create_user('admin', email='a@example.com')).get(status_url).status_code == 404
+    staff = create_user('staff')
+    staff.is_staff = True
+    staff.save()
+    assert client_for(staff).get(status_url).status_code == 200
+
+
+@pytest.mark.django_db
+def test_a_job_resumes_from_its_cursor(voted_poll, create_user):
+    first = voted_poll.questions.order_by('id').first()
+    first_choice, second_choice = first.choices.order_by('id')
+    job = purges.begin(voted_poll, PollPurge.Kind.RESET, voted_poll.created_by)
+    VoteRollup.objects.create(
+        poll=voted_poll, choice=first_choice, resolution='minute', bucket_start='2026-01-01T00:00Z', count=7,
+    )
+
+    # Three chunks, then the worker dies; the next run reloads the job
+    assert not purges.run(job, chunk_size=3, max_chunks=3)
+    job = PollPurge.objects.get(pk=job.pk)
+    assert (job.choice_cursor, job.votes_deleted) == (second_choice.id, 7)
+    assert not Vote.objects.filter(question=first).exists()
+
+    # A vote that was committing when the reset began lands behind the cursor
+    Vote.objects.create(question=first, choice=first_choice, user=create_user('late'))
+
+    while not purges.run(job, chunk_size=3, max_chunks=2):
+        job = PollPurge.objects.get(pk=job.pk)
+    assert job.votes_deleted == 15
+    assert not Vote.objects.exists()
+    assert not VoteRollup.objects.exists()
+    assert Poll.objects.get(pk=voted_poll.pk).state == Poll.State.READY
+
+
+@pytest.mark.django_db
+def test_votes_queued_before_a_reset_are_dropped(voted_poll, create_user):
+    question = voted_poll.questions.first()
+    choice = question.choices.first()
+    voter = create_user('queued')
+    purges.begin(voted_poll, PollPurge.Kind.RESET, voted_poll.created_by)
+
+    assert 'error' in tasks.process_vote(question.id, choice.id, voter.id)
+    assert tasks.record_vote_batch([{'question_id': question.id, 'choice_id': choice.id, 'user_id': voter.id}]) == 0
+    assert not Vote.objects.filter(user=voter).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_jobs_read_from_the_primary(voted_poll, settings):
+    # Reads outside transactions would go to a replica that does not exist here
+    settings.DATABASE_REPLICAS = ['replica']
+    with transaction.atomic():
+        job = purges.begin(voted_poll, PollPurge.Kind.DELETE, voted_poll.created_by)
+    assert tasks.purge_poll(job.pk)['finished']
+    assert not Poll.objects.using('default').filter(pk=voted_poll.pk).exists()
+
+
+@pytest.mark.django_db
+def test_an_update_failing_at_apply_time_fails_the_job(voted_poll, monkeypatch):
+    def update(self, instance, validated_data):
+        raise IntegrityError('UNIQUE constraint failed')
+    monkeypatch.setattr(PollSerializer, 'update', update)
+    with transaction.atomic():
+        job = purges.begin(voted_poll, PollPurge.Kind.RESET, voted_poll.created_by, payload={'title': 'Reset Poll'}, partial=True)
+
+    assert tasks.purge_poll(job.pk)['finished']
+    job.refresh_from_db()
+    assert (job.status, job.error) == (PollPurge.Status.FAILED, {'error': 'UNIQUE constraint failed'})
+    voted_poll.refresh_from_db()
+    assert (voted_poll.state, voted_poll.title) == (Poll.State.READY, 'Big Poll')
+    assert not Vote.objects.exists()
+    # A failed job is not resumed
+    PollPurge.objects.filter(pk=job.pk).update(updated_at=job.updated_at.replace(year=2000))
+    assert tasks.resume_poll_purges() == {'resumed': 0}
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone as dt_timezone
+import pytest
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from polls import readers
+from polls.counters import increment_choice_votes
+from polls.models import Poll, Question, Choice
+from polls.serializers import PollSerializer, QuestionSerializer, ChoiceSerializer
+from polls.views import PollViewSet, QuestionViewSet, ChoiceViewSet
+
+
+def rendered(data):
+    return JSONRenderer().render(data)
+
+
+@pytest.fixture
+def mixed_polls(setup_voted_poll, create_user):
+    # Sharded and compacted counts, a poll without questions, null and set optional fields
+    increment_choice_votes(setup_voted_poll['choice2'].id, amount=3)
+    owner = create_user('owner2')
+    Poll.objects.create(title='Empty', created_by=owner, description=None)
+    ended = Poll.objects.create(
+        title='Ended', created_by=owner, description='Done',
+        end_date=datetime(2026, 5, 1, 12, 30, 15, 250000, tzinfo=dt_timezone.utc),
+    )
+    question = Question.objects.create(poll=ended, text='Unanswered?')
+    Choice.objects.create(question=question, text='Yes', votes_count=7)
+    Question.objects.create(poll=ended, text='No choices yet')
+    return setup_voted_poll
+
+
+@pytest.mark.django_db
+def test_poll_data_matches_poll_serializer(mixed_polls):
+    queryset = PollViewSet.queryset.order_by('id')
+    assert rendered(readers.poll_data(queryset)) == rendered(PollSerializer(queryset, many=True).data)
+
+
+@pytest.mark.django_db
+def test_question_and_choice_endpoints_match_serializers(api_client, mixed_polls):
+    questions = QuestionViewSet.queryset.order_by('id')
+    response = api_client.get(reverse('question-list'))
+    assert rendered(response.data['results']) == rendered(QuestionSerializer(questions, many=True).data)
+
+    choices = ChoiceViewSet.queryset.order_by('id')
+    response = api_client.get(reverse('choice-list'))
+    assert rendered(response.data['results']) == rendered(ChoiceSerializer(choices, many=True).data)
+
+    choice = mixed_polls['choice2']
+    response = api_client.get(reverse('choice-detail', kwargs={'pk': choice.pk}))
+    assert response.data == ChoiceSerializer(ChoiceViewSet.queryset.get(pk=choice.pk)).data
+    assert api_client.get(reverse('question-detail', kwargs={'pk': 999})).status_code == 404
+
+
+@pytest.mark.django_db
+def test_thousand_polls_match_the_serializer(create_user, django_assert_num_queries):
+    """1k polls x 10 questions x 5 choices: same output, one query per level."""
+    owner = create_user('bench')
+    polls = Poll.objects.bulk_create([Poll(title=f'Poll {i}', created_by=owner) for i in range(1000)])
+    questions = Question.objects.bulk_create([
+        Question(poll=poll, text=f'Question {i}') for poll in polls for i in range(10)
+    ])
+    Choice.objects.bulk_create([
+        Choice(question=question, text=f'Choice {i}', votes_count=i) for question in questions for i in range(5)
+    ])
+    queryset = PollViewSet.queryset.order_by('id')
+
+    # Polls, questions, choices
+    with django_assert_num_queries(3):
+        reader_body = rendered(readers.poll_data(queryset))
+    assert reader_body == rendered(PollSerializer(queryset, many=True).data)
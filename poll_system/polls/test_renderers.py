@@ -0,0 +1,116 @@
+import asyncio
+import gzip
+from datetime import datetime, timezone as dt_timezone
+import brotli
+import pytest
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from polls import readers, renderers, tallies
+from polls.middleware import choose_encoding
+from polls.models import Poll, Question, Choice
+from polls.renderers import FastJSONRenderer
+from polls.views import PollViewSet
+
+
+SAMPLE = {
+    'id': 1,
+    'title': 'Café   poll',
+    'created_at': datetime(2026, 3, 1, 10, 0, 30, 123456, tzinfo=dt_timezone.utc),
+    'counts': {1: 2, 3: 4},
+    'percentage': 33.33,
+    'end_date': None,
+}
+
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_fast_renderer_matches_drf_bytes(settings, fast):
+    settings.FAST_JSON_ENABLED = fast
+    assert FastJSONRenderer().render(SAMPLE) == JSONRenderer().render(SAMPLE)
+
+
+@pytest.mark.django_db
+def test_invalid_json_body_is_rejected(auth_client):
+    response = auth_client.generic('POST', reverse('poll-list'), '{"title": ', content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_encoding_negotiation():
+    assert choose_encoding('gzip, deflate, br') == 'br'
+    assert choose_encoding('gzip;q=1.0, br;q=0.5') == 'gzip'
+    assert choose_encoding('br;q=0, *') == 'gzip'
+    assert choose_encoding('identity') is None
+
+
+@pytest.fixture
+def big_polls(create_user):
+    owner = create_user('owner')
+    polls = Poll.objects.bulk_create([Poll(title=f'Poll {i}', created_by=owner) for i in range(20)])
+    questions = Question.objects.bulk_create([Question(poll=poll, text=f'Question {i}') for poll in polls for i in range(5)])
+    Choice.objects.bulk_create([Choice(question=question, text=f'Choice {i}') for question in questions for i in range(4)])
+    return polls
+
+
+@pytest.mark.django_db
+def test_large_responses_are_compressed(api_client, big_polls):
+    url = reverse('poll-list')
+    plain = api_client.get(url)
+    assert not plain.has_header('Content-Encoding')
+
+    compressed = api_client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+    assert compressed['Content-Encoding'] == 'br'
+    assert brotli.decompress(compressed.content) == plain.content
+    assert 'Accept-Encoding' in compressed['Vary']
+
+    # Compressed bytes carry a weak ETag, which still revalidates
+    assert compressed['ETag'] == 'W/' + plain['ETag']
+    assert api_client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag']).status_code == 304
+
+    gzipped = api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+    assert gzip.decompress(gzipped.content) == plain.content
+
+
+@pytest.mark.django_db(transaction=True)
+def test_small_responses_and_streams_are_not_compressed(api_client, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    response = api_client.get(reverse('poll-stats', kwargs={'pk': poll.pk}), HTTP_ACCEPT_ENCODING='gzip')
+    assert not response.has_header('Content-Encoding')
+
+    async def open_stream():
+        return await AsyncClient().get(f'/api/v1/polls/{poll.pk}/stream/', HTTP_ACCEPT_ENCODING='gzip')
+
+    assert not asyncio.run(open_stream()).has_header('Content-Encoding')
+
+
+@pytest.mark.django_db
+def test_stats_and_list_payloads(create_user, settings):
+    """A 200-question stats document and a 100-poll list page: same bytes from both encoders, and compressed well."""
+    owner = create_user('owner')
+    polls = Poll.objects.bulk_create([Poll(title=f'Poll {i}', created_by=owner) for i in range(100)])
+    questions = Question.objects.bulk_create([
+        Question(poll=poll, text=f'Question {i} of poll {poll.pk}') for poll in polls for i in range(10)
+    ])
+    Choice.objects.bulk_create([
+        Choice(question=question, text=f'Choice {i}', votes_count=i * 7) for question in questions for i in range(5)
+    ])
+    big_poll = Poll.objects.create(title='Census', created_by=owner)
+    big_questions = Question.objects.bulk_create([Question(poll=big_poll, text=f'Census question {i}') for i in range(200)])
+    Choice.objects.bulk_create([
+        Choice(question=question, text=f'Answer {i} to {question.text}', votes_count=question.pk * i % 97)
+        for question in big_questions for i in range(5)
+    ])
+    payloads = [
+        tallies.get_poll_stats(big_poll.pk),
+        {'next': None, 'previous': None, 'results': readers.poll_data(PollViewSet.queryset.filter(id__in=[p.pk for p in polls]).order_by('id'))},
+    ]
+
+    for data in payloads:
+        settings.FAST_JSON_ENABLED = False
+        stdlib_body = renderers.dumps(data)
+        settings.FAST_JSON_ENABLED = True
+        body = renderers.dumps(data)
+        assert body == stdlib_body
+
+        gzip_size = len(gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL))
+        brotli_size = len(brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY))
+        assert brotli_size < gzip_size < len(body) / 4
@@ -0,0 +1,164 @@
+import asyncio
+import json
+from datetime import timedelta
+import pytest
+from django.contrib.auth.models import User
+from django.test import AsyncRequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from polls import async_views, generations, tasks, views
+from polls.models import Poll, Question, Choice, ChoiceVoteShard, ChoiceResult, PollPurge
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def ended_poll(create_user):
+    """A poll that ended an hour ago, with 3 votes on its first question and none on its second."""
+    owner = create_user('owner')
+    poll = Poll.objects.create(title='Ended Poll', created_by=owner, end_date=timezone.now() - timedelta(hours=1))
+    question = Question.objects.create(poll=poll, text='Q0')
+    choices = Choice.objects.bulk_create(Choice(question=question, text=f'C{j}') for j in range(2))
+    Question.objects.create(poll=poll, text='Q1')
+    for j in range(3):
+        tasks.process_vote(question.id, choices[j // 2].id, User.objects.create(username=f'voter{j}').id)
+    return poll
+
+
+def forbid_enqueueing(monkeypatch):
+    def submit_vote(*args):
+        raise AssertionError('A vote for a closed poll was enqueued')
+    monkeypatch.setattr(views, 'submit_vote', submit_vote)
+    monkeypatch.setattr(async_views, 'asubmit_vote', submit_vote)
+
+
+@pytest.mark.django_db
+def test_close_out_freezes_the_live_results(ended_poll, api_client, django_capture_on_commit_callbacks):
+    live_stats = api_client.get(reverse('poll-stats', kwargs={'pk': ended_poll.pk})).json()
+    # Counters drifted from the Vote table are rebuilt once, on close
+    first_choice = Choice.objects.filter(question__poll=ended_poll).order_by('id').first()
+    Choice.objects.filter(pk=first_choice.pk).update(votes_count=40)
+    assert ChoiceVoteShard.objects.filter(choice__question__poll=ended_poll).exists()
+
+    # Polls still in their grace period are left for the next run
+    recent = Poll.objects.create(title='Recent', created_by=ended_poll.created_by, end_date=timezone.now())
+    with django_capture_on_commit_callbacks(execute=True):
+        assert tasks.close_expired_polls() == {'closed': 1}
+
+    ended_poll.refresh_from_db()
+    assert not ended_poll.is_active and ended_poll.closed_at is not None
+    assert Poll.objects.get(pk=recent.pk).closed_at is None
+    assert generations.is_closed(generations.get_generation(ended_poll.pk))
+    assert sorted(Choice.objects.filter(question__poll=ended_poll).values_list('text', 'votes_count')) == [('C0', 2), ('C1', 1)]
+    assert not ChoiceVoteShard.objects.filter(choice__question__poll=ended_poll).exists()
+    assert sorted(ChoiceResult.objects.filter(poll=ended_poll).values_list('choice_text', 'percentage')) == [
+        ('', 0), ('C0', 66.67), ('C1', 33.33),
+    ]
+
+    assert api_client.get(reverse('poll-stats', kwargs={'pk': ended_poll.pk})).json() == live_stats
+    assert tasks.close_expired_polls() == {'closed': 0}
+
+
+@pytest.mark.django_db
+def test_closed_polls_are_served_as_immutable(ended_poll, api_client, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.close_expired_polls()
+
+    for url in (reverse('poll-detail', kwargs={'pk': ended_poll.pk}), reverse('poll-stats', kwargs={'pk': ended_poll.pk})):
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert 'immutable' in response['Cache-Control']
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == 304
+        assert 'immutable' in response['Cache-Control']
+    detail = api_client.get(reverse('poll-detail', kwargs={'pk': ended_poll.pk}), {'expand': 'questions.choices'}).json()
+    assert [choice['votes_count'] for choice in detail['questions'][0]['choices']] == [2, 1]
+
+    assert api_client.get(reverse('poll-list')).json()['results'] == []
+
+    query = '{ poll(id: %d) { isActive questions { choices { text votesCount } } } }' % ended_poll.pk
+    response = api_client.get('/graphql/', {'query': query})
+    assert response.json()['data']['poll']['questions'][0]['choices'] == [
+        {'text': 'C0', 'votesCount': 2}, {'text': 'C1', 'votesCount': 1},
+    ]
+    assert 'immutable' in response['Cache-Control']
+
+
+@pytest.mark.django_db
+def test_closed_polls_can_be_deleted(ended_poll, api_client, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.close_expired_polls()
+    detail = reverse('poll-detail', kwargs={'pk': ended_poll.pk})
+    stats = reverse('poll-stats', kwargs={'pk': ended_poll.pk})
+    assert api_client.get(stats).status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client_for(ended_poll.created_by).delete(detail)
+    assert response.status_code == 202
+    # Gone from every read while the purge runs
+    assert api_client.get(detail).status_code == 404
+    assert api_client.get(stats).status_code == 404
+    assert not Poll.objects.visible().filter(pk=ended_poll.pk).exists()
+
+    tasks.purge_poll(PollPurge.objects.get().pk)
+    assert not Poll.objects.filter(pk=ended_poll.pk).exists()
+    assert not ChoiceResult.objects.exists()
+
+
+@pytest.mark.django_db
+def test_votes_for_ended_polls_are_rejected_before_enqueueing(
+    ended_poll, create_user, monkeypatch, django_capture_on_commit_callbacks,
+):
+    forbid_enqueueing(monkeypatch)
+    voter = create_user('late')
+    choice = Choice.objects.filter(question__poll=ended_poll).first()
+    url = reverse('poll-vote', kwargs={'pk': ended_poll.pk})
+
+    # Past its end date but not closed yet
+    response = client_for(voter).post(url, {'choice_id': choice.id}, format='json')
+    assert (response.status_code, response.data) == (400, {'error': views.POLL_CLOSED})
+
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.close_expired_polls()
+    response = client_for(voter).post(url, {'choice_id': choice.id}, format='json')
+    assert (response.status_code, response.data) == (400, {'error': views.POLL_CLOSED})
+
+    # Votes queued before the poll closed are dropped
+    assert 'error' in tasks.process_vote(choice.question_id, choice.id, voter.id)
+    entry = {'question_id': choice.question_id, 'choice_id': choice.id, 'user_id': voter.id}
+    assert tasks.record_vote_batch([entry]) == 0
+    assert not ChoiceResult.objects.filter(votes_count__gt=2).exists()
+    assert Choice.objects.get(pk=choice.pk).votes_count == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_serve_closed_polls(ended_poll, api_client, create_user, monkeypatch):
+    tasks.close_expired_polls()
+    forbid_enqueueing(monkeypatch)
+
+    url = reverse('poll-stats', kwargs={'pk': ended_poll.pk})
+    expected = api_client.get(url)
+    response = asyncio.run(async_views.poll_stats(AsyncRequestFactory().get(url), pk=ended_poll.pk))
+    assert json.loads(response.content) == expected.json()
+    assert response['ETag'] == expected['ETag']
+    assert 'immutable' in response['Cache-Control']
+
+    url = reverse('poll-detail', kwargs={'pk': ended_poll.pk})
+    response = asyncio.run(async_views.poll_detail(AsyncRequestFactory().get(url), pk=ended_poll.pk))
+    assert response.status_code == 200
+    assert 'immutable' in response['Cache-Control']
+
+    voter = create_user('late')
+    choice = Choice.objects.filter(question__poll=ended_poll).first()
+    request = AsyncRequestFactory().post(
+        reverse('poll-vote', kwargs={'pk': ended_poll.pk}), {'choice_id': choice.id}, content_type='application/json',
+        headers={'Authorization': f'Bearer {RefreshToken.for_user(voter).access_token}'},
+    )
+    response = asyncio.run(async_views.poll_vote(request, pk=ended_poll.pk))
+    assert (response.status_code, json.loads(response.content)) == (400, {'error': views.POLL_CLOSED})
@@ -0,0 +1,101 @@
+from datetime import datetime, timezone as dt_timezone
+import pytest
+from django.urls import reverse
+from polls import rollups
+from polls.models import RollupWatermark, Vote, VoteRollup
+from polls.tasks import rollup_votes
+
+
+def vote_at(user, choice, when):
+    vote = Vote.objects.create(user=user, question=choice.question, choice=choice)
+    Vote.objects.filter(pk=vote.pk).update(created_at=when)
+    return vote
+
+
+@pytest.fixture
+def timeline_votes(create_user, setup_voted_poll):
+    choice1, choice2 = setup_voted_poll['choice1'], setup_voted_poll['choice2']
+    Vote.objects.filter(user=setup_voted_poll['user1']).update(
+        created_at=datetime(2026, 3, 1, 10, 0, 30, tzinfo=dt_timezone.utc)
+    )
+    vote_at(create_user('a'), choice1, datetime(2026, 3, 1, 10, 0, 50, tzinfo=dt_timezone.utc))
+    vote_at(create_user('b'), choice2, datetime(2026, 3, 1, 10, 1, 5, tzinfo=dt_timezone.utc))
+    vote_at(create_user('c'), choice2, datetime(2026, 3, 1, 11, 30, 0, tzinfo=dt_timezone.utc))
+    return setup_voted_poll
+
+
+@pytest.mark.django_db
+def test_rollups_process_only_new_votes(timeline_votes, create_user):
+    assert rollup_votes()['processed'] == 4
+    assert rollup_votes()['processed'] == 0
+
+    choice2 = timeline_votes['choice2']
+    vote_at(create_user('d'), choice2, datetime(2026, 3, 1, 11, 45, 0, tzinfo=dt_timezone.utc))
+    assert rollup_votes()['processed'] == 1
+
+    hour = VoteRollup.objects.get(
+        choice=choice2, resolution='hour',
+        bucket_start=datetime(2026, 3, 1, 11, tzinfo=dt_timezone.utc),
+    )
+    assert hour.count == 2
+    day_total = sum(VoteRollup.objects.filter(resolution='day').values_list('count', flat=True))
+    assert day_total == 5
+
+
+@pytest.mark.django_db
+def test_votes_committed_late_are_still_rolled_up(timeline_votes, create_user, settings):
+    choice1, choice2 = timeline_votes['choice1'], timeline_votes['choice2']
+    assert rollup_votes()['processed'] == 4
+    # A vote whose id was taken before the next one's, committing after it
+    late_id = Vote.objects.latest('id').pk + 1
+    Vote.objects.create(id=late_id + 1, user=create_user('d'), question=choice2.question, choice=choice2)
+    assert rollup_votes()['processed'] == 1
+    assert RollupWatermark.objects.get().last_vote_id == late_id + 1
+
+    late = Vote.objects.create(id=late_id, user=create_user('e'), question=choice1.question, choice=choice1)
+    Vote.objects.filter(pk=late.pk).update(created_at=datetime(2026, 3, 1, 10, 0, 40, tzinfo=dt_timezone.utc))
+    assert rollup_votes()['processed'] == 1
+    assert rollup_votes()['processed'] == 0
+    minute = VoteRollup.objects.get(
+        choice=choice1, resolution='minute', bucket_start=datetime(2026, 3, 1, 10, 0, tzinfo=dt_timezone.utc),
+    )
+    assert minute.count == 3
+    assert sum(VoteRollup.objects.filter(resolution='day').values_list('count', flat=True)) == 6
+    assert RollupWatermark.objects.get().gaps == []
+
+    # Gaps nothing fills, from rolled back votes, are given up on
+    settings.VOTE_ROLLUP_GAP_TIMEOUT = 0
+    Vote.objects.create(id=late_id + 3, user=create_user('f'), question=choice2.question, choice=choice2)
+    assert rollups.rollup_new_votes() == 1
+    assert [vote_id for vote_id, _ in RollupWatermark.objects.get().gaps] == [late_id + 2]
+    assert rollups.rollup_new_votes() == 0
+    assert RollupWatermark.objects.get().gaps == []
+
+
+def test_new_gaps_are_capped_to_the_newest(monkeypatch):
+    monkeypatch.setattr(rollups, 'MAX_GAPS', 3)
+    assert rollups._new_gaps(10, [12, 15]) == [14, 13, 11]
+    assert rollups._new_gaps(10, [12, 20]) == [19, 18, 17]
+
+
+@pytest.mark.django_db
+def test_timeline_answers_from_rollups_in_one_query(api_client, timeline_votes, django_assert_num_queries):
+    rollup_votes()
+    poll = timeline_votes['poll']
+    url = reverse('poll-timeline', kwargs={'pk': poll.pk})
+    params = {'resolution': 'minute', 'start': '2026-03-01T10:00:00Z', 'end': '2026-03-01T11:00:00Z'}
+
+    with django_assert_num_queries(1):
+        response = api_client.get(url, params)
+
+    assert response.status_code == 200
+    buckets = response.data['buckets']
+    assert [bucket['bucket_start'].minute for bucket in buckets] == [0, 1]
+    assert buckets[0]['choices'] == [{'choice_id': timeline_votes['choice1'].id, 'votes_count': 2}]
+    assert buckets[1]['choices'] == [{'choice_id': timeline_votes['choice2'].id, 'votes_count': 1}]
+
+
+@pytest.mark.django_db
+def test_timeline_rejects_unknown_resolution(api_client, setup_voted_poll):
+    url = reverse('poll-timeline', kwargs={'pk': setup_voted_poll['poll'].pk})
+    assert api_client.get(url, {'resolution': 'week'}).status_code == 400
@@ -0,0 +1,96 @@
+import pytest
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+from polls import routers, tasks
+from polls.models import Poll
+
+
+@pytest.fixture
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ['replica1']
+    settings.REPLICA_STICKY_SECONDS = 10
+
+
+def read_db():
+    return routers.PrimaryReplicaRouter().db_for_read(Poll)
+
+
+def write_db():
+    return routers.PrimaryReplicaRouter().db_for_write(Poll)
+
+
+def serve(request, view=None):
+    '''Runs a request through the middleware, returning where the view read from.'''
+    seen = {}
+
+    def get_response(request):
+        if view is not None:
+            view(request)
+        seen['before'] = read_db()
+        if request.method == 'POST':
+            write_db()
+        seen['after'] = read_db()
+        return HttpResponse()
+
+    middleware = routers.PrimaryStickinessMiddleware(get_response)
+    middleware(request)
+    return seen
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reads_use_replicas_outside_transactions(replicas):
+    assert read_db() == 'replica1'
+    assert write_db() == 'default'
+    with transaction.atomic():
+        assert read_db() == 'default'
+    with routers.primary():
+        assert read_db() == 'default'
+    assert read_db() == 'replica1'
+
+
+def test_everything_uses_the_primary_without_replicas(settings):
+    settings.DATABASE_REPLICAS = []
+    assert read_db() == 'default'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_writers_stick_to_the_primary(replicas, create_user):
+    user = create_user('voter')
+    factory = RequestFactory(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    assert serve(factory.get('/api/v1/polls/')) == {'before': 'replica1', 'after': 'replica1'}
+    # Unsafe requests read what they change from the primary
+    assert serve(factory.post('/api/v1/polls/')) == {'before': 'default', 'after': 'default'}
+    assert serve(factory.get('/api/v1/polls/')) == {'before': 'default', 'after': 'default'}
+    # Other users and anonymous requests keep reading from replicas
+    assert serve(RequestFactory().get('/api/v1/polls/'))['before'] == 'replica1'
+
+    cache.delete(routers.sticky_key(user.pk))  # the window expires
+    assert serve(factory.get('/api/v1/polls/'))['before'] == 'replica1'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_read_only_posts_can_use_replicas(replicas):
+    seen = serve(RequestFactory().post('/graphql/'), lambda request: routers.unpin())
+    # As GraphQL queries do, until the request writes, as a mutation would
+    assert seen == {'before': 'replica1', 'after': 'default'}
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica1'])
+def test_reads_reach_the_replica_but_tasks_read_the_primary(replicas, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    with CaptureQueriesContext(connections['replica1']) as replica_queries:
+        assert Poll.objects.get(pk=poll.pk).title == poll.title
+    assert len(replica_queries) == 1
+
+    # Tasks cache and count what they read, so a lagging replica must not feed them
+    with CaptureQueriesContext(connections['replica1']) as replica_queries:
+        tasks.reconcile_vote_tallies()
+        tasks.close_expired_polls()
+        tasks.refresh_trending()
+        tasks.resume_poll_purges()
+    assert not replica_queries
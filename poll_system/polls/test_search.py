@@ -0,0 +1,136 @@
+import json
+import time
+import pytest
+from django.db import connection
+from django.db.models import F
+from django.urls import reverse
+from polls.models import Poll, Question, Choice
+from polls import search
+
+
+@pytest.fixture
+def searchable_polls(create_user):
+    owner = create_user('owner')
+    in_title = Poll.objects.create(title='Favourite pizza topping', created_by=owner)
+    in_choice = Poll.objects.create(title='Lunch plans', created_by=owner)
+    question = Question.objects.create(poll=in_choice, text='Where should we eat?')
+    Choice.objects.create(question=question, text='The pizza place')
+    Choice.objects.create(question=question, text='Sushi bar')
+    Poll.objects.create(title='Closed pizza poll', created_by=owner, is_active=False)
+    Poll.objects.create(title='Weekend hiking', created_by=owner)
+    return {'in_title': in_title, 'in_choice': in_choice, 'question': question}
+
+
+@pytest.mark.django_db
+def test_title_matches_outrank_choice_matches(api_client, searchable_polls):
+    response = api_client.get(reverse('poll-search'), {'q': 'pizza'})
+
+    assert response.status_code == 200
+    results = response.json()['results']
+    # Inactive polls are left out
+    assert [poll['id'] for poll in results] == [searchable_polls['in_title'].pk, searchable_polls['in_choice'].pk]
+    assert results[1]['questions'][0]['choices'][0]['text'] == 'The pizza place'
+
+
+@pytest.mark.django_db
+def test_index_follows_question_and_choice_edits(searchable_polls):
+    question = searchable_polls['question']
+    poll_id = searchable_polls['in_choice'].pk
+    assert search.search_poll_ids('sushi', 10) == [poll_id]
+
+    Choice.objects.filter(text='Sushi bar').update(text='Ramen bar')
+    assert search.search_poll_ids('sushi', 10) == []
+    assert search.search_poll_ids('ramen', 10) == [poll_id]
+
+    Question.objects.create(poll_id=poll_id, text='Any dietary needs?')
+    assert search.search_poll_ids('dietary', 10) == [poll_id]
+
+    question.delete()
+    assert search.search_poll_ids('ramen', 10) == []
+    Poll.objects.filter(pk=poll_id).update(title='Dinner plans')
+    assert search.search_poll_ids('dinner plans', 10) == [poll_id]
+    Poll.objects.filter(pk=poll_id).delete()
+    assert search.search_poll_ids('dinner', 10) == []
+
+
+@pytest.mark.django_db
+def test_vote_counter_writes_leave_the_index_alone(searchable_polls):
+    poll_id = searchable_polls['in_choice'].pk
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE polls_poll_fts SET choices = '' WHERE rowid = %s", [poll_id])
+
+    # Would rebuild the choices column, were the trigger to fire
+    Choice.objects.filter(question__poll_id=poll_id).update(votes_count=F('votes_count') + 1)
+    assert search.search_poll_ids('sushi', 10) == []
+
+    Choice.objects.filter(text='Sushi bar').update(text='Sushi counter')
+    assert search.search_poll_ids('sushi', 10) == [poll_id]
+
+
+@pytest.mark.django_db
+def test_other_backends_match_substrings(searchable_polls, monkeypatch):
+    monkeypatch.setattr(search, 'SEARCH_SQL', {})
+    assert search.search_poll_ids('pizza', 10) == [searchable_polls['in_choice'].pk, searchable_polls['in_title'].pk]
+    assert search.search_poll_ids('pizza place', 10) == [searchable_polls['in_choice'].pk]
+    assert search.search_poll_ids('pizza', 1, offset=1) == [searchable_polls['in_title'].pk]
+
+
+@pytest.mark.django_db
+def test_search_pages_by_offset(api_client, create_user):
+    owner = create_user('owner')
+    Poll.objects.bulk_create([Poll(title=f'Board game night {i}', created_by=owner) for i in range(5)])
+
+    url, params, seen = reverse('poll-search'), {'q': 'board games', 'page_size': 2}, []
+    while url:
+        data = api_client.get(url, params).json()
+        seen += [poll['id'] for poll in data['results']]
+        url, params = data['next'], None
+
+    # Equal ranks fall back to newest first
+    assert seen == sorted(Poll.objects.values_list('id', flat=True), reverse=True)
+    assert api_client.get(reverse('poll-search'), {'q': 'board', 'offset': 4}).json()['previous'] is not None
+
+
+@pytest.mark.django_db
+def test_search_needs_a_word(api_client):
+    assert api_client.get(reverse('poll-search')).status_code == 400
+    assert api_client.get(reverse('poll-search'), {'q': ' "*" '}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_graphql_search_polls(api_client, searchable_polls):
+    query = '{ searchPolls(query: "pizza", first: 1) { id title } }'
+    response = api_client.post('/graphql/', {'query': query}, format='json')
+
+    polls = json.loads(response.content)['data']['searchPolls']
+    assert polls == [{'id': str(searchable_polls['in_title'].pk), 'title': 'Favourite pizza topping'}]
+
+
+@pytest.mark.django_db
+def test_graphql_search_leaves_out_hidden_polls(api_client, searchable_polls, monkeypatch):
+    hidden = Poll.objects.get(title='Closed pizza poll')
+    # As an index that has not caught up with a deactivation would
+    monkeypatch.setattr(search, 'search_poll_ids', lambda query, limit, offset=0: [hidden.pk, searchable_polls['in_title'].pk])
+    query = '{ searchPolls(query: "pizza") { title } }'
+    response = api_client.post('/graphql/', {'query': query}, format='json')
+
+    assert json.loads(response.content)['data']['searchPolls'] == [{'title': 'Favourite pizza topping'}]
+
+
+@pytest.mark.django_db
+def test_search_stays_fast_on_a_large_table(create_user):
+    owner = create_user('owner')
+    words = ['apple', 'banana', 'cherry', 'grape', 'lemon', 'mango', 'olive', 'peach', 'plum', 'melon']
+    Poll.objects.bulk_create(
+        (Poll(title=f'{words[i % 10]} {words[i // 10 % 10]} {words[i // 100 % 10]} poll {i}', created_by=owner)
+         for i in range(100_000)),
+        batch_size=5000,
+    )
+
+    started = time.perf_counter()
+    poll_ids = search.search_poll_ids('mango plum', 20)
+    elapsed = time.perf_counter() - started
+
+    assert len(poll_ids) == 20
+    print(f'search over 100k polls: {elapsed * 1000:.1f}ms')
+    assert elapsed < 0.5
@@ -0,0 +1,138 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+from polls import tallies
+from polls.models import Poll, Question
+from polls.schema import schema
+from polls.tasks import process_vote, reconcile_vote_tallies
+
+
+def stats_url(poll):
+    return reverse('poll-stats', kwargs={'pk': poll.pk})
+
+
+@pytest.mark.django_db
+def test_stats_served_from_tallies_without_sql(api_client, setup_voted_poll, django_assert_num_queries):
+    poll = setup_voted_poll['poll']
+    # Cold start builds the tallies from the Vote table
+    assert api_client.get(stats_url(poll)).data['total_votes'] == 1
+
+    with django_assert_num_queries(0):
+        response = api_client.get(stats_url(poll))
+    assert response.data['questions'][0]['choices'][0]['votes_count'] == 1
+
+
+@pytest.mark.django_db
+def test_hidden_polls_stop_serving_stats(admin_client, api_client, create_user, setup_voted_poll, django_capture_on_commit_callbacks):
+    poll = setup_voted_poll['poll']
+    assert api_client.get(stats_url(poll)).status_code == 200
+    assert tallies.load_poll_stats(poll.pk) is not None
+
+    # Deactivated in the admin
+    with django_capture_on_commit_callbacks(execute=True):
+        response = admin_client.post(reverse('admin:polls_poll_change', args=[poll.pk]), {
+            'title': poll.title, 'created_by': poll.created_by_id, 'state': poll.state,
+            'questions-TOTAL_FORMS': 0, 'questions-INITIAL_FORMS': 0,
+        })
+    assert response.status_code == 302
+    assert tallies.load_poll_stats(poll.pk) is None
+    assert api_client.get(stats_url(poll)).status_code == 404
+
+    # Deleted by its owner
+    other = Poll.objects.create(title='Other', created_by=poll.created_by)
+    assert api_client.get(stats_url(other)).status_code == 200
+    with django_capture_on_commit_callbacks(execute=True):
+        client = APIClient()
+        client.force_authenticate(other.created_by)
+        assert client.delete(reverse('poll-detail', kwargs={'pk': other.pk})).status_code == 202
+    assert api_client.get(stats_url(other)).status_code == 404
+
+
+@pytest.mark.django_db
+def test_committed_vote_increments_tally(api_client, create_user, setup_voted_poll, django_capture_on_commit_callbacks):
+    poll, question = setup_voted_poll['poll'], setup_voted_poll['question']
+    choice2 = setup_voted_poll['choice2']
+    tallies.rebuild_poll_tallies(poll.pk)
+
+    voter = create_user('voter2')
+    with django_capture_on_commit_callbacks(execute=True):
+        process_vote(question.id, choice2.id, voter.id)
+
+    data = api_client.get(stats_url(poll)).data
+    assert data['total_votes'] == 2
+    assert data['questions'][0]['choices'][1]['percentage'] == 50.0
+
+
+@pytest.mark.django_db
+def test_reconcile_rebuilds_flushed_and_drifted_polls(setup_voted_poll):
+    poll, question = setup_voted_poll['poll'], setup_voted_poll['question']
+    choice1 = setup_voted_poll['choice1']
+
+    # Nothing built yet, as after a Redis flush
+    assert reconcile_vote_tallies()['rebuilt'] == 1
+    assert reconcile_vote_tallies()['rebuilt'] == 0
+
+    tallies.record_votes([(poll.pk, question.id, choice1.id, 5)])
+    assert reconcile_vote_tallies()['rebuilt'] == 1
+    assert tallies.load_poll_tallies(poll.pk)[1][choice1.id] == 1
+
+
+@pytest.mark.django_db
+def test_reconcile_checks_polls_in_chunks_across_runs(setup_voted_poll, django_assert_num_queries):
+    owner = setup_voted_poll['poll'].created_by
+    for i in range(4):
+        tallies.rebuild_poll_tallies(Poll.objects.create(title=f'Poll {i}', created_by=owner).pk)
+    tallies.rebuild_poll_tallies(setup_voted_poll['poll'].pk)
+
+    # Two chunks of two polls per run: poll ids, then one count per chunk
+    with django_assert_num_queries(4):
+        assert reconcile_vote_tallies(chunk_size=2, max_chunks=2)['rebuilt'] == 0
+    # The next run picks up the fifth poll and wraps around
+    tallies.drop_poll_tallies(setup_voted_poll['poll'].pk)
+    last = Poll.objects.order_by('id').last()
+    tallies.drop_poll_tallies(last.pk)
+    assert reconcile_vote_tallies(chunk_size=2, max_chunks=2)['rebuilt'] == 1
+    assert tallies.load_poll_tallies(last.pk) is not None
+    assert reconcile_vote_tallies(chunk_size=2, max_chunks=2)['rebuilt'] == 1
+
+
+@pytest.mark.django_db
+def test_graphql_votes_count_reads_tallies(rf, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    tallies.rebuild_poll_tallies(poll.pk)
+    tallies.record_votes([(poll.pk, setup_voted_poll['question'].id, setup_voted_poll['choice2'].id, 3)])
+
+    result = schema.execute(
+        '{ poll(id: %d) { questions { choices { id votesCount } } } }' % poll.pk,
+        context_value=rf.get('/graphql/'),
+    )
+    assert result.errors is None
+    counts = [c['votesCount'] for c in result.data['poll']['questions'][0]['choices']]
+    assert counts == [1, 3]
+
+
+@pytest.mark.django_db
+def test_stats_document_updated_in_place(api_client, setup_voted_poll, django_assert_num_queries):
+    poll, question = setup_voted_poll['poll'], setup_voted_poll['question']
+    choice1, choice2 = setup_voted_poll['choice1'], setup_voted_poll['choice2']
+    Question.objects.create(poll=poll, text='Not answered yet')
+    api_client.get(stats_url(poll))
+
+    tallies.record_votes([
+        (poll.pk, question.id, choice2.id, 1),
+        (poll.pk, question.id, choice2.id, 1),
+    ])
+
+    conn = tallies.get_connection()
+    assert conn.get(tallies.stats_key(poll.pk)) is not None
+    with django_assert_num_queries(0):
+        data = api_client.get(stats_url(poll)).data
+
+    assert data['total_votes'] == 3
+    first, second = data['questions']
+    assert first['total_question_votes'] == 3
+    assert [(c['choice_id'], c['votes_count'], c['percentage']) for c in first['choices']] == [
+        (choice1.id, 1, 33.33),
+        (choice2.id, 2, 66.67),
+    ]
+    assert second['choices'] == []
@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+import pytest
+from django.urls import reverse
+from polls import rollups, tasks, trending
+from polls.models import Poll, RollupWatermark, Vote, VoteRollup
+
+
+@pytest.fixture
+def three_polls(create_user):
+    owner = create_user('owner')
+    return [Poll.objects.create(title=f'Poll {i}', created_by=owner) for i in range(3)]
+
+
+@pytest.mark.django_db
+def test_recent_votes_outrank_older_ones(settings, three_polls):
+    settings.TRENDING_HALF_LIFE = 3600
+    old, recent, _ = three_polls
+    now = time.time()
+
+    trending.record_votes({old.pk: 10}, now=now)
+    trending.record_votes({recent.pk: 3}, now=now + 4 * 3600)
+
+    # 10 votes four half-lives ago count like 0.625 recent votes
+    assert trending.top_poll_ids(trending.TRENDING_KEY, 2) == [recent.pk, old.pk]
+    assert trending.top_poll_ids(trending.TOP_KEY, 2) == [old.pk, recent.pk]
+
+
+@pytest.mark.django_db
+def test_trending_endpoints_hydrate_ranked_polls(api_client, three_polls, django_assert_num_queries):
+    first, second, third = three_polls
+    trending.record_votes({second.pk: 5, third.pk: 2, first.pk: 1})
+
+    # Polls, then their questions; the ranked polls have no questions yet
+    with django_assert_num_queries(2):
+        response = api_client.get(reverse('poll-trending'), {'limit': 2})
+    assert [poll['id'] for poll in response.json()] == [second.pk, third.pk]
+
+    response = api_client.get(reverse('poll-trending-top'))
+    assert [poll['id'] for poll in response.json()] == [second.pk, third.pk, first.pk]
+
+
+@pytest.mark.django_db
+def test_lost_rankings_are_rebuilt_from_rollups(setup_voted_poll, three_polls, create_user):
+    poll = setup_voted_poll['poll']
+    choice = setup_voted_poll['choice1']
+    now = datetime.now(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    for resolution in ('hour', 'day'):
+        VoteRollup.objects.create(poll=poll, choice=choice, resolution=resolution, bucket_start=now, count=4)
+    # The fixture's vote is in the rollups; a newer one is not yet
+    RollupWatermark.objects.create(name=rollups.WATERMARK_NAME, last_vote_id=Vote.objects.get().pk)
+    Vote.objects.create(question=setup_voted_poll['question'], choice=choice, user=create_user('late'))
+
+    assert trending.is_lost()
+    assert tasks.refresh_trending() == {'rebuilt': True, 'rebased': False}
+
+    assert not trending.is_lost()
+    assert tasks.refresh_trending() == {'rebuilt': False, 'rebased': False}
+    assert trending.top_poll_ids(trending.TRENDING_KEY, 10) == [poll.pk]
+    assert trending.get_connection().zscore(trending.TOP_KEY, poll.pk) == 5
+
+
+@pytest.mark.django_db
+def test_rebasing_keeps_every_vote(settings, three_polls):
+    settings.TRENDING_HALF_LIFE = 3600
+    old, recent, _ = three_polls
+    conn = trending.get_connection()
+    now = time.time()
+    trending.record_votes({old.pk: 8}, now=now)
+    trending.record_votes({recent.pk: 3}, now=now + 2 * 3600)
+    top = conn.zrange(trending.TOP_KEY, 0, -1, withscores=True)
+
+    assert not trending.needs_rebase(now=now + 2 * 3600)
+    assert trending.needs_rebase(now=now + settings.TRENDING_REBASE_AFTER + 1)
+    trending.rebase(now=now + 2 * 3600)
+
+    # Scores are as if every vote was recorded against the new epoch
+    assert float(conn.get(trending.EPOCH_KEY)) == pytest.approx(now + 2 * 3600)
+    assert conn.zscore(trending.TRENDING_KEY, old.pk) == pytest.approx(2)
+    assert conn.zscore(trending.TRENDING_KEY, recent.pk) == pytest.approx(3)
+    assert conn.zrange(trending.TOP_KEY, 0, -1, withscores=True) == top
+
+    trending.record_votes({old.pk: 2}, now=now + 2 * 3600)
+    assert trending.top_poll_ids(trending.TRENDING_KEY, 2) == [old.pk, recent.pk]
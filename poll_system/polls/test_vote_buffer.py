@@ -0,0 +1,82 @@
+import json
+import pytest
+from django.urls import reverse
+from polls.models import Choice, Vote
+from polls import vote_buffer
+from polls.tasks import flush_vote_buffer
+
+
+@pytest.fixture
+def batched_mode(settings):
+    settings.VOTE_INGESTION_MODE = 'batched'
+    settings.VOTE_BATCH_SIZE = 50
+
+
+@pytest.mark.django_db
+def test_vote_is_buffered_in_batched_mode(batched_mode, auth_client, setup_voted_poll):
+    poll = setup_voted_poll['poll']
+    url = reverse('poll-vote', kwargs={'pk': poll.pk})
+    response = auth_client.post(url, {'choice_id': setup_voted_poll['choice2'].id}, format='json')
+
+    assert response.status_code == 202
+    assert response.data['task_id'] is None
+    assert vote_buffer.pending_count() == 1
+    assert Vote.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_flush_records_batch_with_aggregated_counts(batched_mode, create_user, setup_voted_poll):
+    question = setup_voted_poll['question']
+    choice1, choice2 = setup_voted_poll['choice1'], setup_voted_poll['choice2']
+    voters = [create_user(f'batch{i}') for i in range(5)]
+
+    for voter in voters:
+        vote_buffer.enqueue_vote(question.id, choice2.id, voter.id)
+    # Duplicate from the same user and a vote from a user who already voted
+    vote_buffer.enqueue_vote(question.id, choice1.id, voters[0].id)
+    vote_buffer.enqueue_vote(question.id, choice2.id, setup_voted_poll['user1'].id)
+
+    result = flush_vote_buffer()
+
+    assert result['recorded'] == 5
+    assert Vote.objects.count() == 6
+    assert choice1.current_votes() == 1
+    assert choice2.current_votes() == 5
+    assert vote_buffer.pending_count() == 0
+
+
+@pytest.mark.django_db
+def test_unacknowledged_batch_is_retried_once(batched_mode, create_user, setup_voted_poll):
+    question = setup_voted_poll['question']
+    choice2 = setup_voted_poll['choice2']
+    voter = create_user('crashy')
+    vote_buffer.enqueue_vote(question.id, choice2.id, voter.id)
+
+    # Simulate a worker that claimed the batch and died before acknowledging it
+    assert len(vote_buffer.claim_batch()) == 1
+    assert vote_buffer.pending_count() == 0
+
+    assert flush_vote_buffer()['recorded'] == 1
+    assert flush_vote_buffer()['recorded'] == 0
+    assert choice2.current_votes() == 1
+
+
+@pytest.mark.django_db
+def test_a_bad_entry_cannot_stall_the_buffer(batched_mode, settings, create_user, setup_voted_poll):
+    question, choice2 = setup_voted_poll['question'], setup_voted_poll['choice2']
+    conn = vote_buffer.get_connection()
+    # An entry record_vote_batch cannot handle, e.g. from an older release
+    conn.rpush(vote_buffer.PENDING_KEY, json.dumps({'question_id': question.id, 'choice_id': choice2.id}))
+    vote_buffer.enqueue_vote(question.id, choice2.id, create_user('first').id)
+
+    for _ in range(settings.VOTE_BATCH_MAX_ATTEMPTS):
+        with pytest.raises(KeyError):
+            flush_vote_buffer()
+    vote_buffer.enqueue_vote(question.id, choice2.id, create_user('second').id)
+
+    # The failing batch is split, its bad entry set aside, and the buffer drains
+    assert flush_vote_buffer()['recorded'] == 2
+    assert choice2.current_votes() == 2
+    assert vote_buffer.pending_count() == 0
+    assert vote_buffer.dead_letter_count() == 1
+    assert not conn.exists(vote_buffer.INFLIGHT_KEY, vote_buffer.ATTEMPTS_KEY)
@@ -0,0 +1,175 @@
+"""
+Trending and most-voted polls, kept in Redis sorted sets.
+
+'polls:top' scores each poll by its total votes. 'polls:trending' scores each
+vote by 2 ** ((t - epoch) / TRENDING_HALF_LIFE): adding a growing weight for new
+votes ranks polls exactly as if every older vote decayed by half each
+half-life, without ever rewriting existing scores. refresh_trending() moves
+the epoch forward once a day, scaling the trending scores down to match in
+Redis, which keeps the weights from growing without bound. The sets are only
+rebuilt from the database when they were lost.
+"""
+import logging
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from .models import RollupWatermark, Vote, VoteRollup
+from .rollups import WATERMARK_NAME
+
+
+logger = logging.getLogger(__name__)
+
+TRENDING_KEY = 'polls:trending'
+TOP_KEY = 'polls:top'
+EPOCH_KEY = 'polls:trending:epoch'
+
+# KEYS: trending, top, epoch; ARGV: now, half-life, then poll_id/votes pairs
+RECORD_SCRIPT = """
+local now = tonumber(ARGV[1])
+local epoch = tonumber(redis.call('GET', KEYS[3]))
+if not epoch then
+    epoch = now
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+local weight = math.pow(2, (now - epoch) / tonumber(ARGV[2]))
+for i = 3, #ARGV, 2 do
+    redis.call('ZINCRBY', KEYS[1], tostring(tonumber(ARGV[i + 1]) * weight), ARGV[i])
+    redis.call('ZINCRBY', KEYS[2], ARGV[i + 1], ARGV[i])
+end
+return 1
+"""
+
+# KEYS: trending, epoch; ARGV: now, half-life
+REBASE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if epoch then
+    local factor = math.pow(2, (epoch - now) / tonumber(ARGV[2]))
+    local scores = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+    for i = 1, #scores, 2 do
+        redis.call('ZADD', KEYS[1], tostring(tonumber(scores[i + 1]) * factor), scores[i])
+    end
+end
+redis.call('SET', KEYS[2], ARGV[1])
+return 1
+"""
+
+# How far back a rebuild looks: older votes weigh less than 1/1024 of a new one
+REBUILD_HALF_LIVES = 10
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def record_votes(poll_counts, now=None, conn=None):
+    """Adds committed votes, given as {poll_id: votes}, to both sorted sets."""
+    if not poll_counts:
+        return
+    try:
+        conn = conn or get_connection()
+        args = [now or time.time(), settings.TRENDING_HALF_LIFE]
+        for poll_id, votes in poll_counts.items():
+            args += [poll_id, votes]
+        conn.register_script(RECORD_SCRIPT)(keys=[TRENDING_KEY, TOP_KEY, EPOCH_KEY], args=args)
+    except RedisError as e:
+        logger.warning(f"Failed to update trending scores, the next rebuild will repair them: {e}")
+
+
+def remove_polls(*poll_ids, conn=None):
+    """Drops polls from both rankings, e.g. when they are deleted or reset."""
+    conn = conn or get_connection()
+    pipe = conn.pipeline(transaction=False)
+    pipe.zrem(TRENDING_KEY, *poll_ids)
+    pipe.zrem(TOP_KEY, *poll_ids)
+    pipe.execute()
+
+
+def top_poll_ids(key, limit, conn=None):
+    """Highest scoring poll ids of a ranking, best first. O(log N + limit)."""
+    conn = conn or get_connection()
+    return [int(poll_id) for poll_id in conn.zrevrange(key, 0, limit - 1)]
+
+
+def rebase(now=None, conn=None):
+    """
+    Moves the epoch to now, scaling the trending scores down by the weight it
+    drops, atomically. Rankings are unchanged and no votes are lost.
+    """
+    conn = conn or get_connection()
+    conn.register_script(REBASE_SCRIPT)(
+        keys=[TRENDING_KEY, EPOCH_KEY], args=[now or time.time(), settings.TRENDING_HALF_LIFE],
+    )
+
+
+def rebuild(now=None, conn=None):
+    """
+    Rebuilds both rankings from the vote rollups and the votes past their
+    watermark, with a fresh epoch, and swaps them in atomically. Returns the
+    number of ranked polls.
+    """
+    conn = conn or get_connection()
+    now = now or time.time()
+    half_life = settings.TRENDING_HALF_LIFE
+    since = datetime.fromtimestamp(now - REBUILD_HALF_LIVES * half_life, tz=dt_timezone.utc)
+
+    def weigh(scores, poll_id, votes, bucket_start, bucket_seconds):
+        # Weigh each bucket by its midpoint
+        age = now - (bucket_start.timestamp() + bucket_seconds / 2)
+        scores[poll_id] += votes * math.pow(2, -age / half_life)
+
+    trending = defaultdict(float)
+    hourly = (
+        VoteRollup.objects.filter(resolution=VoteRollup.Resolution.HOUR, bucket_start__gte=since, poll__is_active=True)
+        .values('poll_id', 'bucket_start').annotate(total=Sum('count'))
+    )
+    for row in hourly:
+        weigh(trending, row['poll_id'], row['total'], row['bucket_start'], 3600)
+
+    top = defaultdict(int, (
+        VoteRollup.objects.filter(resolution=VoteRollup.Resolution.DAY, poll__is_active=True)
+        .values('poll_id').annotate(total=Sum('count')).values_list('poll_id', 'total')
+    ))
+
+    # Votes the rollups have not reached yet, a range scan of the primary key,
+    # and votes that committed late into the watermark's gaps
+    last_vote_id, gaps = (
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).values_list('last_vote_id', 'gaps').first() or (0, [])
+    )
+    unrolled = Q(id__gt=last_vote_id) | Q(id__in=[vote_id for vote_id, _ in gaps])
+    recent = (
+        Vote.objects.filter(unrolled, question__poll__is_active=True)
+        .annotate(bucket=Trunc('created_at', 'minute', tzinfo=dt_timezone.utc))
+        .values('question__poll_id', 'bucket').annotate(total=Count('id'))
+    )
+    for row in recent:
+        weigh(trending, row['question__poll_id'], row['total'], row['bucket'], 60)
+        top[row['question__poll_id']] += row['total']
+
+    pipe = conn.pipeline(transaction=True)
+    for key, scores in ((TRENDING_KEY, trending), (TOP_KEY, top)):
+        pipe.delete(key)
+        if scores:
+            pipe.zadd(key, scores)
+    pipe.set(EPOCH_KEY, now)
+    pipe.execute()
+    return len(top)
+
+
+def is_lost(conn=None):
+    """True when the rankings are gone, e.g. after a Redis flush or restart."""
+    conn = conn or get_connection()
+    return conn.get(EPOCH_KEY) is None or not conn.exists(TOP_KEY)
+
+
+def needs_rebase(now=None, conn=None):
+    """True when the epoch is due to be moved forward."""
+    conn = conn or get_connection()
+    epoch = conn.get(EPOCH_KEY)
+    return epoch is not None and (now or time.time()) - float(epoch) > settings.TRENDING_REBASE_AFTER
@@ -1,38 +1,103 @@
+import codecs
 import logging
-from django.shortcuts import render
+from django.conf import settings
+from django.shortcuts import get_object_or_404, render
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 from django.db import IntegrityError, transaction
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.views import APIView
 from django.contrib.auth.models import User
-from django.db.models import Sum, Max, F 
-from .models import Poll, Question, Choice, Vote
-from .serializers import PollSerializer, ChoiceSerializer, UserSerializer, QuestionSerializer
-from rest_framework.exceptions import PermissionDenied, ValidationError
-from .tasks import process_vote
+from django.db.models import Sum, Max, F, Prefetch
+from .models import Poll, Question, Choice, Vote, VoteRollup, PollPurge
+from .serializers import PollSerializer, ChoiceSerializer, UserSerializer, QuestionSerializer, PollPurgeSerializer
+from rest_framework.exceptions import APIException, PermissionDenied, UnsupportedMediaType, ValidationError
+from .tasks import submit_vote, start_purge
+from .pagination import PollCursorPagination, IdCursorPagination, SearchPagination
+from . import conditional, exports, fragments, generations, imports, live, readers, renderers, results, routers, search, tallies, trending
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.utils.decorators import method_decorator
-from django.core.cache import cache
-from django.views.decorators.cache import cache_page
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta, timezone as dt_timezone
 from django_ratelimit.decorators import ratelimit
 
 
 logger = logging.getLogger(__name__)
 
-# Utility Functions for Cache Invalidation 
-def get_poll_stats_cache_key(poll_pk):
-    """Generates the cache key fragment for poll stats."""
-    return f'poll_stats_pk_{poll_pk}'
+# Per-user vote rate limit, shared by the sync and async vote endpoints
+VOTE_RATE_LIMIT = '5/m'
+VOTE_RATE_LIMIT_GROUP = 'polls.views.PollViewSet.vote'
 
-def invalidate_poll_stats_cache(poll_pk):
-    """Clears the cache for a specific poll's stats view."""
-    cache_key = get_poll_stats_cache_key(poll_pk)
-    cache.delete_pattern(f'*{cache_key}*') 
-    logger.info(f"Invalidated cache for poll stats key pattern: *{cache_key}*")
+# Answer to votes for a poll whose votes are being reset (see purges.py)
+VOTING_PAUSED = 'Voting is paused while this poll is being reset.'
 
+# Answer to votes for a poll past its end date
+POLL_CLOSED = 'This poll is closed.'
+
+# Actions that also serve closed polls, from their final results, or delete them
+CLOSED_POLL_ACTIONS = ('retrieve', 'vote', 'stats', 'destroy')
+
+# Window returned by the timeline endpoint when no 'start' is given
+TIMELINE_DEFAULT_SPANS = {
+    VoteRollup.Resolution.MINUTE: timedelta(hours=1),
+    VoteRollup.Resolution.HOUR: timedelta(days=2),
+    VoteRollup.Resolution.DAY: timedelta(days=30),
+}
+
+
+class PollBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This poll is being reset or deleted. Try again once the purge has finished.'
+    default_code = 'poll_busy'
+
+
+def parse_timeline_bound(value, name):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({name: 'Expected an ISO 8601 datetime.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+def parse_fieldset(request, default):
+    '''
+    Reads ?fields= and ?expand= into a readers.Fieldset. Without either the
+    default, full representation is returned. With only ?fields=, relations are
+    nested only when listed, and then fully. Unknown names are rejected before
+    anything is queried.
+    '''
+    # Plain Django requests too, for the async views
+    params = getattr(request, 'query_params', request.GET)
+    fields_param, expand_param = params.get('fields'), params.get('expand')
+    if not fields_param and not expand_param:
+        return default
+
+    relations = {path.split('.')[0] for path in default.expand}
+    fields = set(filter(None, (fields_param or '').split(',')))
+    expand = set(filter(None, (expand_param or '').split(',')))
+    unknown_fields = fields - set(default.fields) - relations
+    if unknown_fields:
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown_fields))}."})
+    unknown_expand = expand - set(default.expand)
+    if unknown_expand:
+        raise ValidationError({'expand': f"Unknown relations: {', '.join(sorted(unknown_expand))}."})
+
+    for relation in fields & relations:
+        if not any(path.split('.')[0] == relation for path in expand):
+            expand |= {path for path in default.expand if path.split('.')[0] == relation}
+    # Expanding a path expands every level above it
+    expand |= {path.rsplit('.', 1)[0] for path in expand if '.' in path}
+
+    return readers.Fieldset(
+        fields=tuple(field for field in default.fields if not fields or field in fields),
+        expand=tuple(path for path in default.expand if path in expand),
+    )
 
 class RegisterView(APIView):
     permission_classes = []  # to allow unauthenticated access for user creation 
@@ -106,19 +171,146 @@ class ChangePasswordView(APIView):
 
 
 class PollViewSet(viewsets.ModelViewSet):
-    queryset = Poll.objects.filter(is_active=True).prefetch_related('questions__choices') 
+    queryset = Poll.objects.select_related('created_by').prefetch_related(
+        Prefetch('questions__choices', queryset=Choice.objects.with_total_votes())
+    )
     serializer_class = PollSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = PollCursorPagination
+
+    def rendered_response(self, content, status=status.HTTP_200_OK):
+        '''
+        Sends pre-rendered JSON as it is. Other renderers, such as the browsable
+        API, get it decoded.
+        '''
+        if self.request.accepted_renderer.format == 'json':
+            return HttpResponse(content, status=status, content_type='application/json')
+        return Response(renderers.loads(content), status=status)
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = parse_fieldset(self.request, readers.POLL_FIELDSET)
+        return self._fieldset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in CLOSED_POLL_ACTIONS:
+            queryset = queryset.visible()
+        else:
+            queryset = queryset.filter(is_active=True)
+        if self.action in ('create', 'update', 'partial_update', 'destroy', 'stats'):
+            # Writes render through readers, which do their own batched reads,
+            # and stats only looks the poll up
+            queryset = queryset.prefetch_related(None)
+        elif self.action in ('list', 'retrieve', 'trending', 'top', 'search') and 'questions' not in self.get_fieldset().expand:
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+    def poll_fragments(self, poll_ids, queryset, poll_generations=None):
+        '''
+        Rendered polls in the order of poll_ids, skipping polls not in queryset.
+        '''
+        rendered = fragments.get_fragments(poll_ids, queryset, poll_generations, self.get_fieldset())
+        return [rendered[poll_id] for poll_id in poll_ids if poll_id in rendered]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Comma separated fields to return'),
+        openapi.Parameter('expand', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Relations to nest: questions, questions.choices'),
+    ])
+    def list(self, request, *args, **kwargs):
+        '''
+        List active polls, newest first, one cursor page at a time. Each page is
+        spliced together from cached, pre-rendered per-poll fragments.
+        Supports ?fields= and ?expand= to trim the payload.
+        '''
+        fieldset = self.get_fieldset()
+        queryset = self.filter_queryset(self.get_queryset())
+        # Page through bare (id, created_at) rows; the polls themselves come from the fragments
+        page = self.paginate_queryset(queryset.prefetch_related(None).values('id', 'created_at'))
+        poll_ids = [row['id'] for row in page]
+        poll_generations = generations.get_generations(poll_ids)
+        next_link, previous_link = self.paginator.get_next_link(), self.paginator.get_previous_link()
+        return conditional.conditional_get(
+            request, 'polls', poll_generations,
+            lambda: self.rendered_response(fragments.page(
+                self.poll_fragments(poll_ids, queryset, poll_generations), next_link, previous_link,
+            )),
+            next_link, previous_link, fieldset.key, dated=False,
+        )
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Comma separated fields to return'),
+        openapi.Parameter('expand', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Relations to nest: questions, questions.choices'),
+    ])
+    def retrieve(self, request, *args, **kwargs):
+        '''
+        Retrieve a poll, sent as its cached pre-rendered fragment. Answers
+        If-None-Match/If-Modified-Since with a 304 from the poll's generation alone.
+        Supports ?fields= and ?expand= to trim the payload.
+        '''
+        fieldset = self.get_fieldset()
+        pk = kwargs['pk']
+        if not str(pk).isdigit():
+            raise Http404('Poll not found')
+        poll_generations = generations.get_generations([pk])
+
+        def build_response():
+            rendered = self.poll_fragments([pk], self.get_queryset(), poll_generations)
+            if not rendered:
+                raise Http404('Poll not found')
+            return self.rendered_response(rendered[0])
+
+        return conditional.conditional_get(request, 'poll', poll_generations, build_response, fieldset.key)
+
+    def create(self, request, *args, **kwargs):
+        '''
+        Create a poll with its questions and choices. The response is the poll's
+        fragment, rendered once for the response and the cache alike.
+        '''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        poll = self.perform_create(serializer)
+        fragment = fragments.get_fragments([poll.pk], self.get_queryset())[poll.pk]
+        return self.rendered_response(fragment, status=status.HTTP_201_CREATED)
 
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        poll = serializer.save(created_by=self.request.user)
+        generations.bump(generations.ALL_POLLS)
+        return poll
+
+    def purge_accepted(self, job):
+        '''
+        202 for a vote reset or deletion left to a background purge, with
+        the job's status and where to follow it.
+        '''
+        location = reverse('purge-detail', kwargs={'pk': job.pk}, request=self.request)
+        return Response(
+            {'message': f'Poll {job.kind} started', 'purge': PollPurgeSerializer(job).data},
+            status=status.HTTP_202_ACCEPTED, headers={'Location': location},
+        )
+
+    def update(self, request, *args, **kwargs):
+        '''
+        Update a poll. A poll with votes is only updated with "reset_votes":
+        true, and then in the background: the response is a 202 with a purge
+        job, and the update is applied once the votes are deleted.
+        '''
+        self.purge = None
+        serializer = self.get_serializer(self.get_object(), data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        fragment = self.perform_update(serializer)
+        if self.purge:
+            return self.purge_accepted(self.purge)
+        return self.rendered_response(fragment)
 
     @transaction.atomic
     def perform_update(self, serializer):
-        poll = self.get_object()
+        poll = serializer.instance
         
         if poll.created_by != self.request.user:
             raise PermissionDenied('You can only update your own polls.')
+        if poll.state != Poll.State.READY:
+            raise PollBusy()
             
         has_votes = Vote.objects.filter(question__poll=poll).exists()
         reset_value = self.request.data.get('reset_votes')
@@ -132,21 +324,45 @@ class PollViewSet(viewsets.ModelViewSet):
                 })
             
             if reset_confirmed:
-                Vote.objects.filter(question__poll=poll).delete()
-                Choice.objects.filter(question__poll=poll).update(votes_count=0)
+                # The votes are deleted in chunks by a background job, which applies the update after them
+                payload = {key: value for key, value in serializer.initial_data.items() if key != 'reset_votes'}
+                self.purge = start_purge(poll, PollPurge.Kind.RESET, self.request.user, payload, serializer.partial)
                 logger.info(f"Votes reset for poll {poll.pk} by user {self.request.user.id}")
-                invalidate_poll_stats_cache(poll.pk)
+                return
 
         serializer.save()
+        # Structure or counts may have changed, rebuild the live tallies on next read
+        transaction.on_commit(lambda: tallies.drop_poll_tallies(poll.pk))
+
+        # Rendered once, for the response and for the new generation's fragment
+        fragment = fragments.render(readers.polls_by_id(self.get_queryset().filter(pk=poll.pk))[poll.pk])
+
+        def refresh():
+            generation = generations.bump(poll.pk, generations.ALL_POLLS).get(poll.pk)
+            if generation is not None:
+                fragments.store(poll.pk, generation, fragment)
+        transaction.on_commit(refresh)
+        return fragment
+
+    def destroy(self, request, *args, **kwargs):
+        '''
+        Delete a poll. The poll disappears at once; its votes, and then the
+        poll itself, are deleted by a background purge job (202).
+        '''
+        with transaction.atomic():
+            instance = self.get_object()
+            job = self.perform_destroy(instance)
+        return self.purge_accepted(job)
 
     def perform_destroy(self, instance):
         if instance.created_by != self.request.user:
             raise PermissionDenied('You can only delete your own polls.')
-        invalidate_poll_stats_cache(instance.pk) 
-        instance.delete()
+        if instance.state != Poll.State.READY:
+            raise PollBusy()
+        return start_purge(instance, PollPurge.Kind.DELETE, self.request.user)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
-    @method_decorator(ratelimit(key='user', rate='5/m', method='POST', block=True))
+    @method_decorator(ratelimit(group=VOTE_RATE_LIMIT_GROUP, key='user', rate=VOTE_RATE_LIMIT, method='POST', block=True))
     @swagger_auto_schema(
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
@@ -160,7 +376,7 @@ class PollViewSet(viewsets.ModelViewSet):
                 type=openapi.TYPE_OBJECT,
                 properties={
                     'message': openapi.Schema(type=openapi.TYPE_STRING),
-                    'task_id': openapi.Schema(type=openapi.TYPE_STRING)
+                    'task_id': openapi.Schema(type=openapi.TYPE_STRING, description='Celery task id, null when the vote was buffered for batch ingestion')
                 }
             )),
             400: 'Bad Request'
@@ -172,6 +388,10 @@ class PollViewSet(viewsets.ModelViewSet):
         Submit a vote for a poll's choice.
         '''
         poll = self.get_object()
+        if poll.state != Poll.State.READY:
+            return Response({'error': VOTING_PAUSED}, status=status.HTTP_409_CONFLICT)
+        if poll.is_closed():
+            return Response({'error': POLL_CLOSED}, status=status.HTTP_400_BAD_REQUEST)
         choice_id = request.data.get('choice_id')
         if not choice_id:
             return Response({'error': 'choice_id is required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -183,17 +403,16 @@ class PollViewSet(viewsets.ModelViewSet):
             if Vote.objects.filter(question=question, user=request.user).exists():
                 return Response({'error': 'User already voted on this question'}, status=status.HTTP_400_BAD_REQUEST)
             
-            task = process_vote.delay(question.id, choice_id, request.user.id)
-            
-            invalidate_poll_stats_cache(poll.pk)
-            
-            return Response({"message": "Vote processing started", 'task_id': task.id}, status=status.HTTP_202_ACCEPTED)
+            task_id = submit_vote(question.id, choice.id, request.user.id)
+            # The vote is written by a worker; keep the voter on the primary regardless
+            routers.stick_to_primary()
+
+            return Response({"message": "Vote processing started", 'task_id': task_id}, status=status.HTTP_202_ACCEPTED)
         except Choice.DoesNotExist:
             return Response({'error': 'Invalid choice'}, status=status.HTTP_400_BAD_REQUEST)
 
 
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticatedOrReadOnly])
-    @method_decorator(cache_page(60 * 1, key_prefix='poll_stats_pk_'))
     @swagger_auto_schema(
         responses={
             200: openapi.Response('Poll statistics', openapi.Schema(
@@ -231,56 +450,305 @@ class PollViewSet(viewsets.ModelViewSet):
     def stats(self, request, pk=None):
         '''
         Retrieve nested vote statistics for a poll, grouped by question.
-        Utilizes the denormalized Choice.votes_count field.
+        Served from the stats document that the vote commit path keeps up to date
+        in Redis; the database is only read on a cold start. Committed votes bump
+        the poll's generation, which also versions the ETag. A closed poll is
+        served its final results, as immutable.
         '''
-        poll = self.get_object()
-        
-        questions_with_choices = Question.objects.filter(poll=poll).prefetch_related('choices')
-        
-        poll_stats = {
-            'total_votes': 0,
-            'questions': []
+        poll_generations, poll_stats = tallies.load_versioned_stats(pk)
+        generation = poll_generations[pk]
+
+        def build_response():
+            if generations.is_closed(generation):
+                closed_stats = results.get_stats(int(pk), generation)
+                if closed_stats is None:
+                    raise Http404('Poll not found')
+                return Response(closed_stats)
+            # Hiding a poll drops its document, so a missing one is looked up
+            if poll_stats is not None:
+                return Response(poll_stats)
+            poll = self.get_object()
+            if poll.closed_at is not None:
+                return Response(results.get_stats(poll.pk, generation))
+            return Response(tallies.get_poll_stats(poll.pk))
+
+        return conditional.conditional_get(request, 'stats', poll_generations, build_response)
+
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticatedOrReadOnly])
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('resolution', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=VoteRollup.Resolution.values, description='Bucket size, defaults to minute'),
+            openapi.Parameter('start', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date-time', description='Inclusive start, defaults to a window ending at "end"'),
+            openapi.Parameter('end', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date-time', description='Exclusive end, defaults to now'),
+        ],
+        responses={
+            200: openapi.Response('Votes per choice over time', openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'resolution': openapi.Schema(type=openapi.TYPE_STRING),
+                    'start': openapi.Schema(type=openapi.TYPE_STRING, format='date-time'),
+                    'end': openapi.Schema(type=openapi.TYPE_STRING, format='date-time'),
+                    'buckets': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'bucket_start': openapi.Schema(type=openapi.TYPE_STRING, format='date-time'),
+                                'choices': openapi.Schema(
+                                    type=openapi.TYPE_ARRAY,
+                                    items=openapi.Schema(
+                                        type=openapi.TYPE_OBJECT,
+                                        properties={
+                                            'choice_id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                            'votes_count': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                        }
+                                    )
+                                )
+                            }
+                        )
+                    )
+                }
+            )),
+            400: 'Bad Request'
         }
-        
-        for question in questions_with_choices:
-            question_votes = 0
-            choices_data = []
-
-            #Calculate question total votes
-            for choice in question.choices.all():
-                question_votes += choice.votes_count
-
-            #Build choice data with percentages
-            for choice in question.choices.all():
-                votes = choice.votes_count
-                percentage = (votes / question_votes * 100) if question_votes > 0 else 0
-                
-                choices_data.append({
-                    'choice_id': choice.id,
-                    'text': choice.text,
-                    'votes_count': votes,
-                    'percentage': round(percentage, 2)
-                })
+    )
+    def timeline(self, request, pk=None):
+        '''
+        Votes per choice per minute, hour or day, answered from the vote rollups
+        with a single range query on (poll, resolution, bucket_start).
+        '''
+        if not str(pk).isdigit():
+            raise Http404('Poll not found')
 
-            poll_stats['questions'].append({
-                'question_id': question.id,
-                'question_text': question.text,
-                'total_question_votes': question_votes,
-                'choices': choices_data
-            })
-            
-            poll_stats['total_votes'] += question_votes
+        resolution = request.query_params.get('resolution', VoteRollup.Resolution.MINUTE)
+        if resolution not in VoteRollup.Resolution.values:
+            raise ValidationError({'resolution': f'Must be one of {", ".join(VoteRollup.Resolution.values)}.'})
+
+        end = request.query_params.get('end')
+        end = parse_timeline_bound(end, 'end') if end else timezone.now()
+        start = request.query_params.get('start')
+        start = parse_timeline_bound(start, 'start') if start else end - TIMELINE_DEFAULT_SPANS[resolution]
+
+        # A poll being reset shows no votes until its rollups are purged
+        rows = VoteRollup.objects.filter(
+            poll_id=pk, poll__state=Poll.State.READY, resolution=resolution, bucket_start__gte=start, bucket_start__lt=end
+        ).order_by('bucket_start', 'choice_id').values_list('bucket_start', 'choice_id', 'count')
+
+        buckets = []
+        for bucket_start, choice_id, count in rows:
+            if not buckets or buckets[-1]['bucket_start'] != bucket_start:
+                buckets.append({'bucket_start': bucket_start, 'choices': []})
+            buckets[-1]['choices'].append({'choice_id': choice_id, 'votes_count': count})
+
+        # Only look the poll up when there is nothing to show
+        if not buckets and not Poll.objects.visible().filter(pk=pk).exists():
+            raise Http404('Poll not found')
+
+        return Response({
+            'resolution': resolution,
+            'start': start,
+            'end': end,
+            'buckets': buckets,
+        })
+
+    def ranked_polls(self, request, key):
+        try:
+            limit = int(request.query_params.get('limit', settings.TRENDING_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        limit = max(1, min(limit, settings.TRENDING_MAX_LIMIT))
+
+        poll_ids = trending.top_poll_ids(key, limit)
+        # Polls closed or deleted since they were scored drop out here
+        return self.rendered_response(fragments.join(self.poll_fragments(poll_ids, self.get_queryset())))
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticatedOrReadOnly])
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Number of polls to return'),
+        ],
+        responses={200: PollSerializer(many=True)}
+    )
+    def trending(self, request):
+        '''
+        Polls ranked by recent voting activity, with each vote's weight halving
+        every TRENDING_HALF_LIFE seconds.
+        '''
+        return self.ranked_polls(request, trending.TRENDING_KEY)
+
+    @action(detail=False, methods=['get'], url_path='trending/top', url_name='trending-top', permission_classes=[IsAuthenticatedOrReadOnly])
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Number of polls to return'),
+        ],
+        responses={200: PollSerializer(many=True)}
+    )
+    def top(self, request):
+        '''
+        Most voted polls of all time.
+        '''
+        return self.ranked_polls(request, trending.TOP_KEY)
 
-        return Response(poll_stats)
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticatedOrReadOnly], pagination_class=SearchPagination)
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description='Words to search for'),
+            openapi.Parameter('offset', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Number of results to skip'),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Results per page'),
+            openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Comma separated fields to return'),
+            openapi.Parameter('expand', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Relations to nest: questions, questions.choices'),
+        ],
+        responses={200: PollSerializer(many=True), 400: 'Bad Request'}
+    )
+    def search(self, request):
+        '''
+        Active polls matching every word of ?q= in their title, description,
+        questions or choices, best match first. Ranked by the database's
+        full-text index (see polls/search.py), then sent as cached fragments.
+        '''
+        query = request.query_params.get('q', '')
+        if not search.has_terms(query):
+            raise ValidationError({'q': 'Enter at least one word to search for.'})
+        poll_ids = self.paginate_queryset(search.SearchResults(query))
+        return self.rendered_response(fragments.page(
+            self.poll_fragments(poll_ids, self.get_queryset()),
+            self.paginator.get_next_link(), self.paginator.get_previous_link(),
+        ))
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated],
+            renderer_classes=[renderers.CSVRenderer, renderers.NDJSONRenderer])
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('format', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['csv', 'ndjson'], description='Defaults to csv'),
+        ],
+        responses={200: 'Votes, one row per vote', 403: 'Forbidden', 404: 'Not Found'}
+    )
+    def export(self, request, pk=None):
+        '''
+        Streams every vote of a poll with its question and choice text, as CSV
+        or NDJSON, gzipped when the client accepts it (see polls/exports.py).
+        Only for the poll's owner and staff; closed polls can be exported too.
+        '''
+        if not str(pk).isdigit():
+            raise Http404('Poll not found')
+        poll = get_object_or_404(Poll.objects.only('id', 'created_by_id'), pk=pk)
+        if poll.created_by_id != request.user.id and not request.user.is_staff:
+            raise PermissionDenied('You can only export your own polls.')
+        return exports.streaming_response(request._request, poll.pk, request.accepted_renderer.format)
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import', permission_classes=[IsAuthenticated])
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_STRING,
+            description='Polls as NDJSON (application/x-ndjson) or CSV (text/csv), see polls/imports.py',
+        ),
+        responses={201: 'Polls created', 400: 'No valid polls', 415: 'Unsupported Media Type'}
+    )
+    def import_polls(self, request):
+        '''
+        Creates the polls in an NDJSON or CSV body, streamed and inserted in
+        chunks (see polls/imports.py). Invalid polls are skipped and reported
+        by line; the others are created by the requesting user.
+        '''
+        file_format = imports.CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        if file_format is None:
+            raise UnsupportedMediaType(request.content_type)
+        lines = codecs.iterdecode(request.stream or [], 'utf-8-sig', errors='replace')
+        result = imports.import_polls(lines, file_format, request.user)
+        failed = result['invalid'] and not result['created']
+        return Response(result, status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_201_CREATED)
+
+class PollPurgeViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    '''
+    Progress of vote resets and poll deletions, for the user who asked for
+    them and for staff.
+    '''
+    queryset = PollPurge.objects.all()
+    serializer_class = PollPurgeSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(requested_by=self.request.user)
+        return queryset
+
+
+def home(request):
+    '''The single page frontend, told whether it can stream live stats.'''
+    return render(request, 'index.html', {
+        'live_stats_stream': settings.LIVE_STATS_STREAM,
+        'stats_poll_interval': settings.LIVE_STATS_POLL_INTERVAL * 1000,
+    })
+
+
+async def poll_stats_stream(request, pk):
+    '''
+    Server-Sent Events stream of a poll's stats: the current document first,
+    then at most one update per LIVE_UPDATE_TICK. Needs an ASGI server, as each
+    open stream is an idle coroutine rather than a blocked worker, so it is
+    only served with LIVE_STATS_STREAM on.
+    '''
+    if not settings.LIVE_STATS_STREAM or not await Poll.objects.filter(pk=pk, is_active=True).aexists():
+        raise Http404('Poll not found')
+    initial_stats = await sync_to_async(tallies.get_poll_stats)(pk)
+
+    response = StreamingHttpResponse(live.stream_events(pk, initial_stats), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 class QuestionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Question.objects.all().prefetch_related('choices')
+    queryset = Question.objects.all().prefetch_related(
+        Prefetch('choices', queryset=Choice.objects.with_total_votes())
+    )
     serializer_class = QuestionSerializer 
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve') and 'choices' not in parse_fieldset(self.request, readers.QUESTION_FIELDSET).expand:
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+    # Reads skip the serializers, see polls/readers.py. Both support ?fields= and ?expand=choices.
+    def list(self, request, *args, **kwargs):
+        fieldset = parse_fieldset(request, readers.QUESTION_FIELDSET)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.prefetch_related(None).values('id'))
+        page_queryset = queryset.filter(id__in=[row['id'] for row in page])
+        return self.get_paginated_response(readers.question_data(page_queryset, fieldset))
+
+    def retrieve(self, request, *args, **kwargs):
+        fieldset = parse_fieldset(request, readers.QUESTION_FIELDSET)
+        if not str(kwargs['pk']).isdigit():
+            raise Http404('Question not found')
+        data = readers.question_data(self.get_queryset().filter(pk=kwargs['pk']), fieldset)
+        if not data:
+            raise Http404('Question not found')
+        return Response(data[0])
 
 
 class ChoiceViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Choice.objects.all()
+    queryset = Choice.objects.with_total_votes()
     serializer_class = ChoiceSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = IdCursorPagination
+
+    # Reads skip the serializers, see polls/readers.py
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.values('id'))
+        return self.get_paginated_response(readers.choice_data(queryset.filter(id__in=[row['id'] for row in page])))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not str(kwargs['pk']).isdigit():
+            raise Http404('Choice not found')
+        data = readers.choice_data(self.get_queryset().filter(pk=kwargs['pk']))
+        if not data:
+            raise Http404('Choice not found')
+        return Response(data[0])
@@ -0,0 +1,123 @@
+"""
+Redis-backed buffer used by the batched vote ingestion mode.
+
+Votes are appended to a pending list. A flush claims up to VOTE_BATCH_SIZE
+entries by moving them onto an in-flight list in one atomic step, and the
+in-flight list is only cleared after the database transaction recording them
+has committed. If a worker dies mid-flush, the next flush picks the in-flight
+entries up again instead of claiming new ones.
+
+Each claim of the in-flight batch is counted. A batch that fails more than
+VOTE_BATCH_MAX_ATTEMPTS times is recorded one vote at a time instead, and the
+votes that still fail are moved to a dead-letter list for inspection, so one
+bad entry cannot hold up every vote behind it.
+"""
+import json
+import time
+from django.conf import settings
+from django_redis import get_redis_connection
+from . import aredis
+
+
+PENDING_KEY = 'polls:vote_buffer:pending'
+INFLIGHT_KEY = 'polls:vote_buffer:inflight'
+ATTEMPTS_KEY = 'polls:vote_buffer:inflight:attempts'
+DEAD_LETTER_KEY = 'polls:vote_buffer:dead_letter'
+FLUSH_LOCK_KEY = 'polls:vote_buffer:flush_lock'
+
+# Returns the in-flight batch with its attempt count, incremented. When there
+# is none, moves up to ARGV[1] entries from the head of the pending list onto
+# the in-flight list. Pushes are chunked to stay below Lua's unpack() limit.
+# KEYS: pending, in-flight, attempts
+CLAIM_SCRIPT = """
+local batch = redis.call('LRANGE', KEYS[2], 0, -1)
+if #batch > 0 then
+    return {redis.call('INCR', KEYS[3]), batch}
+end
+batch = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local n = #batch
+if n > 0 then
+    for i = 1, n, 1000 do
+        redis.call('RPUSH', KEYS[2], unpack(batch, i, math.min(i + 999, n)))
+    end
+    redis.call('LTRIM', KEYS[1], n, -1)
+    redis.call('SET', KEYS[3], 1)
+end
+return {1, batch}
+"""
+
+
+class Batch(list):
+    """Claimed votes, with the number of times they have been claimed."""
+    def __init__(self, entries, attempts):
+        super().__init__(entries)
+        self.attempts = attempts
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def _payload(question_id, choice_id, user_id):
+    return json.dumps({
+        'question_id': int(question_id),
+        'choice_id': int(choice_id),
+        'user_id': int(user_id),
+        'queued_at': time.time(),
+    })
+
+
+def enqueue_vote(question_id, choice_id, user_id, conn=None):
+    """
+    Appends a vote to the pending buffer and returns the new buffer length.
+    """
+    conn = conn or get_connection()
+    return conn.rpush(PENDING_KEY, _payload(question_id, choice_id, user_id))
+
+
+async def aenqueue_vote(question_id, choice_id, user_id, conn=None):
+    """enqueue_vote() on an async Redis client (see aredis.py)."""
+    conn = conn or aredis.get_connection()
+    return await conn.rpush(PENDING_KEY, _payload(question_id, choice_id, user_id))
+
+
+def pending_count(conn=None):
+    conn = conn or get_connection()
+    return conn.llen(PENDING_KEY)
+
+
+def claim_batch(conn=None, size=None):
+    """
+    Returns the next Batch of buffered votes as dicts.
+
+    Entries left on the in-flight list by a failed or crashed flush are
+    returned first, so they are retried before anything new is claimed.
+    """
+    conn = conn or get_connection()
+    size = size or settings.VOTE_BATCH_SIZE
+
+    attempts, raw = conn.eval(CLAIM_SCRIPT, 3, PENDING_KEY, INFLIGHT_KEY, ATTEMPTS_KEY, size)
+    return Batch([json.loads(entry) for entry in raw], attempts)
+
+
+def ack_batch(conn=None):
+    """Drops the in-flight batch once its votes are safely committed."""
+    conn = conn or get_connection()
+    conn.delete(INFLIGHT_KEY, ATTEMPTS_KEY)
+
+
+def dead_letter(entries, conn=None):
+    """Sets aside votes that cannot be recorded, for an operator to look at."""
+    conn = conn or get_connection()
+    conn.rpush(DEAD_LETTER_KEY, *[json.dumps(entry) for entry in entries])
+
+
+def dead_letter_count(conn=None):
+    conn = conn or get_connection()
+    return conn.llen(DEAD_LETTER_KEY)
+
+
+def flush_lock(conn=None):
+    """Lock that keeps a single flush draining the buffer at a time."""
+    conn = conn or get_connection()
+    return conn.lock(FLUSH_LOCK_KEY, timeout=settings.VOTE_FLUSH_LOCK_TIMEOUT)